@@ -30,6 +30,20 @@ version_config_list = [
 ]
 
 
+def has_bf16_cpu() -> bool:
+    # Native bf16 matmuls (Sapphire Rapids AMX, Cooper Lake AVX512-BF16);
+    # elsewhere bf16 is emulated and slower than fp32.
+    try:
+        with open("/proc/cpuinfo", "r") as f:
+            for line in f:
+                if line.startswith("flags"):
+                    flags = line.split(":", 1)[1].split()
+                    return "amx_bf16" in flags or "avx512_bf16" in flags
+    except OSError:
+        pass
+    return False
+
+
 def singleton_variable(func):
     def wrapper(*args, **kwargs):
         if not wrapper.instance:
@@ -46,6 +60,53 @@ class Config:
         self.device = "cuda:0"
         self.is_half = True
         self.use_jit = False
+        self.use_onnx = False
+        # onnxruntime threads; 0 intra-op threads means one per physical core.
+        self.onnx_threads = (0, 1)
+        # int8 CPU inference: None, "dynamic" or "static". Static mode is
+        # calibrated once on the audio files in quantize_calibration.
+        self.quantization = None
+        self.quantize_calibration = []
+        # bf16 autocast on CPU, switched on by device_config for AMX/AVX512-BF16.
+        self.use_bf16 = False
+        # Seed for the synthesizer's noise, so that repeated conversions of an
+        # input give identical audio; None draws fresh noise every time.
+        self.noise_seed = None
+        # Conversions return float32 audio, without int16 peak normalisation,
+        # and vc_multi writes it as float WAVs, so that only the final mix is
+        # quantized.
+        self.output_float = False
+        # Extracted F0 kept in memory, keyed by the audio, and optionally saved
+        # as .npy files in f0_cache_dir to be reused across runs.
+        self.f0_cache_mb = 64
+        self.f0_cache_dir = None
+        # RMVPE runs inputs longer than this in overlapping tiles, so that its
+        # memory does not grow with the input. Off (None) by default: the
+        # stitched F0 can differ from one pass where voicing is marginal.
+        self.rmvpe_tile_seconds = None
+        self.rmvpe_tile_threads = 1
+        # Processes harvest splits long inputs across, at most n_cpu; each
+        # one is spawned and imports torch, so more rarely pay off.
+        self.harvest_workers = 4
+        # High-passed audio and HuBERT features kept in float16, keyed by the
+        # audio, so that converting a file again only runs the index search
+        # and the synthesizer. Off unless a size or a directory is set.
+        self.feature_cache_mb = 0
+        self.feature_cache_dir = None
+        # Segments of an input run through HuBERT this many at a time, in
+        # batches of lengths within hubert_bucket_seconds of each other.
+        self.hubert_batch_size = 1
+        self.hubert_bucket_seconds = 1.0
+        # faiss search of the voice index: lists visited by IVF indices and
+        # candidates kept by HNSW ones (None keeps the index's own), and
+        # OpenMP threads (0 keeps faiss's default).
+        self.index_nprobe = None
+        self.index_ef_search = None
+        self.index_threads = 0
+        # Synthesizers kept loaded by VC for instant voice switching, bounded
+        # by count and by the memory of their weights.
+        self.resident_voices = 4
+        self.resident_voices_mb = 2048
         self.n_cpu = 0
         self.gpu_name = None
         self.json_config = self.load_config_json()
@@ -175,6 +236,9 @@ class Config:
             self.device = self.instead = "cpu"
             self.is_half = False
             self.use_fp32_config()
+            if has_bf16_cpu():
+                logger.info("Found CPU with bf16 support, use bf16 autocast")
+                self.use_bf16 = True
 
         if self.n_cpu == 0:
             self.n_cpu = cpu_count()
@@ -29,6 +29,8 @@ def convert_voice_folder(
     rms_mix_rate=0.25,
     protect=0.33,
     output_format="wav",
+    quantization=None,
+    output_float=False,
 ):
     """
     Convert all audio files in a folder using RVC voice conversion.
@@ -47,6 +49,10 @@ def convert_voice_folder(
         rms_mix_rate: Volume envelope mix ratio (0-1)
         protect: Protect voiceless consonants (0-0.5)
         output_format: Output format ('wav', 'flac', 'mp3', etc.)
+        quantization: int8 CPU inference mode (None, 'dynamic' or 'static');
+            static mode calibrates on the first segments of the input folder
+        output_float: Write 32-bit float WAVs without int16 normalisation,
+            leaving the only quantization to the mix of join_segments
     
     Returns:
         str: Path to the created output folder containing converted audio files
@@ -59,6 +65,12 @@ def convert_voice_folder(
     
     # Initialize config
     config = Config()
+    config.output_float = output_float
+    if quantization:
+        config.quantization = quantization
+        config.quantize_calibration = sorted(
+            str(p) for p in input_folder.iterdir() if p.is_file()
+        )[:8]
     
     # Set environment variables for model paths
     project_root = os.path.dirname(os.path.abspath(__file__))
@@ -183,6 +195,7 @@ if __name__ == "__main__":
         index_rate=0.75,
         protect=0.33,
         output_format="wav",
+        output_float=True,  # join_segments mixes them in float
     )
     
     print(f"\n✓ Conversion complete!")
@@ -2,10 +2,13 @@ import platform, os
 import ffmpeg
 import numpy as np
 import av
+import soundfile as sf
 from io import BytesIO
 import traceback
 import re
 
+from infer.lib.resample import resample
+
 
 def wav2(i, o, format):
     inp = av.open(i, "rb")
@@ -40,6 +43,14 @@ def load_audio(file, sr):
             raise RuntimeError(
                 "You input a wrong audio path that does not exists, please fix it!"
             )
+        # Formats libsndfile reads are decoded in-process and resampled with
+        # the shared resampler, without starting ffmpeg.
+        try:
+            audio, file_sr = sf.read(file, dtype="float32", always_2d=True)
+        except RuntimeError:  # not a format libsndfile reads
+            pass
+        else:
+            return resample(audio.mean(axis=1), file_sr, sr)
         out, _ = (
             ffmpeg.input(file, threads=0)
             .output("-", format="f32le", acodec="pcm_f32le", ac=1, ar=sr)
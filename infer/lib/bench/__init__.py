@@ -0,0 +1,173 @@
+import argparse
+import json
+import os
+import resource
+import statistics
+import time
+
+import torch
+from torch.profiler import ProfilerActivity, profile
+
+# Synthesizer frames are produced at 16000 / 160 frames per second,
+# independently of the model's output sample rate.
+FRAMES_PER_SECOND = 100
+
+synthesizer_configs = {
+    "v1": ["32k", "40k", "48k"],
+    "v2": ["32k", "48k"],
+}
+
+
+def load_synthesizer_config(version: str, sr: str, config_root: str = "configs"):
+    """Build the ``cpt["config"]`` list of an RVC checkpoint from a training JSON."""
+    with open(os.path.join(config_root, version, "%s.json" % sr), "r") as f:
+        hps = json.load(f)
+    data, model = hps["data"], hps["model"]
+    return [
+        data["filter_length"] // 2 + 1,
+        32,
+        model["inter_channels"],
+        model["hidden_channels"],
+        model["filter_channels"],
+        model["n_heads"],
+        model["n_layers"],
+        model["kernel_size"],
+        model["p_dropout"],
+        model["resblock"],
+        model["resblock_kernel_sizes"],
+        model["resblock_dilation_sizes"],
+        model["upsample_rates"],
+        model["upsample_initial_channel"],
+        model["upsample_kernel_sizes"],
+        model["spk_embed_dim"],
+        model["gin_channels"],
+        data["sampling_rate"],
+    ]
+
+
+def build_synthesizer(version: str, sr: str, if_f0=1, config_root: str = "configs"):
+    """Instantiate a randomly initialised synthesizer ready for ``infer``."""
+    from infer.lib.infer_pack.models import (
+        SynthesizerTrnMs256NSFsid,
+        SynthesizerTrnMs256NSFsid_nono,
+        SynthesizerTrnMs768NSFsid,
+        SynthesizerTrnMs768NSFsid_nono,
+    )
+
+    synthesizer_class = {
+        ("v1", 1): SynthesizerTrnMs256NSFsid,
+        ("v1", 0): SynthesizerTrnMs256NSFsid_nono,
+        ("v2", 1): SynthesizerTrnMs768NSFsid,
+        ("v2", 0): SynthesizerTrnMs768NSFsid_nono,
+    }
+    config = load_synthesizer_config(version, sr, config_root)
+    net_g = synthesizer_class[(version, if_f0)](*config, is_half=False)
+    del net_g.enc_q
+    return net_g.eval(), config
+
+
+def synthesizer_inputs(
+    version: str, n_frames: int, batch_size=1, if_f0=1, dtype=torch.float32
+):
+    """Random ``infer`` arguments shaped like the ones built by ``Pipeline.vc``."""
+    phone = torch.randn(batch_size, n_frames, 256 if version == "v1" else 768)
+    phone_lengths = torch.full((batch_size,), n_frames, dtype=torch.long)
+    sid = torch.zeros(batch_size, dtype=torch.long)
+    if not if_f0:
+        return phone.to(dtype), phone_lengths, sid
+    pitch = torch.randint(1, 256, (batch_size, n_frames), dtype=torch.long)
+    pitchf = torch.rand(batch_size, n_frames) * 300 + 80
+    return phone.to(dtype), phone_lengths, pitch, pitchf.to(dtype), sid
+
+
+def reset_peak_rss():
+    # Writing "5" to clear_refs resets VmHWM (Linux only), so that each
+    # measurement reports the peak of its own run rather than of the process.
+    try:
+        with open("/proc/self/clear_refs", "w") as f:
+            f.write("5")
+        return True
+    except OSError:
+        return False
+
+
+def peak_rss_mb():
+    try:
+        with open("/proc/self/status", "r") as f:
+            for line in f:
+                if line.startswith("VmHWM:"):
+                    return int(line.split()[1]) / 1024
+    except OSError:
+        pass
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+
+
+def measure(fn, repeat=5, warmup=1):
+    """Run ``fn`` and return (median seconds, all timings, peak RSS in MB)."""
+    with torch.no_grad():
+        for _ in range(warmup):
+            fn()
+        reset_peak_rss()
+        timings = []
+        for _ in range(repeat):
+            t0 = time.perf_counter()
+            fn()
+            timings.append(time.perf_counter() - t0)
+    return statistics.median(timings), timings, peak_rss_mb()
+
+
+def allocated_mb(fn):
+    """Memory allocated by one call of ``fn``, from the PyTorch profiler."""
+    with torch.no_grad(), profile(
+        activities=[ProfilerActivity.CPU], profile_memory=True
+    ) as prof:
+        fn()
+    return sum(max(e.self_cpu_memory_usage, 0) for e in prof.events()) / 1024 / 1024
+
+
+def timing(latency, baseline):
+    """The ``latency_ms`` and ``speedup`` cells of a row timed against the
+    latency of the first case, ``baseline`` (None for the first case)."""
+    baseline = baseline or latency
+    return {
+        "latency_ms": "%.1f" % (latency * 1000),
+        "speedup": "%.2fx" % (baseline / latency),
+    }
+
+
+def snr_db(reference, output):
+    """Signal-to-noise ratio in dB of ``output`` against ``reference``."""
+    noise = (reference - output).pow(2).sum()
+    return 10 * torch.log10(reference.pow(2).sum() / noise).item()
+
+
+def format_table(rows, columns):
+    widths = [
+        max(len(str(c)), *(len(str(row[c])) for row in rows)) if rows else len(c)
+        for c in columns
+    ]
+    lines = ["  ".join(str(c).rjust(w) for c, w in zip(columns, widths))]
+    for row in rows:
+        lines.append("  ".join(str(row[c]).rjust(w) for c, w in zip(columns, widths)))
+    return "\n".join(lines)
+
+
+def argument_parser(doc, repeat=5, warmup=1, threads=True):
+    """Command line of a bench module: the first line of ``doc`` as its
+    description, ``--repeat`` and ``--warmup`` for ``measure`` and, unless
+    ``threads`` is False, ``--threads`` for ``parse_args`` to apply."""
+    parser = argparse.ArgumentParser(description=doc.split("\n")[0])
+    if threads:
+        parser.add_argument("--threads", type=int, default=None)
+    parser.set_defaults(set_threads=threads)
+    parser.add_argument("--repeat", type=int, default=repeat)
+    parser.add_argument("--warmup", type=int, default=warmup)
+    return parser
+
+
+def parse_args(parser):
+    """Parse the command line and set torch's intra-op threads from it."""
+    args = parser.parse_args()
+    if args.set_threads and args.threads:
+        torch.set_num_threads(args.threads)
+    return args
@@ -0,0 +1,102 @@
+"""Banded vs full-matrix relative attention of the synthesizer's text encoder.
+
+``reference`` is the original VITS computation, which builds the relative
+logits and weights against all ``2*l-1`` offsets and maps them onto the
+``[l, l]`` scores by padding and reshaping; ``banded`` is what
+``MultiHeadAttention.attention`` runs now, computing only the ``2*w+1``
+offsets inside the window. Both run on the same random layer, and
+``max_abs_diff`` is the largest difference between their outputs:
+
+    python -m infer.lib.bench.attention --seconds 30 60
+"""
+
+import math
+
+import torch
+from torch.nn import functional as F
+
+from infer.lib.bench import (
+    FRAMES_PER_SECOND,
+    argument_parser,
+    format_table,
+    measure,
+    parse_args,
+    timing,
+)
+from infer.lib.infer_pack.attentions import MultiHeadAttention
+
+columns = ["mode", "seconds", "latency_ms", "speedup", "peak_rss_mb", "max_abs_diff"]
+
+
+def reference_attention(attn, query, key, value, mask):
+    """``MultiHeadAttention.attention`` as it was before the banded kernel."""
+    b, d, t_s = key.size()
+    t_t = query.size(2)
+    query = query.view(b, attn.n_heads, attn.k_channels, t_t).transpose(2, 3)
+    key = key.view(b, attn.n_heads, attn.k_channels, t_s).transpose(2, 3)
+    value = value.view(b, attn.n_heads, attn.k_channels, t_s).transpose(2, 3)
+
+    scores = torch.matmul(query / math.sqrt(attn.k_channels), key.transpose(-2, -1))
+    key_relative_embeddings = attn._get_relative_embeddings(attn.emb_rel_k, t_s)
+    rel_logits = attn._matmul_with_relative_keys(
+        query / math.sqrt(attn.k_channels), key_relative_embeddings
+    )
+    scores = scores + attn._relative_position_to_absolute_position(rel_logits)
+    scores = scores.masked_fill(mask == 0, -1e4)
+    p_attn = F.softmax(scores, dim=-1)
+    output = torch.matmul(p_attn, value)
+    relative_weights = attn._absolute_position_to_relative_position(p_attn)
+    value_relative_embeddings = attn._get_relative_embeddings(attn.emb_rel_v, t_s)
+    output = output + attn._matmul_with_relative_values(
+        relative_weights, value_relative_embeddings
+    )
+    return output.transpose(2, 3).contiguous().view(b, d, t_t)
+
+
+def run(seconds=(30, 60), hidden_channels=192, n_heads=2, repeat=3, warmup=1):
+    # Same layer shape as the TextEncoder of every RVC synthesizer.
+    attn = MultiHeadAttention(hidden_channels, hidden_channels, n_heads, window_size=10)
+    attn.eval()
+    rows = []
+    for duration in seconds:
+        length = int(duration * FRAMES_PER_SECOND)
+        q, k, v = (torch.randn(1, hidden_channels, length) for _ in range(3))
+        x_mask = torch.ones(1, 1, length)
+        mask = x_mask.unsqueeze(2) * x_mask.unsqueeze(-1)
+        with torch.no_grad():
+            expected = reference_attention(attn, q, k, v, mask)
+            actual, _ = attn.attention(q, k, v, mask=mask)
+        baseline = None
+        for mode, fn in [
+            ("reference", lambda: reference_attention(attn, q, k, v, mask)),
+            ("banded", lambda: attn.attention(q, k, v, mask=mask)),
+        ]:
+            latency, _, peak_rss = measure(fn, repeat, warmup)
+            baseline = baseline or latency
+            rows.append(
+                {
+                    "mode": mode,
+                    "seconds": duration,
+                    **timing(latency, baseline),
+                    "peak_rss_mb": "%.0f" % peak_rss,
+                    "max_abs_diff": (
+                        "-"
+                        if mode == "reference"
+                        else "%.2e" % (expected - actual).abs().max().item()
+                    ),
+                }
+            )
+    return rows
+
+
+def main():
+    parser = argument_parser(__doc__, repeat=3)
+    parser.add_argument("--seconds", nargs="+", type=float, default=[30, 60])
+    args = parse_args(parser)
+    print(
+        format_table(run(args.seconds, repeat=args.repeat, warmup=args.warmup), columns)
+    )
+
+
+if __name__ == "__main__":
+    main()
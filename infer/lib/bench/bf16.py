@@ -0,0 +1,120 @@
+"""Accuracy and latency of bf16 CPU autocast against fp32.
+
+Runs the synthesizer and RMVPE's E2E model (random weights) in fp32 and
+under ``torch.autocast("cpu", torch.bfloat16)`` as ``Pipeline`` does when
+``config.use_bf16`` is set, and reports the SNR of the bf16 output against
+fp32. Pass ``--hubert`` to include HuBERT feature extraction:
+
+    python -m infer.lib.bench.bf16 --version v2 --sr 48k --seconds 1 5
+"""
+
+import numpy as np
+import torch
+
+from configs.config import has_bf16_cpu
+from infer.lib.bench import (
+    FRAMES_PER_SECOND,
+    argument_parser,
+    build_synthesizer,
+    format_table,
+    measure,
+    parse_args,
+    snr_db,
+    synthesizer_inputs,
+    timing,
+)
+
+columns = ["model", "dtype", "seconds", "latency_ms", "speedup", "snr_db"]
+
+
+def compare(model, duration, fn, repeat, warmup):
+    """Time ``fn`` in fp32 and under bf16 autocast, and compare the outputs."""
+    rows, outputs, latencies = [], {}, {}
+    for dtype in ["fp32", "bf16"]:
+        enabled = dtype == "bf16"
+
+        def run():
+            with torch.autocast("cpu", torch.bfloat16, enabled=enabled):
+                return fn().float()
+
+        latencies[dtype], _, _ = measure(run, repeat, warmup)
+        with torch.no_grad():
+            outputs[dtype] = run()
+        rows.append(
+            {
+                "model": model,
+                "dtype": dtype,
+                "seconds": duration,
+                **timing(latencies[dtype], latencies["fp32"]),
+                "snr_db": (
+                    "%.1f" % snr_db(outputs["fp32"], outputs[dtype]) if enabled else "-"
+                ),
+            }
+        )
+    return rows
+
+
+def run(version="v2", sr="48k", if_f0=1, seconds=(1, 5), repeat=5, warmup=1):
+    from infer.lib.rmvpe import E2E
+
+    net_g, _ = build_synthesizer(version, sr, if_f0)
+    rmvpe = E2E(4, 1, (2, 2)).eval()
+    rows = []
+    for duration in seconds:
+        n_frames = int(duration * FRAMES_PER_SECOND)
+        args = synthesizer_inputs(version, n_frames, 1, if_f0)
+
+        def synthesize():
+            # Same noise in both runs, so the SNR only measures bf16 error.
+            torch.manual_seed(0)
+            return net_g.infer(*args)[0]
+
+        rows += compare("%s/%s" % (version, sr), duration, synthesize, repeat, warmup)
+        mel = torch.randn(1, 128, (n_frames - 1) // 32 * 32 + 32)
+        rows += compare("rmvpe", duration, lambda: rmvpe(mel), repeat, warmup)
+    return rows
+
+
+def run_hubert(hubert_path, seconds=(1, 5), repeat=5, warmup=1):
+    from fairseq import checkpoint_utils
+
+    models, _, _ = checkpoint_utils.load_model_ensemble_and_task(
+        [hubert_path], suffix=""
+    )
+    hubert_model = models[0].float().eval()
+    rows = []
+    for duration in seconds:
+        feats = torch.from_numpy(
+            np.random.randn(int(duration * 16000)).astype(np.float32) * 0.1
+        ).view(1, -1)
+        padding_mask = torch.zeros(feats.shape, dtype=torch.bool)
+        rows += compare(
+            "hubert",
+            duration,
+            lambda: hubert_model.extract_features(
+                source=feats, padding_mask=padding_mask, output_layer=12
+            )[0],
+            repeat,
+            warmup,
+        )
+    return rows
+
+
+def main():
+    parser = argument_parser(__doc__)
+    parser.add_argument("--version", default="v2", choices=["v1", "v2"])
+    parser.add_argument("--sr", default="48k")
+    parser.add_argument("--f0", type=int, default=1)
+    parser.add_argument("--seconds", nargs="+", type=float, default=[1, 5])
+    parser.add_argument("--hubert", default=None, help="HuBERT checkpoint")
+    args = parse_args(parser)
+    if not has_bf16_cpu():
+        print("No AMX/AVX512-BF16 on this CPU, bf16 is emulated and slow.")
+    rows = run(args.version, args.sr, args.f0, args.seconds, args.repeat, args.warmup)
+    if args.hubert:
+        rows += run_hubert(args.hubert, args.seconds, args.repeat, args.warmup)
+    print(format_table(rows, columns))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,78 @@
+"""Latency and allocations of the NSF excitation (SourceModuleHnNSF).
+
+``allocating`` is the original computation, which allocates every
+intermediate at the full output length on each call; ``buffered`` is the
+eager inference path that reuses the SineGen workspace. ``alloc_mb`` is the
+memory allocated by one call after warmup, from the PyTorch profiler, and
+``max_abs_diff`` compares the two outputs for the same random state:
+
+    python -m infer.lib.bench.excitation --sr 48000 --seconds 1 5 10
+"""
+
+import torch
+
+from infer.lib.bench import (
+    FRAMES_PER_SECOND,
+    allocated_mb,
+    argument_parser,
+    format_table,
+    measure,
+    parse_args,
+    timing,
+)
+from infer.lib.infer_pack.models import SourceModuleHnNSF
+
+columns = ["mode", "seconds", "latency_ms", "speedup", "alloc_mb", "max_abs_diff"]
+
+
+def run(sr=48000, seconds=(1, 5, 10), repeat=5, warmup=1):
+    upp = sr // FRAMES_PER_SECOND
+    buffered = SourceModuleHnNSF(sr, harmonic_num=0, is_half=False).eval()
+    allocating = SourceModuleHnNSF(sr, harmonic_num=0, is_half=False).eval()
+    allocating.load_state_dict(buffered.state_dict())
+    # SineGen only reuses its workspace in eval mode.
+    allocating.l_sin_gen.train()
+    rows = []
+    for duration in seconds:
+        f0 = torch.rand(1, int(duration * FRAMES_PER_SECOND)) * 300 + 80
+        f0[:, ::7] = 0  # some unvoiced frames
+        outputs = {}
+        baseline = None
+        for mode, model in [("allocating", allocating), ("buffered", buffered)]:
+
+            def fn():
+                torch.manual_seed(0)
+                return model(f0, upp)[0]
+
+            latency, _, _ = measure(fn, repeat, warmup)
+            baseline = baseline or latency
+            with torch.no_grad():
+                outputs[mode] = fn().clone()
+            rows.append(
+                {
+                    "mode": mode,
+                    "seconds": duration,
+                    **timing(latency, baseline),
+                    "alloc_mb": "%.1f" % allocated_mb(fn),
+                    "max_abs_diff": (
+                        "-"
+                        if mode == "allocating"
+                        else "%.2e"
+                        % (outputs["allocating"] - outputs[mode]).abs().max().item()
+                    ),
+                }
+            )
+    return rows
+
+
+def main():
+    parser = argument_parser(__doc__)
+    parser.add_argument("--sr", type=int, default=48000)
+    parser.add_argument("--seconds", nargs="+", type=float, default=[1, 5, 10])
+    args = parse_args(parser)
+    rows = run(args.sr, args.seconds, args.repeat, args.warmup)
+    print(format_table(rows, columns))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,115 @@
+"""HuBERT feature extraction of many chunks by batch size.
+
+Runs ``HubertService.extract`` on chunks of random lengths, as the segments
+of several inputs would be, with a randomly initialised hubert_base. Batch
+size 1 is what ``Pipeline.vc`` did for every chunk. ``audio_s_per_s`` is
+seconds of audio processed per second, and ``max_abs_diff`` compares the
+features with those of batch size 1; it is not zero because the first conv
+layer normalises over the padding too:
+
+    python -m infer.lib.bench.hubert --chunks 16 --seconds 2 6 --batch-sizes 1 4 8
+"""
+
+import numpy as np
+import torch
+
+from infer.lib.bench import argument_parser, format_table, measure, parse_args, timing
+from infer.lib.hubert import HubertService
+
+columns = [
+    "version",
+    "batch_size",
+    "chunks",
+    "latency_ms",
+    "chunks_per_s",
+    "audio_s_per_s",
+    "speedup",
+    "max_abs_diff",
+]
+
+
+def build_hubert(seed=0):
+    """A randomly initialised model shaped like assets/hubert/hubert_base.pt."""
+    from fairseq.data import Dictionary
+    from fairseq.models.hubert.hubert import HubertConfig, HubertModel
+    from fairseq.tasks.hubert_pretraining import HubertPretrainingConfig
+
+    torch.manual_seed(seed)
+    dictionary = Dictionary()
+    for i in range(500):
+        dictionary.add_symbol(str(i))
+    task_cfg = HubertPretrainingConfig(labels=["km"])
+    return HubertModel(HubertConfig(final_dim=256), task_cfg, [dictionary]).eval()
+
+
+def run(
+    chunks=16,
+    seconds=(2, 6),
+    batch_sizes=(1, 4, 8),
+    bucket_seconds=1.0,
+    version="v2",
+    repeat=3,
+    warmup=1,
+):
+    model = build_hubert()
+    rng = np.random.default_rng(0)
+    lengths = rng.integers(int(seconds[0] * 16000), int(seconds[-1] * 16000), chunks)
+    audios = [rng.standard_normal(n).astype(np.float32) * 0.1 for n in lengths]
+    total = sum(lengths) / 16000
+    rows = []
+    baseline = expected = None
+    for batch_size in batch_sizes:
+        service = HubertService(
+            "cpu", batch_size=batch_size, bucket_seconds=bucket_seconds
+        )
+
+        def fn():
+            return service.extract(model, audios, version)
+
+        latency, _, _ = measure(fn, repeat, warmup)
+        feats = fn()
+        baseline = baseline or latency
+        expected = expected or feats
+        rows.append(
+            {
+                "version": version,
+                "batch_size": batch_size,
+                "chunks": chunks,
+                **timing(latency, baseline),
+                "chunks_per_s": "%.1f" % (chunks / latency),
+                "audio_s_per_s": "%.1f" % (total / latency),
+                "max_abs_diff": "%.2e"
+                % max((a - b).abs().max().item() for a, b in zip(expected, feats)),
+            }
+        )
+    return rows
+
+
+def main():
+    parser = argument_parser(__doc__, repeat=3)
+    parser.add_argument("--chunks", type=int, default=16)
+    parser.add_argument(
+        "--seconds",
+        nargs=2,
+        type=float,
+        default=[2, 6],
+        help="shortest and longest chunk",
+    )
+    parser.add_argument("--batch-sizes", nargs="+", type=int, default=[1, 4, 8])
+    parser.add_argument("--bucket-seconds", type=float, default=1.0)
+    parser.add_argument("--version", choices=["v1", "v2"], default="v2")
+    args = parse_args(parser)
+    rows = run(
+        args.chunks,
+        args.seconds,
+        args.batch_sizes,
+        args.bucket_seconds,
+        args.version,
+        args.repeat,
+        args.warmup,
+    )
+    print(format_table(rows, columns))
+
+
+if __name__ == "__main__":
+    main()
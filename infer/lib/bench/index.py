@@ -0,0 +1,173 @@
+"""Recall vs latency of the voice index types, and of the weighted gather.
+
+Each index type of ``infer.lib.retrieval`` is built on the features of a
+voice and searched for ``--queries`` frames: training frames with noise
+added, as HuBERT frames of new speech would be. ``recall`` is the fraction
+of the exact 8 nearest neighbours found, ``blend_err`` the relative error of
+the blended feature against the exact blend, and ``latency_ms`` covers the
+search and the blend. The features come from a voice's ``.index`` file
+(``--index``), a ``[n, dim]`` ``.npy`` (``--features``), or random clusters
+if neither is given:
+
+    python -m infer.lib.bench.index --index assets/indices/voice.index --nprobe 1 4 16
+
+The second table compares the blend of ``Pipeline.vc`` before (``fancy``,
+which builds the ``[frames, 8, dim]`` neighbours) and after (``embedding_bag``).
+"""
+
+import time
+
+import faiss
+import numpy as np
+import torch
+
+from infer.lib import retrieval
+from infer.lib.bench import argument_parser, format_table, measure, parse_args, timing
+
+columns = ["index", "search", "build_s", "size_mb", "latency_ms", "recall", "blend_err"]
+gather_columns = ["mode", "frames", "latency_ms", "speedup", "max_abs_diff"]
+
+
+def load_features(index_path=None, features_path=None, n=20000, dim=768):
+    if index_path:
+        index = faiss.read_index(index_path)
+        return index.reconstruct_n(0, index.ntotal)
+    if features_path:
+        return np.load(features_path).astype(np.float32)
+    rng = np.random.default_rng(0)
+    centers = rng.standard_normal((256, dim)).astype(np.float32) * 2
+    labels = rng.integers(0, len(centers), n)
+    return centers[labels] + rng.standard_normal((n, dim)).astype(np.float32)
+
+
+def fancy_blend(big_npy, score, ix):
+    """The blend of ``Pipeline.vc`` as it was before ``retrieval.retrieve``."""
+    weight = np.square(1 / score)
+    weight /= weight.sum(axis=1, keepdims=True)
+    return np.sum(big_npy[ix] * np.expand_dims(weight, axis=2), axis=1)
+
+
+def run(
+    big_npy,
+    queries=2000,
+    types=retrieval.index_types,
+    nprobe=(1, 4, 16),
+    ef_search=(16, 64),
+    repeat=3,
+    warmup=1,
+):
+    rng = np.random.default_rng(1)
+    npy = big_npy[rng.integers(0, len(big_npy), queries)]
+    npy = npy + rng.standard_normal(npy.shape).astype(np.float32) * npy.std() * 0.3
+    exact = retrieval.build_index(big_npy, "flat")
+    _, expected_ix = exact.search(npy, 8)
+    expected = retrieval.retrieve(exact, big_npy, npy).numpy()
+    rows = []
+    for kind in types:
+        t0 = time.perf_counter()
+        index = retrieval.build_index(big_npy, kind)
+        build = time.perf_counter() - t0
+        size = len(faiss.serialize_index(index)) / 1024 / 1024
+        if kind.startswith("ivf"):
+            settings = [("nprobe=%d" % p, {"nprobe": p}) for p in nprobe]
+        elif kind == "hnsw":
+            settings = [("efSearch=%d" % e, {"ef_search": e}) for e in ef_search]
+        else:
+            settings = [("exact", {})]
+        for search, params in settings:
+            retrieval.set_search_params(index, **params)
+            latency, _, _ = measure(
+                lambda: retrieval.retrieve(index, big_npy, npy), repeat, warmup
+            )
+            _, ix = index.search(npy, 8)
+            found = [len(set(a) & set(b)) for a, b in zip(ix, expected_ix)]
+            blend = retrieval.retrieve(index, big_npy, npy).numpy()
+            rows.append(
+                {
+                    "index": kind,
+                    "search": search,
+                    "build_s": "%.1f" % build,
+                    "size_mb": "%.1f" % size,
+                    "latency_ms": "%.1f" % (latency * 1000),
+                    "recall": "%.3f" % (sum(found) / expected_ix.size),
+                    "blend_err": "%.2e"
+                    % (np.linalg.norm(blend - expected) / np.linalg.norm(expected)),
+                }
+            )
+    return rows
+
+
+def run_gather(big_npy, frames=(1000, 3000), repeat=5, warmup=1):
+    index = retrieval.build_index(big_npy, "flat")
+    rng = np.random.default_rng(2)
+    rows = []
+    for n in frames:
+        npy = big_npy[rng.integers(0, len(big_npy), n)] + 0.1
+        score, ix = index.search(npy, 8)
+        weight = np.square(1 / score)
+        weight = (weight / weight.sum(axis=1, keepdims=True)).astype(np.float32)
+        big = torch.from_numpy(big_npy)
+        expected = fancy_blend(big_npy, score, ix)
+        baseline = None
+        for mode, fn in [
+            ("fancy", lambda: fancy_blend(big_npy, score, ix)),
+            (
+                "embedding_bag",
+                lambda: torch.nn.functional.embedding_bag(
+                    torch.from_numpy(ix),
+                    big,
+                    per_sample_weights=torch.from_numpy(weight),
+                    mode="sum",
+                ).numpy(),
+            ),
+        ]:
+            latency, _, _ = measure(fn, repeat, warmup)
+            baseline = baseline or latency
+            rows.append(
+                {
+                    "mode": mode,
+                    "frames": n,
+                    **timing(latency, baseline),
+                    "max_abs_diff": (
+                        "-"
+                        if mode == "fancy"
+                        else "%.2e" % np.abs(fn() - expected).max()
+                    ),
+                }
+            )
+    return rows
+
+
+def main():
+    parser = argument_parser(__doc__, repeat=3)
+    parser.add_argument("--index", default=None, help="a voice's .index file")
+    parser.add_argument("--features", default=None, help="a [n, dim] .npy file")
+    parser.add_argument("--queries", type=int, default=2000)
+    parser.add_argument(
+        "--types",
+        nargs="+",
+        choices=retrieval.index_types,
+        default=retrieval.index_types,
+    )
+    parser.add_argument("--nprobe", nargs="+", type=int, default=[1, 4, 16])
+    parser.add_argument("--ef-search", nargs="+", type=int, default=[16, 64])
+    args = parse_args(parser)
+    if args.threads:
+        retrieval.set_threads(args.threads)
+    big_npy = load_features(args.index, args.features)
+    rows = run(
+        big_npy,
+        args.queries,
+        args.types,
+        args.nprobe,
+        args.ef_search,
+        args.repeat,
+        args.warmup,
+    )
+    print(format_table(rows, columns))
+    print()
+    print(format_table(run_gather(big_npy), gather_columns))
+
+
+if __name__ == "__main__":
+    main()
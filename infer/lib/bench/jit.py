@@ -0,0 +1,88 @@
+"""Eager vs TorchScript (script and trace) latency of the synthesizer.
+
+The ``eager`` model keeps its weight norm hooks, ``prepared`` is the model
+``VC.get_eager_vc`` runs after ``prepare_for_inference``; the scripted and
+traced models are exported through ``infer.lib.jit``.
+
+    python -m infer.lib.bench.jit --version v2 --sr 48k --seconds 1 5
+"""
+
+from io import BytesIO
+
+import torch
+
+from infer.lib import jit
+from infer.lib.bench import (
+    FRAMES_PER_SECOND,
+    argument_parser,
+    build_synthesizer,
+    format_table,
+    measure,
+    parse_args,
+    timing,
+)
+from infer.lib.jit.get_synthesizer import SynthesizerInfer, get_synthesizer_inputs
+
+columns = ["model", "mode", "seconds", "latency_ms", "rtf", "speedup"]
+
+
+def run(version="v2", sr="48k", if_f0=1, seconds=(1, 5), repeat=5, warmup=2):
+    net_g, _ = build_synthesizer(version, sr, if_f0)
+    cpt = {"version": version, "f0": if_f0}
+
+    # Weight norm parameters cannot be deep-copied, so clone by state dict.
+    prepared, _ = build_synthesizer(version, sr, if_f0)
+    prepared.load_state_dict(net_g.state_dict())
+    prepared.prepare_for_inference()
+
+    scripted, _ = build_synthesizer(version, sr, if_f0)
+    scripted.load_state_dict(net_g.state_dict())
+    scripted.forward = scripted.infer
+    scripted = torch.jit.load(BytesIO(jit.export(scripted, "script")["model"]))
+
+    traced, _ = build_synthesizer(version, sr, if_f0)
+    traced.load_state_dict(net_g.state_dict())
+    traced.remove_weight_norm()
+    inputs = get_synthesizer_inputs(cpt, int(seconds[0] * FRAMES_PER_SECOND))
+    traced = torch.jit.load(
+        BytesIO(jit.export(SynthesizerInfer(traced), "trace", inputs)["model"])
+    )
+
+    rows = []
+    for duration in seconds:
+        inputs = get_synthesizer_inputs(cpt, int(duration * FRAMES_PER_SECOND))
+        args = tuple(inputs.values())
+        baseline = None
+        for mode, fn in [
+            ("eager", lambda: net_g.infer(*args)),
+            ("prepared", lambda: prepared.infer(*args)),
+            ("script", lambda: scripted.infer(*args)),
+            ("trace", lambda: traced(*args)),
+        ]:
+            latency, _, _ = measure(fn, repeat, warmup)
+            baseline = baseline or latency
+            rows.append(
+                {
+                    "model": "%s/%s" % (version, sr),
+                    "mode": mode,
+                    "seconds": duration,
+                    **timing(latency, baseline),
+                    "rtf": "%.3f" % (latency / duration),
+                }
+            )
+    return rows
+
+
+def main():
+    parser = argument_parser(__doc__, warmup=2)
+    parser.add_argument("--version", default="v2", choices=["v1", "v2"])
+    parser.add_argument("--sr", default="48k")
+    parser.add_argument("--f0", type=int, default=1)
+    parser.add_argument("--seconds", nargs="+", type=float, default=[1, 5])
+    args = parse_args(parser)
+    rows = run(args.version, args.sr, args.f0, args.seconds, args.repeat, args.warmup)
+    print(format_table(rows, columns))
+
+
+if __name__ == "__main__":
+    main()
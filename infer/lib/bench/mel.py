@@ -0,0 +1,82 @@
+"""Latency and allocations of the RMVPE mel spectrogram front end.
+
+``reference`` is the original computation, with the magnitude as
+``sqrt(real**2 + imag**2)`` on fresh tensors. ``in_place`` is
+``MelSpectrogram.forward``, which computes it in place in one tensor. Both
+multiply with the whole ``[128, 513]`` filterbank. ``alloc_mb`` is the
+memory allocated by one call after warmup, and ``max_abs_diff`` compares the
+log mels:
+
+    python -m infer.lib.bench.mel --seconds 1 10 30
+"""
+
+import torch
+
+from infer.lib.bench import (
+    allocated_mb,
+    argument_parser,
+    format_table,
+    measure,
+    parse_args,
+    timing,
+)
+from infer.lib.rmvpe import MelSpectrogram
+
+columns = ["mode", "seconds", "latency_ms", "speedup", "alloc_mb", "max_abs_diff"]
+
+
+def reference_mel(mel, audio):
+    """``MelSpectrogram.forward`` as it was before the in-place magnitude."""
+    fft = torch.stft(
+        audio,
+        n_fft=mel.n_fft,
+        hop_length=mel.hop_length,
+        win_length=mel.win_length,
+        window=torch.hann_window(mel.win_length),
+        center=True,
+        return_complex=True,
+    )
+    magnitude = torch.sqrt(fft.real.pow(2) + fft.imag.pow(2))
+    mel_output = torch.matmul(mel.mel_basis, magnitude)
+    return torch.log(torch.clamp(mel_output, min=mel.clamp))
+
+
+def run(seconds=(1, 10, 30), repeat=5, warmup=1):
+    # RMVPE's front end, as built by RMVPE.__init__.
+    mel = MelSpectrogram(False, 128, 16000, 1024, 160, None, 30, 8000)
+    rows = []
+    for duration in seconds:
+        audio = torch.randn(1, int(duration * 16000)) * 0.1
+        expected = reference_mel(mel, audio)
+        baseline = None
+        for mode, fn in [
+            ("reference", lambda: reference_mel(mel, audio)),
+            ("in_place", lambda: mel(audio)),
+        ]:
+            latency, _, _ = measure(fn, repeat, warmup)
+            baseline = baseline or latency
+            rows.append(
+                {
+                    "mode": mode,
+                    "seconds": duration,
+                    **timing(latency, baseline),
+                    "alloc_mb": "%.1f" % allocated_mb(fn),
+                    "max_abs_diff": (
+                        "-"
+                        if mode == "reference"
+                        else "%.2e" % (expected - fn()).abs().max().item()
+                    ),
+                }
+            )
+    return rows
+
+
+def main():
+    parser = argument_parser(__doc__)
+    parser.add_argument("--seconds", nargs="+", type=float, default=[1, 10, 30])
+    args = parse_args(parser)
+    print(format_table(run(args.seconds, args.repeat, args.warmup), columns))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,128 @@
+"""PyTorch vs onnxruntime CPU latency of the synthesizer and RMVPE.
+
+Both models are built with random weights, saved to a temporary checkpoint
+and exported through ``infer.lib.onnx``, so no assets are needed:
+
+    python -m infer.lib.bench.onnx --version v2 --sr 48k --seconds 1 5 --threads 4
+"""
+
+import os
+import tempfile
+
+import numpy as np
+import torch
+
+from infer.lib import onnx
+from infer.lib.bench import (
+    FRAMES_PER_SECOND,
+    argument_parser,
+    build_synthesizer,
+    format_table,
+    measure,
+    parse_args,
+    timing,
+)
+from infer.lib.jit.get_synthesizer import get_synthesizer_inputs
+
+columns = ["model", "backend", "seconds", "latency_ms", "rtf", "speedup"]
+
+
+def _row(model, backend, duration, latency, baseline):
+    return {
+        "model": model,
+        "backend": backend,
+        "seconds": duration,
+        **timing(latency, baseline),
+        "rtf": "%.3f" % (latency / duration),
+    }
+
+
+def run_synthesizer(tmp_dir, version, sr, if_f0, seconds, threads, repeat, warmup):
+    net_g, config = build_synthesizer(version, sr, if_f0)
+    model_path = os.path.join(tmp_dir, "synthesizer.pth")
+    torch.save(
+        {
+            "weight": net_g.state_dict(),
+            "config": config,
+            "f0": if_f0,
+            "version": version,
+        },
+        model_path,
+    )
+    net_g.remove_weight_norm()
+    session = onnx.get_session(onnx.synthesizer_onnx_export(model_path), "cpu", threads)
+    onnx_net_g = onnx.OnnxSynthesizer(session)
+
+    rows = []
+    cpt = {"version": version, "f0": if_f0}
+    for duration in seconds:
+        inputs = get_synthesizer_inputs(cpt, int(duration * FRAMES_PER_SECOND))
+        args = tuple(inputs.values())
+        baseline = None
+        for backend, fn in [
+            ("torch", lambda: net_g.infer(*args)),
+            ("onnxruntime", lambda: onnx_net_g.infer(*args)),
+        ]:
+            latency, _, _ = measure(fn, repeat, warmup)
+            baseline = baseline or latency
+            rows.append(
+                _row("%s/%s" % (version, sr), backend, duration, latency, baseline)
+            )
+    return rows
+
+
+def run_rmvpe(tmp_dir, seconds, threads, repeat, warmup):
+    from infer.lib.rmvpe import E2E
+
+    model = E2E(4, 1, (2, 2)).eval()
+    model_path = os.path.join(tmp_dir, "rmvpe.pt")
+    torch.save(model.state_dict(), model_path)
+    session = onnx.get_session(onnx.rmvpe_onnx_export(model_path), "cpu", threads)
+
+    rows = []
+    for duration in seconds:
+        # mel2hidden pads the frame axis to a multiple of 32.
+        n_frames = int(duration * FRAMES_PER_SECOND) // 32 * 32 + 32
+        mel = torch.randn(1, 128, n_frames)
+        feed = {"mel": mel.numpy().astype(np.float32)}
+        baseline = None
+        for backend, fn in [
+            ("torch", lambda: model(mel)),
+            ("onnxruntime", lambda: session.run(["hidden"], feed)),
+        ]:
+            latency, _, _ = measure(fn, repeat, warmup)
+            baseline = baseline or latency
+            rows.append(_row("rmvpe", backend, duration, latency, baseline))
+    return rows
+
+
+def run(version="v2", sr="48k", if_f0=1, seconds=(1, 5), threads=0, repeat=5, warmup=2):
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        rows = run_synthesizer(
+            tmp_dir, version, sr, if_f0, seconds, threads, repeat, warmup
+        )
+        rows += run_rmvpe(tmp_dir, seconds, threads, repeat, warmup)
+    return rows
+
+
+def main():
+    parser = argument_parser(__doc__, warmup=2)
+    parser.add_argument("--version", default="v2", choices=["v1", "v2"])
+    parser.add_argument("--sr", default="48k")
+    parser.add_argument("--f0", type=int, default=1)
+    parser.add_argument("--seconds", nargs="+", type=float, default=[1, 5])
+    args = parse_args(parser)
+    rows = run(
+        args.version,
+        args.sr,
+        args.f0,
+        args.seconds,
+        args.threads or 0,
+        args.repeat,
+        args.warmup,
+    )
+    print(format_table(rows, columns))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,143 @@
+"""Speed and quality of fp32 vs int8 (dynamic / static) CPU inference.
+
+Quality is the SNR of each quantized output against fp32 on the same
+inputs and noise. The synthesizer uses random weights and is calibrated on
+random inputs; HuBERT is included when a checkpoint is given, calibrated
+and evaluated on ``--audio`` files (for example our own segments):
+
+    python -m infer.lib.bench.quantize --version v2 --sr 48k --seconds 1 5
+    python -m infer.lib.bench.quantize --hubert assets/hubert/hubert_base.pt \\
+        --audio sinhala_audio_segments/*.wav
+"""
+
+import copy
+
+import numpy as np
+import torch
+
+from infer.lib import quantize
+from infer.lib.bench import (
+    FRAMES_PER_SECOND,
+    argument_parser,
+    build_synthesizer,
+    format_table,
+    measure,
+    parse_args,
+    snr_db,
+    synthesizer_inputs,
+    timing,
+)
+
+columns = ["model", "mode", "seconds", "latency_ms", "speedup", "snr_db"]
+
+
+def _rows(model, seconds, outputs, latencies):
+    rows = []
+    for mode in ["fp32", *quantize.modes]:
+        rows.append(
+            {
+                "model": model,
+                "mode": mode,
+                "seconds": seconds,
+                **timing(latencies[mode], latencies["fp32"]),
+                "snr_db": (
+                    "-"
+                    if mode == "fp32"
+                    else "%.1f" % snr_db(outputs["fp32"], outputs[mode])
+                ),
+            }
+        )
+    return rows
+
+
+def run_synthesizer(version, sr, if_f0, seconds, repeat, warmup):
+    net_g, _ = build_synthesizer(version, sr, if_f0)
+    models = {}
+    for mode in quantize.modes:
+        model, _ = build_synthesizer(version, sr, if_f0)
+        model.load_state_dict(net_g.state_dict())
+        quantize.prepare_synthesizer(model.prepare_for_inference(), mode)
+        if mode == "static":
+            with torch.no_grad():
+                for _ in range(4):
+                    model.infer(
+                        *synthesizer_inputs(version, 2 * FRAMES_PER_SECOND, 1, if_f0)
+                    )
+        models[mode] = quantize.convert(model, mode)
+    models["fp32"] = net_g.prepare_for_inference()
+
+    rows = []
+    for duration in seconds:
+        args = synthesizer_inputs(version, int(duration * FRAMES_PER_SECOND), 1, if_f0)
+        outputs, latencies = {}, {}
+        for mode, model in models.items():
+
+            def fn():
+                # Same noise for every mode, so the SNR only measures int8 error.
+                torch.manual_seed(0)
+                return model.infer(*args)[0]
+
+            latencies[mode], _, _ = measure(fn, repeat, warmup)
+            with torch.no_grad():
+                outputs[mode] = fn()
+        rows += _rows("%s/%s" % (version, sr), duration, outputs, latencies)
+    return rows
+
+
+def run_hubert(hubert_path, audio_paths, repeat, warmup):
+    from fairseq import checkpoint_utils
+
+    from infer.lib.audio import load_audio
+    from infer.modules.vc.utils import calibrate_hubert
+
+    models, _, _ = checkpoint_utils.load_model_ensemble_and_task(
+        [hubert_path], suffix=""
+    )
+    hubert_model = models[0].float().eval()
+    hubert_models = {"fp32": hubert_model}
+    for mode in quantize.modes:
+        model = quantize.prepare_hubert(copy.deepcopy(hubert_model), mode)
+        if mode == "static":
+            with torch.no_grad():
+                calibrate_hubert(model, audio_paths)
+        hubert_models[mode] = quantize.convert(model, mode)
+
+    if audio_paths:
+        audio = np.concatenate([load_audio(path, 16000) for path in audio_paths])
+    else:
+        audio = np.random.randn(16000 * 5).astype(np.float32) * 0.1
+    feats = torch.from_numpy(audio).float().view(1, -1)
+    padding_mask = torch.zeros(feats.shape, dtype=torch.bool)
+    outputs, latencies = {}, {}
+    for mode, model in hubert_models.items():
+
+        def fn():
+            return model.extract_features(
+                source=feats, padding_mask=padding_mask, output_layer=12
+            )[0]
+
+        latencies[mode], _, _ = measure(fn, repeat, warmup)
+        with torch.no_grad():
+            outputs[mode] = fn()
+    return _rows("hubert", "%.1f" % (len(audio) / 16000), outputs, latencies)
+
+
+def main():
+    parser = argument_parser(__doc__)
+    parser.add_argument("--version", default="v2", choices=["v1", "v2"])
+    parser.add_argument("--sr", default="48k")
+    parser.add_argument("--f0", type=int, default=1)
+    parser.add_argument("--seconds", nargs="+", type=float, default=[1, 5])
+    parser.add_argument("--hubert", default=None, help="HuBERT checkpoint")
+    parser.add_argument("--audio", nargs="*", default=[])
+    args = parse_args(parser)
+    rows = run_synthesizer(
+        args.version, args.sr, args.f0, args.seconds, args.repeat, args.warmup
+    )
+    if args.hubert:
+        rows += run_hubert(args.hubert, args.audio, args.repeat, args.warmup)
+    print(format_table(rows, columns))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,180 @@
+"""RMVPE throughput on many short segments and memory on long inputs.
+
+``sequential`` calls ``RMVPE.infer_from_audio`` on each segment, as when
+segments are converted one by one; ``batched`` runs
+``RMVPE.infer_from_audio_batch`` on all of them. The segments are random
+noise of random lengths, and the model has random weights saved to a
+temporary checkpoint. ``audio_s_per_s`` is seconds of audio processed per
+second, and ``max_f0_diff`` is the largest F0 difference in Hz from the
+sequential path:
+
+    python -m infer.lib.bench.rmvpe --segments 32 --seconds 1 4 --batch-sizes 8 16
+
+With ``--long-seconds``, a gliding tone of that length is also run ``whole``
+in one pass and ``tiled`` by ``RMVPE.infer_from_audio_tiled``. There
+``max_f0_diff`` compares the tiled F0 with the whole one,
+``overlap_f0_diff`` does so on the frames where tiles are crossfaded, and
+``frames_over_1hz`` counts the frames that differ by more than 1 Hz. Random
+weights give flat salience, where a small change can move the peak to
+another bin, so a few such frames are expected:
+
+    python -m infer.lib.bench.rmvpe --segments 0 --long-seconds 60 120 --tile-seconds 20
+"""
+
+import os
+import tempfile
+
+import numpy as np
+import torch
+
+from infer.lib.bench import argument_parser, format_table, measure, parse_args, timing
+from infer.lib.rmvpe import E2E, RMVPE
+
+columns = [
+    "mode",
+    "batch_size",
+    "segments",
+    "latency_ms",
+    "segments_per_s",
+    "audio_s_per_s",
+    "speedup",
+    "max_f0_diff",
+]
+
+
+def build_rmvpe(seed=0):
+    torch.manual_seed(seed)
+    with tempfile.TemporaryDirectory() as root:
+        model_path = os.path.join(root, "rmvpe.pt")
+        torch.save(E2E(4, 1, (2, 2)).state_dict(), model_path)
+        return RMVPE(model_path, is_half=False, device="cpu")
+
+
+def run(segments=32, seconds=(1, 4), batch_sizes=(8, 16), repeat=3, warmup=1):
+    rmvpe = build_rmvpe()
+    rng = np.random.default_rng(0)
+    lengths = rng.integers(int(seconds[0] * 16000), int(seconds[-1] * 16000), segments)
+    audios = [rng.standard_normal(n).astype(np.float32) * 0.1 for n in lengths]
+    total = sum(lengths) / 16000
+
+    expected = [rmvpe.infer_from_audio(audio) for audio in audios]
+    cases = [("sequential", "-", lambda: [rmvpe.infer_from_audio(a) for a in audios])]
+    for batch_size in batch_sizes:
+        cases.append(
+            (
+                "batched",
+                batch_size,
+                lambda b=batch_size: rmvpe.infer_from_audio_batch(audios, batch_size=b),
+            )
+        )
+    rows = []
+    baseline = None
+    for mode, batch_size, fn in cases:
+        latency, _, _ = measure(fn, repeat, warmup)
+        baseline = baseline or latency
+        diff = max(np.abs(a - b).max() for a, b in zip(expected, fn()))
+        rows.append(
+            {
+                "mode": mode,
+                "batch_size": batch_size,
+                "segments": segments,
+                **timing(latency, baseline),
+                "segments_per_s": "%.1f" % (segments / latency),
+                "audio_s_per_s": "%.1f" % (total / latency),
+                "max_f0_diff": "-" if mode == "sequential" else "%.2e" % diff,
+            }
+        )
+    return rows
+
+
+tiled_columns = [
+    "mode",
+    "seconds",
+    "latency_ms",
+    "peak_rss_mb",
+    "max_f0_diff",
+    "overlap_f0_diff",
+    "frames_over_1hz",
+]
+
+
+def gliding_tone(seconds, sr=16000):
+    """A voiced test signal whose pitch moves between 120 and 280 Hz."""
+    t = np.arange(int(seconds * sr)) / sr
+    f0 = 200 + 80 * np.sin(2 * np.pi * 0.3 * t)
+    noise = np.random.default_rng(0).standard_normal(len(t))
+    return (0.3 * np.sin(2 * np.pi * np.cumsum(f0) / sr) + 0.02 * noise).astype(
+        np.float32
+    )
+
+
+def run_tiled(seconds=(60, 120), tile_seconds=20, tile_threads=1, repeat=1, warmup=0):
+    rmvpe = build_rmvpe()
+    rmvpe.tile_frames = int(tile_seconds * 100)
+    rmvpe.tile_threads = tile_threads
+    step = rmvpe.tile_frames - rmvpe.tile_overlap
+    rows = []
+    for duration in seconds:
+        audio = gliding_tone(duration)
+
+        def whole():
+            mel = rmvpe.mel_extractor(torch.from_numpy(audio)[None], center=True)
+            return rmvpe.hidden2f0(rmvpe.mel2hidden(mel))
+
+        cases = [
+            ("whole", whole),
+            ("tiled", lambda: rmvpe.infer_from_audio_tiled(audio)),
+        ]
+        outputs = {}
+        for mode, fn in cases:
+            latency, _, peak_rss = measure(fn, repeat, warmup)
+            outputs[mode] = fn()
+            diff = np.abs(outputs["whole"] - outputs[mode])
+            overlap = np.zeros(len(diff), dtype=bool)
+            for start in range(step, len(diff), step):
+                overlap[start : start + rmvpe.tile_overlap] = True
+            rows.append(
+                {
+                    "mode": mode,
+                    "seconds": duration,
+                    "latency_ms": "%.0f" % (latency * 1000),
+                    "peak_rss_mb": "%.0f" % peak_rss,
+                    "max_f0_diff": "-" if mode == "whole" else "%.2e" % diff.max(),
+                    "overlap_f0_diff": (
+                        "-" if mode == "whole" else "%.2e" % diff[overlap].max()
+                    ),
+                    "frames_over_1hz": (
+                        "-" if mode == "whole" else int((diff > 1).sum())
+                    ),
+                }
+            )
+    return rows
+
+
+def main():
+    parser = argument_parser(__doc__, repeat=3)
+    parser.add_argument("--segments", type=int, default=32)
+    parser.add_argument(
+        "--seconds",
+        nargs=2,
+        type=float,
+        default=[1, 4],
+        help="shortest and longest segment",
+    )
+    parser.add_argument("--batch-sizes", nargs="+", type=int, default=[8, 16])
+    parser.add_argument("--long-seconds", nargs="*", type=float, default=[])
+    parser.add_argument("--tile-seconds", type=float, default=20)
+    parser.add_argument("--tile-threads", type=int, default=1)
+    args = parse_args(parser)
+    if args.segments:
+        rows = run(
+            args.segments, args.seconds, args.batch_sizes, args.repeat, args.warmup
+        )
+        print(format_table(rows, columns))
+    if args.long_seconds:
+        rows = run_tiled(args.long_seconds, args.tile_seconds, args.tile_threads)
+        print(format_table(rows, tiled_columns))
+
+
+if __name__ == "__main__":
+    main()
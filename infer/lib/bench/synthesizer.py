@@ -0,0 +1,134 @@
+"""CPU micro-benchmark for the synthesizer model family.
+
+Builds every ``SynthesizerTrnMs*NSFsid`` variant from ``configs/v1`` and
+``configs/v2`` with random weights and sweeps ``infer`` over input length,
+batch size, thread count and dtype. Run from the repository root:
+
+    python -m infer.lib.bench.synthesizer --seconds 1 5 10 --threads 1 4
+"""
+
+import csv
+import logging
+
+import torch
+
+from infer.lib.bench import (
+    FRAMES_PER_SECOND,
+    argument_parser,
+    build_synthesizer,
+    format_table,
+    measure,
+    parse_args,
+    synthesizer_configs,
+    synthesizer_inputs,
+)
+
+logger = logging.getLogger(__name__)
+
+dtypes = {
+    "fp32": torch.float32,
+    "bf16": torch.bfloat16,
+    "fp16": torch.float16,
+}
+
+columns = [
+    "model",
+    "f0",
+    "dtype",
+    "threads",
+    "batch",
+    "seconds",
+    "latency_ms",
+    "rtf",
+    "peak_rss_mb",
+]
+
+
+def run(
+    versions=("v1", "v2"),
+    srs=None,
+    f0s=(1, 0),
+    seconds=(1, 5, 10),
+    batch_sizes=(1,),
+    threads=(1,),
+    dtype_names=("fp32",),
+    repeat=5,
+    warmup=1,
+):
+    rows = []
+    for version in versions:
+        for sr in srs or synthesizer_configs[version]:
+            if sr not in synthesizer_configs[version]:
+                continue
+            for if_f0 in f0s:
+                net_g, _ = build_synthesizer(version, sr, if_f0)
+                for dtype_name in dtype_names:
+                    dtype = dtypes[dtype_name]
+                    net_g = net_g.to(dtype)
+                    for n_threads in threads:
+                        torch.set_num_threads(n_threads)
+                        for batch_size in batch_sizes:
+                            for duration in seconds:
+                                n_frames = int(duration * FRAMES_PER_SECOND)
+                                args = synthesizer_inputs(
+                                    version, n_frames, batch_size, if_f0, dtype
+                                )
+                                latency, _, peak = measure(
+                                    lambda: net_g.infer(*args), repeat, warmup
+                                )
+                                rows.append(
+                                    {
+                                        "model": "%s/%s" % (version, sr),
+                                        "f0": if_f0,
+                                        "dtype": dtype_name,
+                                        "threads": n_threads,
+                                        "batch": batch_size,
+                                        "seconds": duration,
+                                        "latency_ms": "%.1f" % (latency * 1000),
+                                        # Audio produced per call is batch * duration.
+                                        "rtf": "%.3f"
+                                        % (latency / (duration * batch_size)),
+                                        "peak_rss_mb": "%.0f" % peak,
+                                    }
+                                )
+                                logger.info(rows[-1])
+                del net_g
+    return rows
+
+
+def main():
+    parser = argument_parser(__doc__, threads=False)
+    parser.add_argument("--versions", nargs="+", default=["v1", "v2"])
+    parser.add_argument("--srs", nargs="+", default=None, help="e.g. 40k 48k")
+    parser.add_argument("--f0", nargs="+", type=int, default=[1, 0])
+    parser.add_argument("--seconds", nargs="+", type=float, default=[1, 5, 10])
+    parser.add_argument("--batch-sizes", nargs="+", type=int, default=[1])
+    parser.add_argument("--threads", nargs="+", type=int, default=[1])
+    parser.add_argument(
+        "--dtypes", nargs="+", default=["fp32"], choices=list(dtypes.keys())
+    )
+    parser.add_argument("--csv", default=None, help="Also write results to this file")
+    args = parse_args(parser)
+
+    rows = run(
+        args.versions,
+        args.srs,
+        args.f0,
+        args.seconds,
+        args.batch_sizes,
+        args.threads,
+        args.dtypes,
+        args.repeat,
+        args.warmup,
+    )
+    print(format_table(rows, columns))
+    if args.csv:
+        with open(args.csv, "w", newline="") as f:
+            writer = csv.DictWriter(f, fieldnames=columns)
+            writer.writeheader()
+            writer.writerows(rows)
+
+
+if __name__ == "__main__":
+    logging.basicConfig(level=logging.INFO)
+    main()
@@ -0,0 +1,324 @@
+"""F0 extractors by method name, and a cache of their results.
+
+Each method is an ``F0Extractor`` registered under the name used by
+``Pipeline.get_f0`` (``pm``, ``harvest``, ``crepe``, ``rmvpe``). ``warmup``
+loads whatever the method needs once; ``extract`` returns the F0 in Hz of
+16 kHz audio, one value per 10 ms frame, before any transposition.
+
+``F0Cache`` keys results on a hash of the audio samples and the parameters
+that change the result, so re-converting the same audio with another voice,
+index rate or pitch shift skips extraction. It is bounded in memory and can
+persist entries to a directory as ``.npy`` files.
+"""
+
+import atexit
+import hashlib
+import logging
+import multiprocessing
+import os
+from collections import OrderedDict
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+import torch
+from scipy import signal
+
+logger = logging.getLogger(__name__)
+
+f0_extractors = {}
+
+
+def register(name):
+    def wrapper(cls):
+        cls.name = name
+        f0_extractors[name] = cls
+        return cls
+
+    return wrapper
+
+
+def get_extractor(name, **kwargs):
+    if name not in f0_extractors:
+        raise ValueError(
+            "Unknown F0 method %s, use one of %s" % (name, sorted(f0_extractors))
+        )
+    return f0_extractors[name](**kwargs)
+
+
+class F0Extractor:
+    name = None
+
+    def __init__(
+        self,
+        sr=16000,
+        window=160,
+        f0_min=50,
+        f0_max=1100,
+        device="cpu",
+        is_half=False,
+        **kwargs
+    ):
+        self.sr = sr
+        self.window = window
+        self.f0_min = f0_min
+        self.f0_max = f0_max
+        self.device = device
+        self.is_half = is_half
+
+    def params(self, filter_radius):
+        """What, besides the audio, changes the result of ``extract``."""
+        return (self.name, self.sr, self.window, self.f0_min, self.f0_max)
+
+    def warmup(self):
+        pass
+
+    def close(self):
+        """Release what ``warmup`` started; a later ``warmup`` starts it again."""
+        pass
+
+    def extract(self, x, p_len, filter_radius):
+        raise NotImplementedError
+
+
+@register("pm")
+class PMExtractor(F0Extractor):
+    def extract(self, x, p_len, filter_radius):
+        import parselmouth
+
+        f0 = (
+            parselmouth.Sound(x, self.sr)
+            .to_pitch_ac(
+                time_step=self.window / self.sr,
+                voicing_threshold=0.6,
+                pitch_floor=self.f0_min,
+                pitch_ceiling=self.f0_max,
+            )
+            .selected_array["frequency"]
+        )
+        pad_size = (p_len - len(f0) + 1) // 2
+        if pad_size > 0 or p_len - len(f0) - pad_size > 0:
+            f0 = np.pad(f0, [[pad_size, p_len - len(f0) - pad_size]], mode="constant")
+        return f0
+
+
+def harvest(audio, fs, f0_min, f0_max, frame_period):
+    import pyworld
+
+    f0, t = pyworld.harvest(
+        audio,
+        fs=fs,
+        f0_ceil=f0_max,
+        f0_floor=f0_min,
+        frame_period=frame_period,
+    )
+    return pyworld.stonemask(audio, f0, t, fs)
+
+
+@register("harvest")
+class HarvestExtractor(F0Extractor):
+    """pyworld harvest, split across processes for long audio.
+
+    Audio longer than two chunks is cut near every ``chunk_seconds`` at the
+    quietest frame within ``search_seconds``, where speech is most likely
+    unvoiced. Each chunk is analysed with ``margin_seconds`` of its
+    neighbours on both sides, which is then dropped, and the frames are
+    concatenated in order.
+    """
+
+    chunk_seconds = 10
+    search_seconds = 1
+    margin_seconds = 0.5
+
+    def __init__(self, workers=1, **kwargs):
+        super().__init__(**kwargs)
+        self.n_workers = max(workers, 1)
+        self.pool = None
+
+    def params(self, filter_radius):
+        return super().params(filter_radius) + (filter_radius > 2,)
+
+    def warmup(self):
+        if self.pool is None and self.n_workers > 1:
+            # Spawned: forking a process already running torch, OpenMP and
+            # the pipeline's threads can deadlock in the child.
+            self.pool = ProcessPoolExecutor(
+                self.n_workers, mp_context=multiprocessing.get_context("spawn")
+            )
+            # Workers left running at exit would outlive the interpreter's
+            # cleanup; close() undoes this when the extractor is dropped first.
+            atexit.register(self.close)
+
+    def close(self):
+        if self.pool is not None:
+            atexit.unregister(self.close)
+            self.pool.shutdown()
+            self.pool = None
+
+    def split(self, x):
+        """Frame-aligned (start, end) sample ranges covering ``x``."""
+        chunk = self.chunk_seconds * self.sr
+        search = self.search_seconds * self.sr
+        bounds = [0]
+        if len(x) >= 2 * chunk:
+            # Sum of |x| over the frame around each sample, like the cut
+            # points of Pipeline.pipeline.
+            energy = np.convolve(np.abs(x), np.ones(self.window), mode="same")
+            for t in range(chunk, len(x) - chunk // 2, chunk):
+                t = t - search + np.argmin(energy[t - search : t + search])
+                bounds.append(t // self.window * self.window)
+        bounds.append(len(x))
+        return list(zip(bounds[:-1], bounds[1:]))
+
+    def extract(self, x, p_len, filter_radius):
+        audio = x.astype(np.double)
+        frame_period = self.window / self.sr * 1000
+        args = (self.sr, self.f0_min, self.f0_max, frame_period)
+        chunks = self.split(audio)
+        if len(chunks) == 1 or self.pool is None:
+            f0 = harvest(audio, *args)
+        else:
+            margin = int(self.margin_seconds * self.sr) // self.window * self.window
+            futures = [
+                self.pool.submit(
+                    harvest, audio[max(start - margin, 0) : end + margin], *args
+                )
+                for start, end in chunks
+            ]
+            f0 = []
+            for (start, end), future in zip(chunks, futures):
+                head = (start - max(start - margin, 0)) // self.window
+                # Harvest returns one frame past the end; keep it on the last
+                # chunk only, so the length matches a single call.
+                n = (end - start) // self.window + (end == len(audio))
+                f0.append(future.result()[head : head + n])
+            f0 = np.concatenate(f0)
+        if filter_radius > 2:
+            f0 = signal.medfilt(f0, 3)
+        return f0
+
+
+@register("crepe")
+class CrepeExtractor(F0Extractor):
+    model = "full"
+    # Pick a batch size that doesn't cause memory errors on your gpu
+    batch_size = 512
+
+    def extract(self, x, p_len, filter_radius):
+        import torchcrepe
+
+        audio = torch.tensor(np.copy(x))[None].float()
+        f0, pd = torchcrepe.predict(
+            audio,
+            self.sr,
+            self.window,
+            self.f0_min,
+            self.f0_max,
+            self.model,
+            batch_size=self.batch_size,
+            device=self.device,
+            return_periodicity=True,
+        )
+        pd = torchcrepe.filter.median(pd, 3)
+        f0 = torchcrepe.filter.mean(f0, 3)
+        f0[pd < 0.1] = 0
+        return f0[0].cpu().numpy()
+
+
+@register("rmvpe")
+class RMVPEExtractor(F0Extractor):
+    def __init__(
+        self,
+        use_onnx=False,
+        onnx_threads=(0, 1),
+        use_bf16=False,
+        tile_seconds=None,
+        tile_threads=1,
+        **kwargs
+    ):
+        super().__init__(**kwargs)
+        self.use_onnx = use_onnx
+        self.onnx_threads = onnx_threads
+        self.use_bf16 = use_bf16
+        self.tile_seconds = tile_seconds
+        self.tile_threads = tile_threads
+        self.model = None
+
+    def params(self, filter_radius):
+        return (self.name, self.sr, self.tile_seconds)
+
+    def warmup(self):
+        if self.model is not None:
+            return
+        from infer.lib.rmvpe import RMVPE
+
+        model_path = "%s/rmvpe.pt" % os.environ["rmvpe_root"]
+        logger.info("Loading rmvpe model,%s" % model_path)
+        self.model = RMVPE(
+            model_path,
+            is_half=self.is_half,
+            device=self.device,
+            use_onnx=self.use_onnx,
+            onnx_threads=self.onnx_threads,
+            use_bf16=self.use_bf16,
+            tile_seconds=self.tile_seconds,
+            tile_threads=self.tile_threads,
+        )
+
+    def extract(self, x, p_len, filter_radius):
+        self.warmup()
+        f0 = self.model.infer_from_audio(x, thred=0.03)
+        if "privateuseone" in str(self.device):  # clean ortruntime memory
+            del self.model.model
+            self.model = None
+            logger.info("Cleaning ortruntime memory")
+        return f0
+
+
+class F0Cache:
+    """LRU of extracted F0 bounded by its size, optionally backed by a directory."""
+
+    def __init__(self, max_mb=64, cache_dir=None):
+        self.max_bytes = max_mb * 1024 * 1024
+        self.cache_dir = cache_dir
+        self.entries = OrderedDict()
+        self.nbytes = 0
+        if cache_dir:
+            os.makedirs(cache_dir, exist_ok=True)
+
+    @staticmethod
+    def key(x, params):
+        x = np.ascontiguousarray(x)
+        h = hashlib.sha1(x)
+        h.update(repr((x.dtype.str, x.shape, params)).encode())
+        return h.hexdigest()
+
+    def _path(self, key):
+        return os.path.join(self.cache_dir, "%s.npy" % key)
+
+    def get(self, key):
+        f0 = self.entries.get(key)
+        if f0 is not None:
+            self.entries.move_to_end(key)
+            return f0
+        if self.cache_dir and os.path.exists(self._path(key)):
+            f0 = np.load(self._path(key))
+            self._put(key, f0)
+        return f0
+
+    def put(self, key, f0):
+        self._put(key, f0)
+        if self.cache_dir:
+            np.save(self._path(key), f0)
+
+    def _put(self, key, f0):
+        if key in self.entries:
+            self.nbytes -= self.entries.pop(key).nbytes
+        self.entries[key] = f0
+        self.nbytes += f0.nbytes
+        while len(self.entries) > 1 and self.nbytes > self.max_bytes:
+            _, evicted = self.entries.popitem(last=False)
+            self.nbytes -= evicted.nbytes
+
+    def clear(self):
+        self.entries.clear()
+        self.nbytes = 0
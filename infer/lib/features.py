@@ -0,0 +1,25 @@
+"""A cache of the per-input work of ``Pipeline.pipeline`` before synthesis.
+
+Converting a file runs the high-pass filter and HuBERT on it regardless of
+the voice, ``index_rate`` or ``protect`` it is converted with. With
+``FeatureCache`` the filtered audio and the HuBERT features of every segment
+are kept by a hash of their input, so converting the same file again only
+runs the index search and the synthesizer. Its F0 is kept by ``F0Cache``.
+"""
+
+import numpy as np
+
+from infer.lib.f0 import F0Cache
+
+
+class FeatureCache(F0Cache):
+    """F0Cache of float16 arrays.
+
+    ``put`` returns the value as it is stored, so that a conversion uses the
+    same values whether they were just computed or loaded.
+    """
+
+    def put(self, key, value):
+        value = np.asarray(value, dtype=np.float16)
+        super().put(key, value)
+        return value
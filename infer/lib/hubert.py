@@ -0,0 +1,93 @@
+"""HuBERT features of many chunks of audio, batched by length.
+
+``HubertService.extract`` takes the 16 kHz chunks of any number of segments,
+sorts them by length and runs them ``batch_size`` at a time, each batch
+zero-padded to its longest chunk with a padding mask marking the rest. Chunks
+only share a batch when their lengths are within ``bucket_seconds`` of each
+other. Every chunk gets back the frames of its own length: layer 9 through
+``final_proj`` for v1 models, layer 12 for v2.
+
+The first conv layer of hubert_base normalises over time, so the padding
+still shifts the features of the shorter chunks of a batch slightly; chunks
+of equal length, and batches of one, match the unbatched model exactly.
+"""
+
+import torch
+
+# (kernel, stride) of the conv feature extractor of hubert_base.
+conv_layers = [(10, 5)] + [(3, 2)] * 4 + [(2, 2)] * 2
+
+
+def n_frames(n_samples):
+    """HuBERT frames of a chunk of ``n_samples``."""
+    for kernel, stride in conv_layers:
+        n_samples = (n_samples - kernel) // stride + 1
+    return n_samples
+
+
+def output_layer(version):
+    return 9 if version == "v1" else 12
+
+
+class HubertService:
+    def __init__(
+        self,
+        device,
+        is_half=False,
+        use_bf16=False,
+        batch_size=8,
+        bucket_seconds=1.0,
+        sr=16000,
+    ):
+        self.device = device
+        self.is_half = is_half
+        self.use_bf16 = use_bf16
+        self.batch_size = max(batch_size, 1)
+        self.bucket = int(bucket_seconds * sr)
+
+    def batches(self, lengths):
+        """Indices of ``lengths`` grouped into batches, shortest first."""
+        batch = []
+        for i in sorted(range(len(lengths)), key=lambda i: lengths[i]):
+            if batch and (
+                len(batch) == self.batch_size
+                or lengths[i] - lengths[batch[0]] > self.bucket
+            ):
+                yield batch
+                batch = []
+            batch.append(i)
+        if batch:
+            yield batch
+
+    def extract(self, model, chunks, version):
+        """Features [1, frames, channels] of each chunk, in the order given."""
+        sources = []
+        for chunk in chunks:
+            source = torch.as_tensor(chunk)
+            if source.dim() == 2:  # double channels
+                source = source.mean(-1)
+            assert source.dim() == 1, source.dim()
+            sources.append(source)
+        lengths = [len(source) for source in sources]
+        dtype = torch.float16 if self.is_half else torch.float32
+        feats = [None] * len(sources)
+        for batch in self.batches(lengths):
+            source = torch.zeros(len(batch), max(lengths[i] for i in batch))
+            padding_mask = torch.ones(source.shape, dtype=torch.bool)
+            for j, i in enumerate(batch):
+                source[j, : lengths[i]] = sources[i]
+                padding_mask[j, : lengths[i]] = False
+            with torch.no_grad(), torch.autocast(
+                "cpu", torch.bfloat16, enabled=self.use_bf16
+            ):
+                logits = model.extract_features(
+                    source=source.to(self.device, dtype),
+                    padding_mask=padding_mask.to(self.device),
+                    output_layer=output_layer(version),
+                )
+                out = model.final_proj(logits[0]) if version == "v1" else logits[0]
+            if self.use_bf16:
+                out = out.float()
+            for j, i in enumerate(batch):
+                feats[i] = out[j : j + 1, : n_frames(lengths[i])]
+        return feats
@@ -243,24 +243,22 @@ class MultiHeadAttention(nn.Module):
         key = key.view(b, self.n_heads, self.k_channels, t_s).transpose(2, 3)
         value = value.view(b, self.n_heads, self.k_channels, t_s).transpose(2, 3)
 
-        scores = torch.matmul(query / math.sqrt(self.k_channels), key.transpose(-2, -1))
+        query = query / math.sqrt(self.k_channels)
+        scores = torch.matmul(query, key.transpose(-2, -1))
         if self.window_size is not None:
             assert (
                 t_s == t_t
             ), "Relative attention is only available for self-attention."
-            key_relative_embeddings = self._get_relative_embeddings(self.emb_rel_k, t_s)
-            rel_logits = self._matmul_with_relative_keys(
-                query / math.sqrt(self.k_channels), key_relative_embeddings
-            )
-            scores_local = self._relative_position_to_absolute_position(rel_logits)
-            scores = scores + scores_local
+            # The relative terms are zero outside the window, so only the
+            # [l, 2*w+1] band around the diagonal is computed and added.
+            scores = self._add_relative_keys(scores, query, self.emb_rel_k)
         if self.proximal_bias:
             assert t_s == t_t, "Proximal bias is only available for self-attention."
             scores = scores + self._attention_bias_proximal(t_s).to(
                 device=scores.device, dtype=scores.dtype
             )
         if mask is not None:
-            scores = scores.masked_fill(mask == 0, -1e4)
+            scores = scores.masked_fill_(mask == 0, -1e4)
             if self.block_length is not None:
                 assert (
                     t_s == t_t
@@ -275,13 +273,7 @@ class MultiHeadAttention(nn.Module):
         p_attn = self.drop(p_attn)
         output = torch.matmul(p_attn, value)
         if self.window_size is not None:
-            relative_weights = self._absolute_position_to_relative_position(p_attn)
-            value_relative_embeddings = self._get_relative_embeddings(
-                self.emb_rel_v, t_s
-            )
-            output = output + self._matmul_with_relative_values(
-                relative_weights, value_relative_embeddings
-            )
+            output = output + self._relative_values(p_attn, self.emb_rel_v)
         output = (
             output.transpose(2, 3).contiguous().view(b, d, t_t)
         )  # [b, n_h, t_t, d_k] -> [b, d, t_t]
@@ -373,6 +365,47 @@ class MultiHeadAttention(nn.Module):
         x_final = x_flat.view([batch, heads, length, 2 * length])[:, :, :, 1:]
         return x_final
 
+    def _relative_band(self, length: int, device: torch.device):
+        """
+        ret: columns [l, 2*w+1] of the window around the diagonal of an
+        [l, l] matrix, clamped to it, and the mask of the ones inside it
+        """
+        window = torch.arange(-self.window_size, self.window_size + 1, device=device)
+        cols = torch.arange(length, device=device).unsqueeze(1) + window
+        valid = (cols >= 0) & (cols < length)
+        return cols.clamp(0, length - 1), valid
+
+    def _add_relative_keys(self, scores, query, relative_embeddings):
+        """
+        scores: [b, h, l, l], updated in place
+        query: [b, h, l, d]
+        relative_embeddings: [h or 1, 2*w+1, d]
+        ret: scores plus _relative_position_to_absolute_position of the
+        relative logits, without building the [b, h, l, 2*l-1] logits
+        """
+        b, h, length, _ = scores.size()
+        cols, valid = self._relative_band(length, scores.device)
+        rel_logits = self._matmul_with_relative_keys(query, relative_embeddings)
+        return scores.scatter_add_(
+            -1,
+            cols.expand(b, h, length, 2 * self.window_size + 1),
+            rel_logits.masked_fill(~valid, 0.0),
+        )
+
+    def _relative_values(self, p_attn, relative_embeddings):
+        """
+        p_attn: [b, h, l, l]
+        relative_embeddings: [h or 1, 2*w+1, d]
+        ret: [b, h, l, d], same as the _absolute_position_to_relative_position
+        path, without building the [b, h, l, 2*l-1] weights
+        """
+        b, h, length, _ = p_attn.size()
+        cols, valid = self._relative_band(length, p_attn.device)
+        relative_weights = p_attn.gather(
+            -1, cols.expand(b, h, length, 2 * self.window_size + 1)
+        ).masked_fill(~valid, 0.0)
+        return self._matmul_with_relative_values(relative_weights, relative_embeddings)
+
     def _attention_bias_proximal(self, length: int):
         """Bias for self-attention to encourage attention to close positions.
         Args:
@@ -1,6 +1,6 @@
 import math
 import logging
-from typing import Optional
+from typing import Optional, Tuple
 
 logger = logging.getLogger(__name__)
 
@@ -41,6 +41,7 @@ class TextEncoder(nn.Module):
         self.lrelu = nn.LeakyReLU(0.1, inplace=True)
         if f0 == True:
             self.emb_pitch = nn.Embedding(256, hidden_channels)  # pitch 256
+        self.emb_scale_folded = False
         self.encoder = attentions.Encoder(
             hidden_channels,
             filter_channels,
@@ -54,15 +55,17 @@ class TextEncoder(nn.Module):
     def forward(
         self,
         phone: torch.Tensor,
-        pitch: torch.Tensor,
+        pitch: Optional[torch.Tensor],
         lengths: torch.Tensor,
         skip_head: Optional[torch.Tensor] = None,
     ):
-        if pitch is None:
-            x = self.emb_phone(phone)
-        else:
-            x = self.emb_phone(phone) + self.emb_pitch(pitch)
-        x = x * math.sqrt(self.hidden_channels)  # [b, t, h]
+        x = self.emb_phone(phone)
+        # hasattr is resolved at compile time, which keeps the _nono models
+        # (built without emb_pitch) scriptable.
+        if hasattr(self, "emb_pitch") and pitch is not None:
+            x = x + self.emb_pitch(pitch)
+        if not self.emb_scale_folded:
+            x = x * math.sqrt(self.hidden_channels)  # [b, t, h]
         x = self.lrelu(x)
         x = torch.transpose(x, 1, -1)  # [b, h, t]
         x_mask = torch.unsqueeze(commons.sequence_mask(lengths, x.size(2)), 1).to(
@@ -78,6 +81,17 @@ class TextEncoder(nn.Module):
         m, logs = torch.split(stats, self.out_channels, dim=1)
         return m, logs, x_mask
 
+    def fold_emb_scale(self):
+        """Fold the sqrt(hidden_channels) scaling into the embeddings."""
+        if self.emb_scale_folded:
+            return
+        scale = math.sqrt(self.hidden_channels)
+        self.emb_phone.weight.data.mul_(scale)
+        self.emb_phone.bias.data.mul_(scale)
+        if hasattr(self, "emb_pitch"):
+            self.emb_pitch.weight.data.mul_(scale)
+        self.emb_scale_folded = True
+
 
 class ResidualCouplingBlock(nn.Module):
     def __init__(
@@ -133,6 +147,10 @@ class ResidualCouplingBlock(nn.Module):
         for i in range(self.n_flows):
             self.flows[i * 2].remove_weight_norm()
 
+    def fold_cond_bias(self):
+        for i in range(self.n_flows):
+            self.flows[i * 2].enc.fold_cond_bias()
+
     def __prepare_scriptable__(self):
         for i in range(self.n_flows):
             for hook in self.flows[i * 2]._forward_pre_hooks.values():
@@ -264,15 +282,19 @@ class Generator(torch.nn.Module):
         if g is not None:
             x = x + self.cond(g)
 
-        for i in range(self.num_upsamples):
+        # torch.jit.script() does not support direct indexing of torch modules
+        for i, ups in enumerate(self.ups):
             x = F.leaky_relu(x, modules.LRELU_SLOPE)
-            x = self.ups[i](x)
-            xs = None
-            for j in range(self.num_kernels):
-                if xs is None:
-                    xs = self.resblocks[i * self.num_kernels + j](x)
-                else:
-                    xs += self.resblocks[i * self.num_kernels + j](x)
+            x = ups(x)
+            xs: Optional[torch.Tensor] = None
+            l = [i * self.num_kernels + j for j in range(self.num_kernels)]
+            for j, resblock in enumerate(self.resblocks):
+                if j in l:
+                    if xs is None:
+                        xs = resblock(x)
+                    else:
+                        xs += resblock(x)
+            assert isinstance(xs, torch.Tensor)
             x = xs / self.num_kernels
         x = F.leaky_relu(x)
         x = self.conv_post(x)
@@ -309,6 +331,18 @@ class Generator(torch.nn.Module):
             l.remove_weight_norm()
 
 
+def set_noise_generator(model: nn.Module, generator: Optional[torch.Generator]):
+    """Draw the inference noise of ``model`` from ``generator``.
+
+    Seeding a private generator makes conversions reproducible without
+    reseeding the global RNG that other code draws from. Only eager modules
+    have the attribute; scripted ones keep drawing from the global RNG.
+    """
+    for module in model.modules():
+        if hasattr(module, "noise_generator"):
+            module.noise_generator = generator
+
+
 class SineGen(torch.nn.Module):
     """Definition of sine generator
     SineGen(samp_rate, harmonic_num = 0,
@@ -325,6 +359,9 @@ class SineGen(torch.nn.Module):
         segment is always sin(torch.pi) or cos(0)
     """
 
+    # Eager-only caches and noise source, see _excite.
+    __jit_ignored_attributes__ = ["workspace", "ramps", "noise_generator"]
+
     def __init__(
         self,
         samp_rate,
@@ -341,6 +378,13 @@ class SineGen(torch.nn.Module):
         self.dim = self.harmonic_num + 1
         self.sampling_rate = samp_rate
         self.voiced_threshold = voiced_threshold
+        # Inference buffers are allocated for lengths rounded up to this many
+        # frames and only grow, so most calls allocate nothing.
+        self.bucket_frames = 512
+        self.workspace = {}
+        self.ramps = {}
+        # Set by set_noise_generator; None draws from the global RNG.
+        self.noise_generator = None
 
     def _f02uv(self, f0):
         # generate uv signal
@@ -350,7 +394,7 @@ class SineGen(torch.nn.Module):
             uv = uv.float()
         return uv
     
-    def _f02sine(self, f0, upp):
+    def _f02sine(self, f0: torch.Tensor, upp: int):
         """ f0: (batchsize, length, dim)
             where dim indicates fundamental tone and overtones
         """
@@ -367,7 +411,77 @@ class SineGen(torch.nn.Module):
         rad += rand_ini
         sines = torch.sin(2 * np.pi * rad)
         return sines
-        
+
+    def reuse_buffers(self) -> bool:
+        """Whether forward runs in place in the workspace (eager inference)."""
+        return (
+            not torch.jit.is_scripting()
+            and not torch.jit.is_tracing()
+            and not self.training
+            and not torch.is_grad_enabled()
+        )
+
+    @torch.jit.unused
+    def _buffer(self, name: str, batch: int, length: int, width: int, like):
+        bucket = -(-length // self.bucket_frames) * self.bucket_frames
+        numel = batch * bucket * width
+        buffer = self.workspace.get(name)
+        if (
+            buffer is None
+            or buffer.numel() < numel
+            or buffer.dtype != like.dtype
+            or buffer.device != like.device
+        ):
+            buffer = torch.empty(numel, dtype=like.dtype, device=like.device)
+            self.workspace[name] = buffer
+        return buffer[: batch * length * width].view(batch, length, width)
+
+    @torch.jit.unused
+    def _ramps(self, upp: int, like):
+        """Cached phase ramp 1..upp and harmonic numbers 1..dim."""
+        key = (upp, like.dtype, like.device)
+        if key not in self.ramps:
+            self.ramps[key] = (
+                torch.arange(1, upp + 1, dtype=like.dtype, device=like.device),
+                torch.arange(1, self.dim + 1, dtype=like.dtype, device=like.device),
+            )
+        return self.ramps[key]
+
+    @torch.jit.unused
+    def _excite(
+        self, f0: torch.Tensor, upp: int
+    ) -> Tuple[torch.Tensor, torch.Tensor, torch.Tensor]:
+        """forward computed in place in the workspace. The results are the
+        same, but are only valid until the next call."""
+        batch, length = f0.shape[0], f0.shape[1]
+        a, b = self._ramps(upp, f0)
+        rad = self._buffer("rad", batch, length, upp, f0)
+        torch.mul(f0 / self.sampling_rate, a, out=rad)
+        rad2 = torch.fmod(rad[:, :-1, -1:].float() + 0.5, 1.0) - 0.5
+        rad[:, 1:] += rad2.cumsum(dim=1).fmod(1.0).to(f0)
+        sines = self._buffer("sines", batch, length, upp * self.dim, f0)
+        sines = sines.view(batch, -1, self.dim)
+        torch.mul(rad.view(batch, -1, 1), b, out=sines)
+        rand_ini = torch.rand(
+            1, 1, self.dim, device=f0.device, generator=self.noise_generator
+        )
+        rand_ini[..., 0] = 0
+        sines.add_(rand_ini).mul_(2 * np.pi).sin_().mul_(self.sine_amp)
+
+        # uv and the noise amplitude are per frame; broadcast them over the
+        # upp samples of each frame instead of upsampling them.
+        uv = self._f02uv(f0).unsqueeze(-1)  # [b, l, 1, 1]
+        noise = self._buffer("noise", batch, length, upp * self.dim, f0)
+        noise = noise.view(batch, -1, self.dim)
+        noise.normal_(generator=self.noise_generator)
+        noise_amp = uv * self.noise_std + (1 - uv) * self.sine_amp / 3
+        noise.view(batch, length, upp, self.dim).mul_(noise_amp)
+        sines.view(batch, length, upp, self.dim).mul_(uv)
+        sines.add_(noise)
+        uv_up = rad.view(batch, length, upp, 1)  # rad is no longer needed
+        uv_up.copy_(uv.expand_as(uv_up))
+        return sines, uv_up.view(batch, -1, 1), noise
+
     def forward(self, f0: torch.Tensor, upp: int):
         """sine_tensor, uv = forward(f0)
         input F0: tensor(batchsize=1, length, dim=1)
@@ -377,6 +491,8 @@ class SineGen(torch.nn.Module):
         """
         with torch.no_grad():
             f0 = f0.unsqueeze(-1)
+            if self.reuse_buffers():
+                return self._excite(f0, upp)
             sine_waves = self._f02sine(f0, upp) * self.sine_amp
             uv = self._f02uv(f0)
             uv = F.interpolate(
@@ -434,6 +550,16 @@ class SourceModuleHnNSF(torch.nn.Module):
         # if self.ddtype ==-1:
         #     self.ddtype = self.l_linear.weight.dtype
         sine_wavs, uv, _ = self.l_sin_gen(x, upp)
+        if (
+            self.l_sin_gen.reuse_buffers()
+            and sine_wavs.size(-1) == 1
+            and sine_wavs.dtype == self.l_linear.weight.dtype
+        ):
+            # A single harmonic: the linear merge is a scale and a shift, done
+            # in place in the SineGen workspace like the tanh.
+            sine_merge = sine_wavs.mul_(self.l_linear.weight[0, 0])
+            sine_merge = sine_merge.add_(self.l_linear.bias[0]).tanh_()
+            return sine_merge, None, None
         # print(x.dtype,sine_wavs.dtype,self.l_linear.weight.dtype)
         # if self.is_half:
         #     sine_wavs = sine_wavs.half()
@@ -570,6 +696,13 @@ class GeneratorNSF(torch.nn.Module):
         for l in self.resblocks:
             l.remove_weight_norm()
 
+    def fold_noise_bias(self):
+        """Fold each noise_convs bias into the bias of the ups layer it is added to."""
+        for ups, noise_convs in zip(self.ups, self.noise_convs):
+            if noise_convs.bias is not None:
+                ups.bias.data.add_(noise_convs.bias.data)
+                noise_convs.bias = None
+
     def __prepare_scriptable__(self):
         for l in self.ups:
             for hook in l._forward_pre_hooks.values():
@@ -600,6 +733,9 @@ sr2sr = {
 
 
 class SynthesizerTrnMs256NSFsid(nn.Module):
+    # Eager-only noise source, see noise_like.
+    __jit_ignored_attributes__ = ["noise_generator"]
+
     def __init__(
         self,
         spec_channels,
@@ -684,6 +820,7 @@ class SynthesizerTrnMs256NSFsid(nn.Module):
             + ", self.spk_embed_dim: "
             + str(self.spk_embed_dim)
         )
+        self.noise_generator = None
 
     def remove_weight_norm(self):
         self.dec.remove_weight_norm()
@@ -691,6 +828,18 @@ class SynthesizerTrnMs256NSFsid(nn.Module):
         if hasattr(self, "enc_q"):
             self.enc_q.remove_weight_norm()
 
+    def prepare_for_inference(self):
+        """Fold weight norm and constant scales/biases into the conv weights.
+
+        The result computes the same ``infer`` output with fewer ops per
+        forward, but cannot be trained and always needs a speaker id.
+        """
+        self.remove_weight_norm()
+        self.enc_p.fold_emb_scale()
+        self.flow.fold_cond_bias()
+        self.dec.fold_noise_bias()
+        return self
+
     def __prepare_scriptable__(self):
         for hook in self.dec._forward_pre_hooks.values():
             # The hook we want to remove is an instance of WeightNorm class, so
@@ -717,6 +866,18 @@ class SynthesizerTrnMs256NSFsid(nn.Module):
                     torch.nn.utils.remove_weight_norm(self.enc_q)
         return self
 
+    def noise_like(self, x: torch.Tensor) -> torch.Tensor:
+        """``torch.randn_like(x)``, drawn from ``noise_generator`` in eager mode."""
+        if torch.jit.is_scripting() or torch.jit.is_tracing():
+            return torch.randn_like(x)
+        return self._generated_noise_like(x)
+
+    @torch.jit.unused
+    def _generated_noise_like(self, x: torch.Tensor) -> torch.Tensor:
+        return torch.randn(
+            x.shape, generator=self.noise_generator, dtype=x.dtype, device=x.device
+        )
+
     @torch.jit.ignore
     def forward(
         self,
@@ -763,14 +924,14 @@ class SynthesizerTrnMs256NSFsid(nn.Module):
             flow_head = torch.clamp(skip_head - 24, min=0)
             dec_head = head - int(flow_head.item())
             m_p, logs_p, x_mask = self.enc_p(phone, pitch, phone_lengths, flow_head)
-            z_p = (m_p + torch.exp(logs_p) * torch.randn_like(m_p) * 0.66666) * x_mask
+            z_p = (m_p + torch.exp(logs_p) * self.noise_like(m_p) * 0.66666) * x_mask
             z = self.flow(z_p, x_mask, g=g, reverse=True)
             z = z[:, :, dec_head : dec_head + length]
             x_mask = x_mask[:, :, dec_head : dec_head + length]
             nsff0 = nsff0[:, head : head + length]
         else:
             m_p, logs_p, x_mask = self.enc_p(phone, pitch, phone_lengths)
-            z_p = (m_p + torch.exp(logs_p) * torch.randn_like(m_p) * 0.66666) * x_mask
+            z_p = (m_p + torch.exp(logs_p) * self.noise_like(m_p) * 0.66666) * x_mask
             z = self.flow(z_p, x_mask, g=g, reverse=True)
         o = self.dec(z * x_mask, nsff0, g=g, n_res=return_length2)
         return o, x_mask, (z, z_p, m_p, logs_p)
@@ -834,6 +995,9 @@ class SynthesizerTrnMs768NSFsid(SynthesizerTrnMs256NSFsid):
 
 
 class SynthesizerTrnMs256NSFsid_nono(nn.Module):
+    # Eager-only noise source, see noise_like.
+    __jit_ignored_attributes__ = ["noise_generator"]
+
     def __init__(
         self,
         spec_channels,
@@ -915,6 +1079,7 @@ class SynthesizerTrnMs256NSFsid_nono(nn.Module):
             + ", self.spk_embed_dim: "
             + str(self.spk_embed_dim)
         )
+        self.noise_generator = None
 
     def remove_weight_norm(self):
         self.dec.remove_weight_norm()
@@ -922,6 +1087,17 @@ class SynthesizerTrnMs256NSFsid_nono(nn.Module):
         if hasattr(self, "enc_q"):
             self.enc_q.remove_weight_norm()
 
+    def prepare_for_inference(self):
+        """Fold weight norm and constant scales/biases into the conv weights.
+
+        The result computes the same ``infer`` output with fewer ops per
+        forward, but cannot be trained and always needs a speaker id.
+        """
+        self.remove_weight_norm()
+        self.enc_p.fold_emb_scale()
+        self.flow.fold_cond_bias()
+        return self
+
     def __prepare_scriptable__(self):
         for hook in self.dec._forward_pre_hooks.values():
             # The hook we want to remove is an instance of WeightNorm class, so
@@ -948,6 +1124,18 @@ class SynthesizerTrnMs256NSFsid_nono(nn.Module):
                     torch.nn.utils.remove_weight_norm(self.enc_q)
         return self
 
+    def noise_like(self, x: torch.Tensor) -> torch.Tensor:
+        """``torch.randn_like(x)``, drawn from ``noise_generator`` in eager mode."""
+        if torch.jit.is_scripting() or torch.jit.is_tracing():
+            return torch.randn_like(x)
+        return self._generated_noise_like(x)
+
+    @torch.jit.unused
+    def _generated_noise_like(self, x: torch.Tensor) -> torch.Tensor:
+        return torch.randn(
+            x.shape, generator=self.noise_generator, dtype=x.dtype, device=x.device
+        )
+
     @torch.jit.ignore
     def forward(self, phone, phone_lengths, y, y_lengths, ds):  # 这里ds是id，[bs,1]
         g = self.emb_g(ds).unsqueeze(-1)  # [b, 256, 1]##1是t，广播的
@@ -979,13 +1167,13 @@ class SynthesizerTrnMs256NSFsid_nono(nn.Module):
             flow_head = torch.clamp(skip_head - 24, min=0)
             dec_head = head - int(flow_head.item())
             m_p, logs_p, x_mask = self.enc_p(phone, None, phone_lengths, flow_head)
-            z_p = (m_p + torch.exp(logs_p) * torch.randn_like(m_p) * 0.66666) * x_mask
+            z_p = (m_p + torch.exp(logs_p) * self.noise_like(m_p) * 0.66666) * x_mask
             z = self.flow(z_p, x_mask, g=g, reverse=True)
             z = z[:, :, dec_head : dec_head + length]
             x_mask = x_mask[:, :, dec_head : dec_head + length]
         else:
             m_p, logs_p, x_mask = self.enc_p(phone, None, phone_lengths)
-            z_p = (m_p + torch.exp(logs_p) * torch.randn_like(m_p) * 0.66666) * x_mask
+            z_p = (m_p + torch.exp(logs_p) * self.noise_like(m_p) * 0.66666) * x_mask
             z = self.flow(z_p, x_mask, g=g, reverse=True)
         o = self.dec(z * x_mask, g=g, n_res=return_length2)
         return o, x_mask, (z, z_p, m_p, logs_p)
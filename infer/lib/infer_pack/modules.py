@@ -224,6 +224,19 @@ class WN(torch.nn.Module):
         for l in self.res_skip_layers:
             torch.nn.utils.remove_weight_norm(l)
 
+    def fold_cond_bias(self):
+        """Move cond_layer's bias into in_layers; only valid when g is given."""
+        if self.gin_channels == 0 or self.cond_layer.bias is None:
+            return
+        for i, in_layer in enumerate(self.in_layers):
+            cond_offset = i * 2 * self.hidden_channels
+            in_layer.bias.data.add_(
+                self.cond_layer.bias.data[
+                    cond_offset : cond_offset + 2 * self.hidden_channels
+                ]
+            )
+        self.cond_layer.bias = None
+
     def __prepare_scriptable__(self):
         if self.gin_channels != 0:
             for hook in self.cond_layer._forward_pre_hooks.values():
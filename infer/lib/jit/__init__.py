@@ -20,7 +20,10 @@ def load_inputs(path, device, is_half=False):
 def benchmark(
     model, inputs_path, device=torch.device("cpu"), epoch=1000, is_half=False
 ):
-    parm = load_inputs(inputs_path, device, is_half)
+    if isinstance(inputs_path, dict):
+        parm = inputs_path
+    else:
+        parm = load_inputs(inputs_path, device, is_half)
     total_ts = 0.0
     bar = tqdm(range(epoch))
     for i in bar:
@@ -43,11 +46,23 @@ def to_jit_model(
     is_half=False,
 ):
     model = None
+    inputs = None
     if model_type.lower() == "synthesizer":
-        from .get_synthesizer import get_synthesizer
-
-        model, _ = get_synthesizer(model_path, device)
-        model.forward = model.infer
+        from .get_synthesizer import (
+            SynthesizerInfer,
+            get_synthesizer,
+            get_synthesizer_inputs,
+        )
+
+        model, cpt = get_synthesizer(model_path, device)
+        if mode == "trace":
+            # jit.trace compiles the exported ``infer`` of the submodules, so
+            # ``forward`` cannot simply be rebound to it as for scripting.
+            model = SynthesizerInfer(model)
+            if not inputs_path:
+                inputs = get_synthesizer_inputs(cpt, device=device, is_half=is_half)
+        else:
+            model.forward = model.infer
     elif model_type.lower() == "rmvpe":
         from .get_rmvpe import get_rmvpe
 
@@ -62,9 +77,13 @@ def to_jit_model(
     model = model.eval()
     model = model.half() if is_half else model.float()
     if mode == "trace":
-        assert not inputs_path
-        inputs = load_inputs(inputs_path, device, is_half)
-        model_jit = torch.jit.trace(model, example_kwarg_inputs=inputs)
+        if inputs is None:
+            assert inputs_path
+            inputs = load_inputs(inputs_path, device, is_half)
+        # The synthesizer samples noise, so re-running the trace cannot match.
+        model_jit = torch.jit.trace(
+            model, example_kwarg_inputs=inputs, check_trace=False
+        )
     elif mode == "script":
         model_jit = torch.jit.script(model)
     model_jit.to(device)
@@ -84,7 +103,10 @@ def export(
     model.eval()
     if mode == "trace":
         assert inputs is not None
-        model_jit = torch.jit.trace(model, example_kwarg_inputs=inputs)
+        # The synthesizer samples noise, so re-running the trace cannot match.
+        model_jit = torch.jit.trace(
+            model, example_kwarg_inputs=inputs, check_trace=False
+        )
     elif mode == "script":
         model_jit = torch.jit.script(model)
     model_jit.to(device)
@@ -141,23 +163,41 @@ def synthesizer_jit_export(
     save_path: str = None,
     device=torch.device("cpu"),
     is_half=False,
+    n_frames: int = 400,
 ):
+    """Export a synthesizer checkpoint to TorchScript.
+
+    ``trace`` records ``infer`` on example inputs, loaded from
+    ``inputs_path`` or drawn at random with ``n_frames`` frames.
+    """
     if not save_path:
         save_path = model_path.rstrip(".pth")
         save_path += ".half.jit" if is_half else ".jit"
     if "cuda" in str(device) and ":" not in str(device):
         device = torch.device("cuda:0")
-    from .get_synthesizer import get_synthesizer
+    from .get_synthesizer import (
+        SynthesizerInfer,
+        get_synthesizer,
+        get_synthesizer_inputs,
+    )
 
     model, cpt = get_synthesizer(model_path, device)
     assert isinstance(cpt, dict)
-    model.forward = model.infer
     inputs = None
     if mode == "trace":
-        inputs = load_inputs(inputs_path, device, is_half)
+        model = SynthesizerInfer(model)
+        if inputs_path:
+            inputs = load_inputs(inputs_path, device, is_half)
+        else:
+            inputs = get_synthesizer_inputs(cpt, n_frames, device, is_half)
+        cpt["n_frames"] = inputs["phone"].shape[1]
+    else:
+        model.forward = model.infer
     ckpt = export(model, mode, inputs, device, is_half)
     cpt.pop("weight")
     cpt["model"] = ckpt["model"]
-    cpt["device"] = device
+    cpt["mode"] = mode
+    cpt["is_half"] = is_half
+    cpt["device"] = str(device)
     save(cpt, save_path)
     return cpt
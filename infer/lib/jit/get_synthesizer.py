@@ -1,3 +1,5 @@
+from typing import Optional
+
 import torch
 
 
@@ -36,3 +38,48 @@ def get_synthesizer(pth_path, device=torch.device("cpu")):
     net_g.eval().to(device)
     net_g.remove_weight_norm()
     return net_g, cpt
+
+
+class SynthesizerInfer(torch.nn.Module):
+    """Expose ``infer`` of a synthesizer as ``forward`` for torch.jit.trace.
+
+    Only the arguments present in the example inputs are traced, so the
+    traced module keeps the positional order of ``infer`` for both the f0
+    and the ``_nono`` models.
+    """
+
+    def __init__(self, net_g):
+        super(SynthesizerInfer, self).__init__()
+        self.net_g = net_g
+        self.if_f0 = hasattr(net_g.enc_p, "emb_pitch")
+
+    def forward(
+        self,
+        phone: torch.Tensor,
+        phone_lengths: torch.Tensor,
+        pitch: Optional[torch.Tensor] = None,
+        nsff0: Optional[torch.Tensor] = None,
+        sid: Optional[torch.Tensor] = None,
+    ):
+        if self.if_f0:
+            return self.net_g.infer(phone, phone_lengths, pitch, nsff0, sid)
+        return self.net_g.infer(phone, phone_lengths, sid)
+
+
+def get_synthesizer_inputs(
+    cpt, n_frames=400, device=torch.device("cpu"), is_half=False
+):
+    """Random example inputs for ``infer``, keyed like ``SynthesizerInfer``."""
+    dtype = torch.float16 if is_half else torch.float32
+    phone_dim = 256 if cpt.get("version", "v1") == "v1" else 768
+    inputs = {
+        "phone": torch.randn(1, n_frames, phone_dim, dtype=dtype, device=device),
+        "phone_lengths": torch.tensor([n_frames], dtype=torch.long, device=device),
+    }
+    if cpt.get("f0", 1) == 1:
+        inputs["pitch"] = torch.randint(
+            1, 256, (1, n_frames), dtype=torch.long, device=device
+        )
+        inputs["nsff0"] = (torch.rand(1, n_frames, device=device) * 300 + 80).to(dtype)
+    inputs["sid"] = torch.tensor([0], dtype=torch.long, device=device)
+    return inputs
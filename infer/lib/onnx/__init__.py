@@ -0,0 +1,160 @@
+import inspect
+import json
+import os
+
+import numpy as np
+import torch
+
+# Newer torch releases default to the dynamo exporter, which cannot keep
+# the relative attention length symbolic; stay on the TorchScript exporter.
+_export_kwargs = (
+    {"dynamo": False}
+    if "dynamo" in inspect.signature(torch.onnx.export).parameters
+    else {}
+)
+
+
+def get_session(
+    model_path: str,
+    device="cpu",
+    intra_op_num_threads: int = 0,
+    inter_op_num_threads: int = 1,
+):
+    """Create an onnxruntime session for ``device``.
+
+    ``privateuseone`` (torch_directml) uses DirectML; everything else runs on
+    the CPU provider. ``intra_op_num_threads=0`` lets onnxruntime use one
+    thread per physical core. The graphs here are a single chain of
+    operators, so sequential execution with one inter-op thread is fastest.
+    """
+    import onnxruntime as ort
+
+    options = ort.SessionOptions()
+    options.graph_optimization_level = ort.GraphOptimizationLevel.ORT_ENABLE_ALL
+    if "privateuseone" in str(device):
+        return ort.InferenceSession(
+            model_path, options, providers=["DmlExecutionProvider"]
+        )
+    options.execution_mode = ort.ExecutionMode.ORT_SEQUENTIAL
+    options.intra_op_num_threads = intra_op_num_threads
+    options.inter_op_num_threads = inter_op_num_threads
+    return ort.InferenceSession(model_path, options, providers=["CPUExecutionProvider"])
+
+
+def rmvpe_onnx_export(model_path: str, save_path: str = None, opset_version=17):
+    """Export the RMVPE ``E2E`` model with a dynamic frame axis.
+
+    The frame count fed to the model must stay a multiple of 32, which
+    ``RMVPE.mel2hidden`` already guarantees by padding.
+    """
+    if not save_path:
+        save_path = os.path.splitext(model_path)[0] + ".onnx"
+    from infer.lib.jit.get_rmvpe import get_rmvpe
+
+    model = get_rmvpe(model_path).float()
+    mel = torch.randn(1, 128, 320)
+    torch.onnx.export(
+        model,
+        (mel,),
+        save_path,
+        input_names=["mel"],
+        output_names=["hidden"],
+        dynamic_axes={"mel": {2: "n_frames"}, "hidden": {1: "n_frames"}},
+        opset_version=opset_version,
+        do_constant_folding=True,
+        **_export_kwargs,
+    )
+    return save_path
+
+
+def synthesizer_onnx_export(
+    model_path: str, save_path: str = None, opset_version=17, n_frames=200
+):
+    """Export ``SynthesizerTrnMs*NSFsid.infer`` with a dynamic frame axis.
+
+    The checkpoint metadata that ``VC`` needs (config, f0, version) is kept
+    in the ONNX model's metadata so the ``.pth`` is not read again.
+    """
+    if not save_path:
+        save_path = os.path.splitext(model_path)[0] + ".onnx"
+    from infer.lib.jit.get_synthesizer import get_synthesizer, get_synthesizer_inputs
+
+    net_g, cpt = get_synthesizer(model_path)
+    inputs = get_synthesizer_inputs(cpt, n_frames)
+    dynamic_axes = {
+        "phone": {1: "n_frames"},
+        "pitch": {1: "n_frames"},
+        "nsff0": {1: "n_frames"},
+        "audio": {2: "n_samples"},
+    }
+    torch.onnx.export(
+        SynthesizerOnnx(net_g),
+        # A trailing dict is passed as keyword arguments, which lets the
+        # _nono models skip pitch/nsff0 while sid stays named.
+        (inputs,),
+        save_path,
+        input_names=list(inputs.keys()),
+        output_names=["audio"],
+        dynamic_axes={
+            k: v for k, v in dynamic_axes.items() if k in inputs or k == "audio"
+        },
+        opset_version=opset_version,
+        do_constant_folding=True,
+        **_export_kwargs,
+    )
+
+    import onnx
+
+    model = onnx.load(save_path)
+    for key, value in [
+        ("config", json.dumps(cpt["config"])),
+        ("f0", str(cpt.get("f0", 1))),
+        ("version", cpt.get("version", "v1")),
+    ]:
+        prop = model.metadata_props.add()
+        prop.key, prop.value = key, value
+    onnx.save(model, save_path)
+    return save_path
+
+
+class SynthesizerOnnx(torch.nn.Module):
+    def __init__(self, net_g):
+        super(SynthesizerOnnx, self).__init__()
+        from infer.lib.jit.get_synthesizer import SynthesizerInfer
+
+        self.model = SynthesizerInfer(net_g)
+
+    def forward(self, phone, phone_lengths, pitch=None, nsff0=None, sid=None):
+        return self.model(phone, phone_lengths, pitch, nsff0, sid)[0]
+
+
+class OnnxSynthesizer:
+    """onnxruntime session with the ``infer`` interface of the torch models."""
+
+    def __init__(self, session):
+        self.session = session
+        self.input_names = [i.name for i in session.get_inputs()]
+        meta = session.get_modelmeta().custom_metadata_map
+        self.cpt = {
+            "config": json.loads(meta["config"]),
+            "f0": int(meta["f0"]),
+            "version": meta["version"],
+        }
+
+    def infer(self, *args):
+        feed = {
+            name: (arg.cpu().numpy() if torch.is_tensor(arg) else np.asarray(arg))
+            for name, arg in zip(self.input_names, args)
+        }
+        feed["phone"] = feed["phone"].astype(np.float32)
+        if "nsff0" in feed:
+            feed["nsff0"] = feed["nsff0"].astype(np.float32)
+        audio = self.session.run(["audio"], feed)[0]
+        # skip_head / return_length are not in the graph: the whole window is
+        # synthesized and the requested frames are cut out of the audio.
+        extra = args[len(self.input_names) :]
+        if len(extra) >= 2 and extra[0] is not None and extra[1] is not None:
+            head, length = int(extra[0]), int(extra[1])
+            upp = audio.shape[-1] // feed["phone"].shape[1]
+            audio = audio[..., head * upp : (head + length) * upp]
+        return torch.from_numpy(audio), None, None
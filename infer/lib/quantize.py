@@ -0,0 +1,166 @@
+"""int8 quantization of HuBERT and the synthesizer for CPU inference.
+
+Only linear layers and pointwise (kernel size 1) convolutions are
+quantized: every ``nn.Linear`` of HuBERT, and the projections of the
+synthesizer's ``TextEncoder`` and flow. Wider convolutions, the NSF
+generator and the source module stay in fp32, where int8 audibly degrades
+the output.
+
+``dynamic`` quantizes weights ahead of time and activations on the fly.
+``static`` also fixes activation ranges, which requires running the
+prepared model over calibration data before ``convert``::
+
+    prepare_synthesizer(net_g, "static")
+    for args in calibration_inputs:
+        net_g.infer(*args)
+    convert(net_g, "static")
+"""
+
+import logging
+import os
+import warnings
+
+import torch
+import torch.ao.quantization as tq
+from torch import nn
+
+logger = logging.getLogger(__name__)
+
+modes = ("dynamic", "static")
+
+
+def get_mode(config):
+    """Quantization mode ``config`` asks for, or None when running fp32."""
+    if not config.quantization or "cpu" not in str(config.device):
+        return None
+    if config.quantization == "static" and not config.quantize_calibration:
+        logger.warning("No calibration audio for static quantization, using dynamic")
+        return "dynamic"
+    return config.quantization
+
+
+class QuantLinear(nn.Module):
+    """An ``nn.Linear`` between quant stubs, optionally applied channels-first.
+
+    Pointwise ``nn.Conv1d`` layers are turned into ``channels_first``
+    instances so that both layer types share the quantized linear kernels.
+    """
+
+    def __init__(self, linear: nn.Linear, channels_first: bool = False):
+        super(QuantLinear, self).__init__()
+        self.quant = tq.QuantStub()
+        self.linear = linear
+        self.dequant = tq.DeQuantStub()
+        self.channels_first = channels_first
+
+    @classmethod
+    def from_conv(cls, conv: nn.Conv1d):
+        linear = nn.Linear(conv.in_channels, conv.out_channels, conv.bias is not None)
+        linear.weight.data.copy_(conv.weight.data.squeeze(-1))
+        if conv.bias is not None:
+            linear.bias.data.copy_(conv.bias.data)
+        return cls(linear, channels_first=True)
+
+    def forward(self, x):
+        if self.channels_first:
+            x = x.transpose(1, 2)
+        x = self.dequant(self.linear(self.quant(x)))
+        if self.channels_first:
+            x = x.transpose(1, 2)
+        return x
+
+
+def _is_pointwise_conv(module):
+    return (
+        isinstance(module, nn.Conv1d)
+        and module.kernel_size == (1,)
+        and module.groups == 1
+        and module.stride == (1,)
+        and module.padding in ((0,), "valid")
+    )
+
+
+def _wrap(root: nn.Module):
+    """Replace linear and pointwise conv layers below ``root`` in place."""
+    for name, child in list(root.named_children()):
+        if isinstance(child, nn.Linear):
+            setattr(root, name, QuantLinear(child))
+        elif _is_pointwise_conv(child):
+            setattr(root, name, QuantLinear.from_conv(child))
+        elif not isinstance(child, QuantLinear):
+            _wrap(child)
+
+
+def _prepare(model: nn.Module, roots, mode: str):
+    if mode not in modes:
+        raise ValueError("Unknown quantization mode: %s" % mode)
+    model.eval()
+    for root in roots:
+        _wrap(root)
+    if mode == "static":
+        qconfig = tq.get_default_qconfig(torch.backends.quantized.engine)
+        for module in model.modules():
+            if isinstance(module, QuantLinear):
+                module.qconfig = qconfig
+        tq.prepare(model, inplace=True)
+    return model
+
+
+def prepare_hubert(model: nn.Module, mode: str = "dynamic"):
+    # fairseq's MultiheadAttention takes a fused fast path that reads
+    # q_proj.weight etc. directly; the onnx_trace flag keeps it on the
+    # module calls so the quantized layers are actually used.
+    for module in model.modules():
+        if hasattr(module, "q_proj") and hasattr(module, "onnx_trace"):
+            module.onnx_trace = True
+    return _prepare(model, [model], mode)
+
+
+def prepare_synthesizer(net_g: nn.Module, mode: str = "dynamic"):
+    # Weight norm must be folded (prepare_for_inference) before the convs
+    # are copied into linears.
+    return _prepare(net_g, [net_g.enc_p, net_g.flow], mode)
+
+
+def convert(model: nn.Module, mode: str = "dynamic"):
+    if mode == "static":
+        return tq.convert(model, inplace=True)
+    qconfig_spec = {
+        name + ".linear": tq.default_dynamic_qconfig
+        for name, module in model.named_modules()
+        if isinstance(module, QuantLinear)
+    }
+    return tq.quantize_dynamic(model, qconfig_spec, dtype=torch.qint8, inplace=True)
+
+
+def quantize_cached(model: nn.Module, prepare_fn, mode: str, path: str, calibrate=None):
+    """Quantize ``model`` in place, reusing the state dict cached at ``path``.
+
+    ``calibrate(model)`` runs the prepared model over calibration data; it
+    is only called in ``static`` mode when there is no cached state yet.
+    """
+    prepare_fn(model, mode)
+    if os.path.exists(path):
+        logger.info("Loading quantized model: %s", path)
+        with warnings.catch_warnings():
+            # The observers never saw data; the cached state holds the ranges.
+            warnings.simplefilter("ignore")
+            convert(model, mode)
+        return load(model, path)
+    if mode == "static":
+        with torch.no_grad():
+            calibrate(model)
+    convert(model, mode)
+    save(model, path)
+    return model
+
+
+def load(model: nn.Module, path: str):
+    """Load a state dict saved from a model quantized the same way."""
+    model.load_state_dict(torch.load(path, map_location="cpu"))
+    return model.eval()
+
+
+def save(model: nn.Module, path: str):
+    torch.save(model.state_dict(), path)
+    logger.info("Saved quantized model: %s", path)
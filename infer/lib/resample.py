@@ -0,0 +1,98 @@
+"""Sample-rate conversion shared by loading, the pipeline and streaming.
+
+``resample`` converts a whole signal with soxr at its HQ setting, the
+resampler ``librosa.resample`` uses by default, without librosa's checks
+and copies. ``ResampleStream`` converts a signal block by block: it is a
+polyphase FIR resampler whose filter is designed once per (src, dst) pair
+and cached, and its output does not depend on how the input is split into
+blocks.
+"""
+
+import math
+from functools import lru_cache
+
+import numpy as np
+import soxr
+from scipy import signal
+
+
+def resample(audio, src, dst):
+    """``audio`` [samples] at ``src`` Hz, as float32 at ``dst`` Hz."""
+    audio = np.asarray(audio, dtype=np.float32)
+    if src == dst:
+        return audio
+    return soxr.resample(audio, src, dst, quality="HQ")
+
+
+@lru_cache(maxsize=None)
+def get_filter(src, dst):
+    """(up, down, half_len, taps) of the polyphase filter from ``src`` to ``dst``.
+
+    The kaiser-windowed sinc of ``scipy.signal.resample_poly``, scaled by
+    ``up``. ``taps`` is padded at the front to a delay of whole output
+    samples, ``ceil(half_len / down)``, for ``upfirdn`` on input aligned to
+    a multiple of ``down``.
+    """
+    g = math.gcd(src, dst)
+    up, down = dst // g, src // g
+    half_len = 10 * max(up, down)
+    taps = signal.firwin(2 * half_len + 1, 1 / max(up, down), window=("kaiser", 5.0))
+    taps = np.concatenate([np.zeros(-half_len % down), taps * up])
+    taps.flags.writeable = False
+    return up, down, half_len, taps
+
+
+class ResampleStream:
+    """Resample blocks of a signal as they arrive.
+
+    ``process`` returns the output samples that the input fed so far fully
+    determines; ``flush`` returns the rest, as if the input ended with
+    zeros. Together they give ``len(input) * dst / src`` samples (rounded
+    up), the same as ``scipy.signal.resample_poly`` with this filter.
+    """
+
+    def __init__(self, src, dst):
+        self.up, self.down, self.half_len, self.taps = get_filter(src, dst)
+        self.offset = -(-self.half_len // self.down)
+        self.buffer = np.zeros(0, dtype=np.float32)
+        self.start = 0  # input index of buffer[0], a multiple of down
+        self.n_in = 0
+        self.n_out = 0
+
+    def process(self, block):
+        block = np.asarray(block, dtype=np.float32)
+        self.buffer = np.concatenate([self.buffer, block])
+        self.n_in += len(block)
+        # Output m reads inputs up to (m * down + half_len) / up.
+        end = -(-(self.n_in * self.up - self.half_len) // self.down)
+        return self.emit(max(end, self.n_out))
+
+    def flush(self):
+        return self.emit(-(-self.n_in * self.up // self.down))
+
+    def emit(self, end):
+        if end <= self.n_out:
+            return np.zeros(0, dtype=np.float32)
+        k = self.n_out + self.offset - self.start // self.down * self.up
+        out = signal.upfirdn(self.taps, self.buffer, self.up, self.down)
+        out = out[k : k + end - self.n_out].astype(np.float32)
+        self.n_out = end
+        # Keep the inputs that outputs from n_out on still read.
+        first = max((self.n_out * self.down - self.half_len) // self.up, self.start)
+        first -= first % self.down
+        self.buffer = self.buffer[first - self.start :]
+        self.start = first
+        return out
+
+
+def resample_blocks(blocks, src, dst):
+    """Resample an iterable of blocks through one ``ResampleStream``."""
+    if src == dst:
+        yield from blocks
+        return
+    stream = ResampleStream(src, dst)
+    for block in blocks:
+        out = stream.process(block)
+        if len(out):
+            yield out
+    yield stream.flush()
@@ -0,0 +1,91 @@
+"""kNN retrieval of voice features from a faiss index.
+
+``Pipeline.vc`` replaces part of each HuBERT frame with a blend of the ``k``
+nearest frames of the voice's training set, weighted by their inverse squared
+distance. ``retrieve`` runs that blend as one weighted gather
+(``embedding_bag``), without the ``[frames, k, channels]`` array of the
+neighbours. ``build_index`` trains the CPU index types compared by
+``infer.lib.bench.index``, and ``set_search_params`` sets how much of an
+index a search visits.
+"""
+
+import faiss
+import numpy as np
+import torch
+import torch.nn.functional as F
+
+index_types = ["flat", "ivf_flat", "ivf_fp16", "ivf_pq", "hnsw"]
+
+
+def set_threads(n_threads):
+    """OpenMP threads of faiss searches and training; 0 keeps the default."""
+    if n_threads:
+        faiss.omp_set_num_threads(n_threads)
+
+
+def default_n_list(n):
+    # The rule of RVC's own index training, at least one list.
+    return max(min(int(16 * np.sqrt(n)), n // 39), 1)
+
+
+def index_factory_string(kind, n, dim, n_list=None, pq_m=None, hnsw_m=32):
+    n_list = n_list or default_n_list(n)
+    if kind == "flat":
+        return "Flat"
+    if kind == "ivf_flat":
+        return "IVF%d,Flat" % n_list
+    if kind == "ivf_fp16":
+        # Half the size of ivf_flat, with the features stored as float16.
+        return "IVF%d,SQfp16" % n_list
+    if kind == "ivf_pq":
+        # 4-bit fast-scan codes, searched with SIMD lookups on the CPU.
+        return "IVF%d,PQ%dx4fs" % (n_list, pq_m or dim // 4)
+    if kind == "hnsw":
+        return "HNSW%d,Flat" % hnsw_m
+    raise ValueError("Unknown index type %s, use one of %s" % (kind, index_types))
+
+
+def set_search_params(index, nprobe=None, ef_search=None):
+    """Set ``nprobe`` of IVF indices and ``efSearch`` of HNSW ones, if given."""
+    params = faiss.ParameterSpace()
+    for name, value in [("nprobe", nprobe), ("efSearch", ef_search)]:
+        if value is None:
+            continue
+        try:
+            params.set_index_parameter(index, name, value)
+        except RuntimeError:
+            pass  # not this kind of index
+    return index
+
+
+def build_index(feats, kind="ivf_flat", n_list=None, pq_m=None, hnsw_m=32):
+    """Train an index of ``kind`` on the float32 ``feats`` [n, dim] and add them."""
+    feats = np.ascontiguousarray(feats, dtype=np.float32)
+    n, dim = feats.shape
+    index = faiss.index_factory(
+        dim, index_factory_string(kind, n, dim, n_list, pq_m, hnsw_m)
+    )
+    index.train(feats)
+    batch_size_add = 8192
+    for i in range(0, n, batch_size_add):
+        index.add(feats[i : i + batch_size_add])
+    return index
+
+
+def retrieve(index, big_npy, npy, k=8):
+    """Inverse-square-distance blend of the ``k`` nearest rows of ``big_npy``.
+
+    ``npy`` are float32 query frames [frames, dim]; the result is a float32
+    tensor of the same shape. Neighbours an IVF search could not fill (at a
+    low ``nprobe``) get no weight.
+    """
+    score, ix = index.search(npy, k=k)
+    valid = ix >= 0
+    weight = np.where(valid, np.square(1 / np.maximum(score, 1e-12)), 0)
+    weight /= np.maximum(weight.sum(axis=1, keepdims=True), 1e-12)
+    return F.embedding_bag(
+        torch.from_numpy(np.where(valid, ix, 0)),
+        torch.from_numpy(big_npy),
+        per_sample_weights=torch.from_numpy(weight.astype(np.float32)),
+        mode="sum",
+    )
@@ -1,10 +1,13 @@
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import contextmanager
 from io import BytesIO
 import os
+import threading
 from typing import List, Optional, Tuple
 import numpy as np
 import torch
 
-from infer.lib import jit
+from infer.lib import jit, onnx
 
 try:
     # Fix "Torch not compiled with CUDA enabled"
@@ -454,7 +457,7 @@ class MelSpectrogram(torch.nn.Module):
         n_fft_new = int(np.round(self.n_fft * factor))
         win_length_new = int(np.round(self.win_length * factor))
         hop_length_new = int(np.round(self.hop_length * speed))
-        keyshift_key = str(keyshift) + "_" + str(audio.device)
+        keyshift_key = (win_length_new, str(audio.device))
         if keyshift_key not in self.hann_window:
             self.hann_window[keyshift_key] = torch.hann_window(win_length_new).to(
                 audio.device
@@ -478,7 +481,9 @@ class MelSpectrogram(torch.nn.Module):
                 center=center,
                 return_complex=True,
             )
-            magnitude = torch.sqrt(fft.real.pow(2) + fft.imag.pow(2))
+            # In place on one fresh tensor instead of four temporaries.
+            magnitude = fft.real.square()
+            magnitude.addcmul_(fft.imag, fft.imag).sqrt_()
         if keyshift != 0:
             size = self.n_fft // 2 + 1
             resize = magnitude.size(1)
@@ -493,7 +498,26 @@ class MelSpectrogram(torch.nn.Module):
 
 
 class RMVPE:
-    def __init__(self, model_path: str, is_half, device=None, use_jit=False):
+    # Frames shared by consecutive tiles, over which their salience is
+    # crossfaded. It covers the frames near the edge of a tile, where the
+    # U-Net and the BiGRU miss the context beyond it.
+    tile_overlap = 128
+    # Audio context on either side of a tile, so that the STFT windows of
+    # its edge frames are complete and its mel matches the whole input's.
+    mel_context = 4
+
+    def __init__(
+        self,
+        model_path: str,
+        is_half,
+        device=None,
+        use_jit=False,
+        use_onnx=False,
+        onnx_threads=(0, 1),
+        use_bf16=False,
+        tile_seconds=None,
+        tile_threads=1,
+    ):
         self.resample_kernel = {}
         self.resample_kernel = {}
         self.is_half = is_half
@@ -503,14 +527,21 @@ class RMVPE:
         self.mel_extractor = MelSpectrogram(
             is_half, 128, 16000, 1024, 160, None, 30, 8000
         ).to(device)
+        # DirectML always runs through onnxruntime; on CPU it is optional.
+        self.use_onnx = "privateuseone" in str(device) or (
+            use_onnx and "cpu" in str(device)
+        )
+        self.use_bf16 = use_bf16 and "cpu" in str(device) and not self.use_onnx
         if "privateuseone" in str(device):
-            import onnxruntime as ort
-
-            ort_session = ort.InferenceSession(
-                "%s/rmvpe.onnx" % os.environ["rmvpe_root"],
-                providers=["DmlExecutionProvider"],
+            self.model = onnx.get_session(
+                "%s/rmvpe.onnx" % os.environ["rmvpe_root"], device
             )
-            self.model = ort_session
+        elif self.use_onnx:
+            onnx_path = os.path.splitext(model_path)[0] + ".onnx"
+            if not os.path.exists(onnx_path):
+                logger.info("Exporting rmvpe onnx model: %s", onnx_path)
+                onnx.rmvpe_onnx_export(model_path, onnx_path)
+            self.model = onnx.get_session(onnx_path, device, *onnx_threads)
         else:
             if str(self.device) == "cuda":
                 self.device = torch.device("cuda:0")
@@ -565,6 +596,9 @@ class RMVPE:
             self.model = self.model.to(device)
         cents_mapping = 20 * np.arange(360) + 1997.3794084376191
         self.cents_mapping = np.pad(cents_mapping, (4, 4))  # 368
+        # Inputs longer than a tile run tile by tile, see infer_from_audio_tiled.
+        self.tile_frames = int(tile_seconds * 100) if tile_seconds else None
+        self.tile_threads = max(tile_threads, 1)
 
     def mel2hidden(self, mel):
         with torch.no_grad():
@@ -572,7 +606,7 @@ class RMVPE:
             n_pad = 32 * ((n_frames - 1) // 32 + 1) - n_frames
             if n_pad > 0:
                 mel = F.pad(mel, (0, n_pad), mode="constant")
-            if "privateuseone" in str(self.device):
+            if self.use_onnx:
                 onnx_input_name = self.model.get_inputs()[0].name
                 onnx_outputs_names = self.model.get_outputs()[0].name
                 hidden = self.model.run(
@@ -581,7 +615,10 @@ class RMVPE:
                 )[0]
             else:
                 mel = mel.half() if self.is_half else mel.float()
-                hidden = self.model(mel)
+                with torch.autocast("cpu", torch.bfloat16, enabled=self.use_bf16):
+                    hidden = self.model(mel)
+                if self.use_bf16:
+                    hidden = hidden.float()
             return hidden[:, :n_frames]
 
     def decode(self, hidden, thred=0.03):
@@ -596,6 +633,8 @@ class RMVPE:
         # t0 = ttime()
         if not torch.is_tensor(audio):
             audio = torch.from_numpy(audio)
+        if self.tile_frames and audio.shape[-1] // 160 + 1 > self.tile_frames:
+            return self.infer_from_audio_tiled(audio, thred=thred)
         mel = self.mel_extractor(
             audio.float().to(self.device).unsqueeze(0), center=True
         )
@@ -606,17 +645,169 @@ class RMVPE:
         # torch.cuda.synchronize()
         # t2 = ttime()
         # print(234234,hidden.device.type)
-        if "privateuseone" not in str(self.device):
+        f0 = self.hidden2f0(hidden, thred=thred)
+        # torch.cuda.synchronize()
+        # t3 = ttime()
+        # print("hmvpe:%s\t%s\t%s\t%s"%(t1-t0,t2-t1,t3-t2,t3-t0))
+        return f0
+
+    def hidden2f0(self, hidden, thred=0.03):
+        return self.decode(self.hidden2numpy(hidden), thred=thred)
+
+    def hidden2numpy(self, hidden):
+        if not self.use_onnx:
             hidden = hidden.squeeze(0).cpu().numpy()
         else:
             hidden = hidden[0]
         if self.is_half == True:
             hidden = hidden.astype("float32")
+        return hidden
 
-        f0 = self.decode(hidden, thred=thred)
-        # torch.cuda.synchronize()
-        # t3 = ttime()
-        # print("hmvpe:%s\t%s\t%s\t%s"%(t1-t0,t2-t1,t3-t2,t3-t0))
+    def tile_hidden(self, audio, start, end):
+        """Salience of mel frames [start, end) of ``audio`` as a numpy array."""
+        head = min(start, self.mel_context)
+        x = audio[(start - head) * 160 : (end + self.mel_context) * 160]
+        mel = self.mel_extractor(x.float().to(self.device).unsqueeze(0), center=True)
+        mel = mel[..., head : head + end - start]
+        return self.hidden2numpy(self.mel2hidden(mel))
+
+    def infer_from_audio_tiled(self, audio, thred=0.03):
+        """infer_from_audio in tiles of ``tile_frames``, in bounded memory.
+
+        Every block of ``tiled_hidden`` is decoded as soon as it is stitched,
+        so only the mel and salience of the tiles in flight are kept.
+        """
+        return np.concatenate(
+            [self.decode(hidden, thred=thred) for hidden in self.tiled_hidden(audio)]
+        )
+
+    def tiled_hidden(self, audio):
+        """Salience of ``audio`` in consecutive blocks, computed tile by tile.
+
+        Consecutive tiles overlap by ``tile_overlap`` frames and their salience
+        is crossfaded linearly over the overlap; a block is yielded as soon as
+        no later tile contributes to it. With ``tile_threads`` above one the
+        tiles run in that many threads.
+        """
+        if not torch.is_tensor(audio):
+            audio = torch.from_numpy(audio)
+        n_frames = audio.shape[-1] // 160 + 1
+        overlap = self.tile_overlap
+        step = self.tile_frames - overlap
+        bounds = [
+            (start, min(start + self.tile_frames, n_frames))
+            for start in range(0, max(n_frames - overlap, 1), step)
+        ]
+        fade_in = ((np.arange(overlap) + 0.5) / overlap)[:, None].astype(np.float32)
+        if self.tile_threads > 1:
+            executor = ThreadPoolExecutor(self.tile_threads)
+            hiddens = executor.map(lambda b: self.tile_hidden(audio, *b), bounds)
+        else:
+            executor = None
+            hiddens = (self.tile_hidden(audio, *b) for b in bounds)
+        tail = None
+        try:
+            for (start, end), hidden in zip(bounds, hiddens):
+                if tail is not None:
+                    hidden[:overlap] = hidden[:overlap] * fade_in + tail * (1 - fade_in)
+                keep = len(hidden) if end == n_frames else len(hidden) - overlap
+                yield hidden[:keep]
+                tail = hidden[keep:]
+        finally:
+            if executor is not None:
+                executor.shutdown()
+
+    def mel2hidden_batch(self, mel, lengths):
+        """mel2hidden of a zero-padded batch [b, 128, t], t a multiple of 32.
+
+        ``lengths`` are the frame counts each mel would be padded to alone.
+        For the eager model, the input of every convolution is zeroed past
+        each mel's length at that layer's time resolution, which is what the
+        convolution's own zero padding gives a mel run alone, and the BiGRU
+        is packed to the lengths, so every mel gets the salience it would get
+        from ``mel2hidden``.
+        """
+        with torch.no_grad():
+            mel = mel.half() if self.is_half else mel.float()
+            with torch.autocast("cpu", torch.bfloat16, enabled=self.use_bf16):
+                if isinstance(self.model, E2E) and isinstance(self.model.fc[0], BiGRU):
+                    x = mel.transpose(-1, -2).unsqueeze(1)
+                    with self.length_masks(lengths, x.shape[2]):
+                        x = self.model.cnn(self.model.unet(x))
+                    x = x.transpose(1, 2).flatten(-2)
+                    packed = nn.utils.rnn.pack_padded_sequence(
+                        x, lengths, batch_first=True, enforce_sorted=False
+                    )
+                    x, _ = nn.utils.rnn.pad_packed_sequence(
+                        self.model.fc[0].gru(packed)[0],
+                        batch_first=True,
+                        total_length=x.shape[1],
+                    )
+                    hidden = self.model.fc[1:](x)
+                else:
+                    hidden = self.model(mel)
+            if self.use_bf16:
+                hidden = hidden.float()
+            return hidden
+
+    @contextmanager
+    def length_masks(self, lengths, n_frames):
+        """Zero the input of every convolution of the U-Net and ``cnn`` past
+        ``lengths`` (at ``n_frames`` per batch row), in the calling thread."""
+        lengths = torch.tensor(lengths, device=self.device)
+        thread = threading.get_ident()
+
+        def mask(module, inputs):
+            if threading.get_ident() != thread:
+                return None
+            (x,) = inputs
+            # The U-Net pools time by powers of two; lengths are multiples of 32.
+            valid = lengths * x.shape[2] // n_frames
+            keep = torch.arange(x.shape[2], device=x.device)[None, :] < valid[:, None]
+            return (x * keep[:, None, :, None].to(x.dtype),)
+
+        handles = [
+            module.register_forward_pre_hook(mask)
+            for module in [*self.model.unet.modules(), self.model.cnn]
+            if isinstance(module, (nn.Conv2d, nn.ConvTranspose2d))
+        ]
+        try:
+            yield
+        finally:
+            for handle in handles:
+                handle.remove()
+
+    def infer_from_audio_batch(self, audios, thred=0.03, batch_size=16):
+        """infer_from_audio of many waveforms, in the order given.
+
+        The waveforms are sorted by length and run ``batch_size`` at a time
+        through the U-Net and BiGRU, each masked to its own length (see
+        ``mel2hidden_batch``), then each F0 is decoded at its own length.
+        """
+        mels = []
+        for audio in audios:
+            if not torch.is_tensor(audio):
+                audio = torch.from_numpy(audio)
+            mels.append(
+                self.mel_extractor(
+                    audio.float().to(self.device).unsqueeze(0), center=True
+                )
+            )
+        if self.use_onnx:
+            # The exported graph has a batch of one.
+            return [self.hidden2f0(self.mel2hidden(mel), thred) for mel in mels]
+        f0 = [None] * len(mels)
+        order = sorted(range(len(mels)), key=lambda i: mels[i].shape[-1])
+        for start in range(0, len(order), batch_size):
+            batch = order[start : start + batch_size]
+            n_frames = [mels[i].shape[-1] for i in batch]
+            lengths = [32 * ((n - 1) // 32 + 1) for n in n_frames]
+            mel = mels[batch[0]].new_zeros(len(batch), 128, max(lengths))
+            for j, i in enumerate(batch):
+                mel[j, :, : n_frames[j]] = mels[i][0]
+            hidden = self.mel2hidden_batch(mel, lengths)
+            for j, i in enumerate(batch):
+                f0[i] = self.hidden2f0(hidden[j : j + 1, : n_frames[j]], thred)
         return f0
 
     def to_local_average_cents(self, salience, thred=0.05):
@@ -0,0 +1,171 @@
+"""Build the faiss index of a voice from its training clips.
+
+The HuBERT features of every clip in ``--train-data`` (the output of
+``vc_model/arrange_data.py``) are extracted as inference extracts them
+(high-passed, 16 kHz, layer 9 through ``final_proj`` for v1 voices and layer
+12 for v2), then an index of ``--type`` is trained on them (see
+``infer.lib.retrieval``): ``ivf_fp16`` is half the size of ``ivf_flat`` and
+``ivf_pq`` about a sixteenth, at some recall. The index is written to
+``index_root`` and recorded in its ``manifest.json``, which
+``get_index_path_from_model`` reads instead of walking ``index_root``:
+
+    python -m infer.modules.vc.build_index --name mahindasiri_thero_3 --train-data vc_model/train_data --version v2 --type ivf_flat
+
+``--scan`` records the indices already in ``index_root`` (those built
+elsewhere) for the voices in ``weight_root``, matched by name as before.
+"""
+
+import argparse
+import logging
+import os
+import sys
+
+import faiss
+import numpy as np
+from scipy import signal
+
+from configs.config import Config
+from infer.lib import retrieval
+from infer.lib.audio import load_audio
+from infer.lib.hubert import HubertService
+from infer.modules.vc.pipeline import ah, bh
+from infer.modules.vc.utils import (
+    find_index_path,
+    load_hubert,
+    read_index_manifest,
+    write_index_manifest,
+)
+
+logger = logging.getLogger(__name__)
+
+audio_suffixes = (".wav", ".flac", ".mp3", ".ogg", ".m4a")
+
+
+def extract_train_features(config, train_data, version, batch_size=1):
+    """HuBERT features [frames, channels] of every clip in ``train_data``.
+
+    One clip at a time by default, as inference extracts them: padding a
+    batch to its longest clip changes the features of the shorter ones.
+    """
+    paths = sorted(
+        os.path.join(train_data, name)
+        for name in os.listdir(train_data)
+        if name.lower().endswith(audio_suffixes)
+    )
+    if not paths:
+        raise ValueError("No audio clips in %s" % train_data)
+    hubert_model = load_hubert(config, 9 if version == "v1" else 12)
+    service = HubertService(
+        config.device, config.is_half, config.use_bf16, batch_size=batch_size
+    )
+    feats = []
+    for i in range(0, len(paths), batch_size):
+        chunks = [
+            signal.filtfilt(bh, ah, load_audio(path, 16000)).astype(np.float32)
+            for path in paths[i : i + batch_size]
+        ]
+        for feat in service.extract(hubert_model, chunks, version):
+            feats.append(feat[0].float().cpu().numpy())
+        logger.info(
+            "Extracted %d/%d clips", min(i + batch_size, len(paths)), len(paths)
+        )
+    return np.concatenate(feats), len(paths)
+
+
+def get_index_name(name, version, factory):
+    return "added_%s_%s_%s.index" % (factory.replace(",", "_"), name, version)
+
+
+def build_voice_index(
+    config,
+    name,
+    train_data,
+    index_root,
+    version="v2",
+    kind="ivf_flat",
+    n_list=None,
+    pq_m=None,
+    hnsw_m=32,
+):
+    feats, n_clips = extract_train_features(config, train_data, version)
+    n, dim = feats.shape
+    factory = retrieval.index_factory_string(kind, n, dim, n_list, pq_m, hnsw_m)
+    logger.info("Training %s on %d frames of %d clips", factory, n, n_clips)
+    index = retrieval.build_index(feats, kind, n_list, pq_m, hnsw_m)
+    os.makedirs(os.path.join(index_root, name), exist_ok=True)
+    path = os.path.join(name, get_index_name(name, version, factory))
+    faiss.write_index(index, os.path.join(index_root, path))
+    manifest = dict(read_index_manifest(index_root))
+    manifest[name] = {
+        "path": path,
+        "type": kind,
+        "factory": factory,
+        "version": version,
+        "ntotal": int(index.ntotal),
+        "dim": dim,
+        "clips": n_clips,
+    }
+    write_index_manifest(index_root, manifest)
+    return os.path.join(index_root, path)
+
+
+def scan_indices(index_root, weight_root):
+    """Record the index found for each voice of ``weight_root`` by one walk."""
+    manifest = dict(read_index_manifest(index_root))
+    for name in sorted(os.listdir(weight_root)):
+        voice = name.split(".")[0]
+        if not name.endswith(".pth") or voice in manifest:
+            continue
+        path = find_index_path(index_root, name)
+        if path:
+            manifest[voice] = {"path": os.path.relpath(path, index_root)}
+    write_index_manifest(index_root, manifest)
+    return manifest
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split("\n")[0])
+    parser.add_argument("--name", help="Voice name, the checkpoint without .pth")
+    parser.add_argument("--train-data", default="vc_model/train_data")
+    parser.add_argument("--version", choices=["v1", "v2"], default="v2")
+    parser.add_argument("--type", choices=retrieval.index_types, default="ivf_flat")
+    parser.add_argument("--n-list", type=int, default=None, help="IVF lists")
+    parser.add_argument("--pq-m", type=int, default=None, help="PQ subquantizers")
+    parser.add_argument("--hnsw-m", type=int, default=32, help="HNSW neighbours")
+    parser.add_argument("--threads", type=int, default=0)
+    parser.add_argument(
+        "--index-root", default=os.getenv("index_root", "assets/indices")
+    )
+    parser.add_argument(
+        "--weight-root", default=os.getenv("weight_root", "assets/weights")
+    )
+    parser.add_argument(
+        "--scan", action="store_true", help="Record the indices already built"
+    )
+    args = parser.parse_args()
+    os.makedirs(args.index_root, exist_ok=True)
+    if args.scan:
+        for voice, entry in scan_indices(args.index_root, args.weight_root).items():
+            print(voice, entry["path"])
+        return
+    if not args.name:
+        parser.error("--name is required unless --scan is given")
+    retrieval.set_threads(args.threads)
+    sys.argv = sys.argv[:1]  # Config parses the command line of the web UI
+    path = build_voice_index(
+        Config(),
+        args.name,
+        args.train_data,
+        args.index_root,
+        args.version,
+        args.type,
+        args.n_list,
+        args.pq_m,
+        args.hnsw_m,
+    )
+    print(path)
+
+
+if __name__ == "__main__":
+    logging.basicConfig(level=logging.INFO)
+    main()
@@ -8,14 +8,19 @@ import soundfile as sf
 import torch
 from io import BytesIO
 
+from infer.lib import jit, onnx, quantize, resample
 from infer.lib.audio import load_audio, wav2
+from infer.lib.f0 import F0Cache
+from infer.lib.features import FeatureCache
 from infer.lib.infer_pack.models import (
     SynthesizerTrnMs256NSFsid,
     SynthesizerTrnMs256NSFsid_nono,
     SynthesizerTrnMs768NSFsid,
     SynthesizerTrnMs768NSFsid_nono,
 )
-from infer.modules.vc.pipeline import Pipeline
+from infer.modules.vc.pipeline import Pipeline, to_int16
+from infer.modules.vc.pool import Voice, VoicePool
+from infer.modules.vc.stream import StreamingConverter
 from infer.modules.vc.utils import *
 
 
@@ -30,8 +35,28 @@ class VC:
         self.if_f0 = None
         self.version = None
         self.hubert_model = None
+        # Shared by every resident voice, like hubert_model.
+        self.f0_models = {}
+        self.f0_cache = F0Cache(config.f0_cache_mb, config.f0_cache_dir)
+        self.feature_cache = None
+        if config.feature_cache_mb or config.feature_cache_dir:
+            self.feature_cache = FeatureCache(
+                config.feature_cache_mb, config.feature_cache_dir
+            )
 
         self.config = config
+        self.voices = VoicePool(config.resident_voices, config.resident_voices_mb)
+
+    def get_hubert(self):
+        # v1 voices read HuBERT layer 9 and v2 voices layer 12; a model
+        # slimmed for a v1 voice is reloaded with all 12 for a v2 one.
+        n_layers = 9 if self.version == "v1" else 12
+        if (
+            self.hubert_model is None
+            or len(self.hubert_model.encoder.layers) < n_layers
+        ):
+            self.hubert_model = load_hubert(self.config, n_layers)
+        return self.hubert_model
 
     def get_vc(self, sid, *to_return_protect):
         logger.info("Get sid: " + sid)
@@ -56,6 +81,10 @@ class VC:
                 self.hubert_model is not None
             ):  # 考虑到轮询, 需要加个判断看是否 sid 是由有模型切换到无模型的
                 logger.info("Clean model cache")
+                self.voices.clear()
+                for extractor in self.f0_models.values():
+                    extractor.close()
+                self.f0_models.clear()
                 del (self.net_g, self.n_spk, self.hubert_model, self.tgt_sr)  # ,cpt
                 self.hubert_model = self.net_g = self.n_spk = self.hubert_model = (
                     self.tgt_sr
@@ -97,36 +126,7 @@ class VC:
                 "",
                 "",
             )
-        person = f'{os.getenv("weight_root")}/{sid}'
-        logger.info(f"Loading: {person}")
-
-        self.cpt = torch.load(person, map_location="cpu")
-        self.tgt_sr = self.cpt["config"][-1]
-        self.cpt["config"][-3] = self.cpt["weight"]["emb_g.weight"].shape[0]  # n_spk
-        self.if_f0 = self.cpt.get("f0", 1)
-        self.version = self.cpt.get("version", "v1")
-
-        synthesizer_class = {
-            ("v1", 1): SynthesizerTrnMs256NSFsid,
-            ("v1", 0): SynthesizerTrnMs256NSFsid_nono,
-            ("v2", 1): SynthesizerTrnMs768NSFsid,
-            ("v2", 0): SynthesizerTrnMs768NSFsid_nono,
-        }
-
-        self.net_g = synthesizer_class.get(
-            (self.version, self.if_f0), SynthesizerTrnMs256NSFsid
-        )(*self.cpt["config"], is_half=self.config.is_half)
-
-        del self.net_g.enc_q
-
-        self.net_g.load_state_dict(self.cpt["weight"], strict=False)
-        self.net_g.eval().to(self.config.device)
-        if self.config.is_half:
-            self.net_g = self.net_g.half()
-        else:
-            self.net_g = self.net_g.float()
-
-        self.pipeline = Pipeline(self.tgt_sr, self.config)
+        self.select_vc(sid)
         n_spk = self.cpt["config"][-3]
         index = {"value": get_index_path_from_model(sid), "__type__": "update"}
         logger.info("Select index: " + index["value"])
@@ -143,6 +143,167 @@ class VC:
             else {"visible": True, "maximum": n_spk, "__type__": "update"}
         )
 
+    def select_vc(self, sid):
+        """Make the voice ``sid`` current, loading it unless it is resident."""
+        person = f'{os.getenv("weight_root")}/{sid}'
+        voice = self.voices.get(person)
+        if voice is None:
+            logger.info(f"Loading: {person}")
+            self.load_vc(person)
+            voice = Voice(
+                self.cpt,
+                self.net_g,
+                self.tgt_sr,
+                self.if_f0,
+                self.version,
+                Pipeline(
+                    self.tgt_sr,
+                    self.config,
+                    self.f0_models,
+                    self.f0_cache,
+                    self.feature_cache,
+                ),
+            )
+            self.voices.put(person, voice)
+        else:
+            logger.info(f"Using resident: {person}")
+        self.cpt = voice.cpt
+        self.net_g = voice.net_g
+        self.tgt_sr = voice.tgt_sr
+        self.if_f0 = voice.if_f0
+        self.version = voice.version
+        self.pipeline = voice.pipeline
+
+    def load_vc(self, person):
+        if self.config.use_onnx and "cpu" in str(self.config.device):
+            self.get_onnx_vc(person)
+        elif quantize.get_mode(self.config):
+            self.get_quantized_vc(person)
+        elif self.config.use_jit and not (
+            self.config.is_half and "cpu" in str(self.config.device)
+        ):
+            self.get_jit_vc(person)
+        else:
+            self.get_eager_vc(person)
+
+    def get_eager_vc(self, person):
+        # Checkpoints are converted once (see prepare_weights) to a prepared
+        # copy next to them, which is then memory-mapped without copies.
+        prepared_path = get_prepared_path_from_model(person, checkpoint_hash(person))
+        if not os.path.exists(prepared_path):
+            logger.info(f"Preparing model: {prepared_path}")
+            prepare_checkpoint(person, prepared_path)
+        self.cpt, self.net_g = load_prepared_checkpoint(
+            prepared_path, self.config.is_half
+        )
+        self.tgt_sr = self.cpt["config"][-1]
+        self.if_f0 = self.cpt.get("f0", 1)
+        self.version = self.cpt.get("version", "v1")
+
+        self.net_g.to(self.config.device)
+        if self.config.is_half:
+            self.net_g = self.net_g.half()
+        else:
+            self.net_g = self.net_g.float()
+
+    def get_jit_vc(self, person):
+        # Scripted models are cached next to the checkpoint, keyed by its
+        # content hash and the target device, and exported on first use.
+        device = self.config.device
+        if str(device) == "cuda":
+            device = torch.device("cuda:0")
+        jit_path = get_jit_path_from_model(
+            person, checkpoint_hash(person), device, self.config.is_half
+        )
+        if os.path.exists(jit_path):
+            logger.info(f"Loading jit model: {jit_path}")
+            self.cpt = jit.load(jit_path)
+        else:
+            logger.info(f"Exporting jit model: {jit_path}")
+            self.cpt = jit.synthesizer_jit_export(
+                person,
+                "script",
+                None,
+                save_path=jit_path,
+                device=device,
+                is_half=self.config.is_half,
+            )
+        self.tgt_sr = self.cpt["config"][-1]
+        self.if_f0 = self.cpt.get("f0", 1)
+        self.version = self.cpt.get("version", "v1")
+        self.net_g = torch.jit.load(BytesIO(self.cpt["model"]), map_location=device)
+        self.net_g.eval()
+
+    def get_quantized_vc(self, person):
+        self.get_eager_vc(person)
+        mode = quantize.get_mode(self.config)
+        quantize.quantize_cached(
+            self.net_g,
+            quantize.prepare_synthesizer,
+            mode,
+            get_quantized_path_from_model(
+                person,
+                checkpoint_hash(person),
+                mode,
+                self.config.quantize_calibration,
+            ),
+            self.calibrate_vc,
+        )
+
+    def calibrate_vc(self, net_g):
+        # Runs the regular pipeline so the flow sees real HuBERT features
+        # and F0 of our own segments. The voice's own pipeline is built once
+        # it is loaded, so this one shares the F0 extractors and caches.
+        self.get_hubert()
+        pipeline = Pipeline(
+            self.tgt_sr,
+            self.config,
+            self.f0_models,
+            self.f0_cache,
+            self.feature_cache,
+        )
+        for path in self.config.quantize_calibration:
+            logger.info(f"Calibrating on: {path}")
+            audio = load_audio(path, 16000)
+            audio_max = np.abs(audio).max() / 0.95
+            if audio_max > 1:
+                audio /= audio_max
+            pipeline.pipeline(
+                self.hubert_model,
+                net_g,
+                0,
+                audio,
+                path,
+                [0, 0, 0],
+                0,
+                "rmvpe",
+                "",
+                0,
+                self.if_f0,
+                3,
+                self.tgt_sr,
+                0,
+                1,
+                self.version,
+                0.33,
+            )
+
+    def get_onnx_vc(self, person):
+        # Exported once per checkpoint content; the graph is device independent.
+        onnx_path = get_onnx_path_from_model(person, checkpoint_hash(person))
+        if not os.path.exists(onnx_path):
+            logger.info(f"Exporting onnx model: {onnx_path}")
+            onnx.synthesizer_onnx_export(person, onnx_path)
+        logger.info(f"Loading onnx model: {onnx_path}")
+        self.net_g = onnx.OnnxSynthesizer(
+            onnx.get_session(onnx_path, self.config.device, *self.config.onnx_threads)
+        )
+        self.net_g.nbytes = os.path.getsize(onnx_path)
+        self.cpt = self.net_g.cpt
+        self.tgt_sr = self.cpt["config"][-1]
+        self.if_f0 = self.cpt.get("f0", 1)
+        self.version = self.cpt.get("version", "v1")
+
     def vc_single(
         self,
         sid,
@@ -157,19 +318,21 @@ class VC:
         resample_sr,
         rms_mix_rate,
         protect,
+        model=None,
     ):
         if input_audio_path is None:
             return "You need to upload an audio", None
         f0_up_key = int(f0_up_key)
         try:
+            if model:
+                self.select_vc(model)
             audio = load_audio(input_audio_path, 16000)
             audio_max = np.abs(audio).max() / 0.95
             if audio_max > 1:
                 audio /= audio_max
             times = [0, 0, 0]
 
-            if self.hubert_model is None:
-                self.hubert_model = load_hubert(self.config)
+            self.get_hubert()
 
             if file_index:
                 file_index = (
@@ -224,6 +387,65 @@ class VC:
             logger.warning(info)
             return info, (None, None)
 
+    def vc_stream(
+        self,
+        sid,
+        input_audio,
+        f0_up_key,
+        f0_method,
+        file_index,
+        index_rate,
+        filter_radius,
+        protect,
+        block=1.0,
+        model=None,
+        input_sr=16000,
+        resample_sr=0,
+    ):
+        """Convert ``input_audio`` block by block, yielding (sr, int16 audio).
+
+        ``input_audio`` is a file path or an iterable of float blocks at
+        ``input_sr``, for example from a microphone. Unlike ``vc_single`` the
+        loudness is not matched to the input (rms_mix_rate 1). Blocks at other
+        rates than 16 kHz, and the output when ``resample_sr`` is set, go
+        through ``infer.lib.resample.ResampleStream``.
+        """
+        if model:
+            self.select_vc(model)
+        self.get_hubert()
+        if isinstance(input_audio, str):
+            audio = load_audio(input_audio, 16000)
+            audio_max = np.abs(audio).max() / 0.95
+            if audio_max > 1:
+                audio /= audio_max
+            step = int(block * 16000)
+            input_audio = (audio[i : i + step] for i in range(0, len(audio), step))
+        else:
+            input_audio = resample.resample_blocks(input_audio, input_sr, 16000)
+        index, big_npy = self.pipeline.load_index(file_index, index_rate)
+        converter = StreamingConverter(
+            self.pipeline,
+            self.hubert_model,
+            self.net_g,
+            sid,
+            self.if_f0,
+            self.version,
+            self.tgt_sr,
+            int(f0_up_key),
+            f0_method,
+            index,
+            big_npy,
+            index_rate,
+            filter_radius,
+            protect,
+            block,
+        )
+        tgt_sr = resample_sr if self.tgt_sr != resample_sr >= 16000 else self.tgt_sr
+        for audio_opt in resample.resample_blocks(
+            converter.stream(input_audio), self.tgt_sr, tgt_sr
+        ):
+            yield tgt_sr, (np.clip(audio_opt, -1, 1) * 32767).astype(np.int16)
+
     def vc_multi(
         self,
         sid,
@@ -240,6 +462,7 @@ class VC:
         rms_mix_rate,
         protect,
         format1,
+        model=None,
     ):
         try:
             dir_path = (
@@ -273,16 +496,22 @@ class VC:
                     resample_sr,
                     rms_mix_rate,
                     protect,
+                    model,
                 )
                 if "Success" in info:
                     try:
                         tgt_sr, audio_opt = opt
+                        if audio_opt.dtype == np.float32 and format1 == "flac":
+                            audio_opt = to_int16(audio_opt)  # no float FLAC
+                        # float32 output (config.output_float) stays float
+                        subtype = "FLOAT" if audio_opt.dtype == np.float32 else None
                         if format1 in ["wav", "flac"]:
                             sf.write(
                                 "%s/%s.%s"
                                 % (opt_root, os.path.basename(path), format1),
                                 audio_opt,
                                 tgt_sr,
+                                subtype=subtype,
                             )
                         else:
                             path = "%s/%s.%s" % (
@@ -291,7 +520,13 @@ class VC:
                                 format1,
                             )
                             with BytesIO() as wavf:
-                                sf.write(wavf, audio_opt, tgt_sr, format="wav")
+                                sf.write(
+                                    wavf,
+                                    audio_opt,
+                                    tgt_sr,
+                                    format="wav",
+                                    subtype=subtype,
+                                )
                                 wavf.seek(0, 0)
                                 with open(path, "wb") as outf:
                                     wav2(wavf, outf, format1)
@@ -5,65 +5,73 @@ import logging
 
 logger = logging.getLogger(__name__)
 
-from functools import lru_cache
 from time import time as ttime
 
 import faiss
 import librosa
 import numpy as np
-import parselmouth
-import pyworld
 import torch
 import torch.nn.functional as F
-import torchcrepe
 from scipy import signal
 
+from infer.lib import quantize, resample, retrieval
+from infer.lib.f0 import F0Cache, get_extractor
+from infer.lib.features import FeatureCache
+from infer.lib.hubert import HubertService
+from infer.lib.infer_pack.models import set_noise_generator
+
 now_dir = os.getcwd()
 sys.path.append(now_dir)
 
 bh, ah = signal.butter(N=5, Wn=48, btype="high", fs=16000)
 
-input_audio_path2wav = {}
-
-
-@lru_cache
-def cache_harvest_f0(input_audio_path, fs, f0max, f0min, frame_period):
-    audio = input_audio_path2wav[input_audio_path]
-    f0, t = pyworld.harvest(
-        audio,
-        fs=fs,
-        f0_ceil=f0max,
-        f0_floor=f0min,
-        frame_period=frame_period,
-    )
-    f0 = pyworld.stonemask(audio, f0, t, fs)
-    return f0
 
+def change_rms(data1, sr1, data2, sr2, rate, block_size=1 << 16):
+    """Mix the volume envelope of ``data1`` into ``data2`` by ``1 - rate``, in place.
 
-def change_rms(data1, sr1, data2, sr2, rate):  # 1是输入音频，2是输出音频,rate是2的占比
-    # print(data1.max(),data2.max())
-    rms1 = librosa.feature.rms(
+    The half-second RMS frames of both are interpolated, turned into a gain
+    and applied ``block_size`` samples at a time, so no full-length
+    temporaries are made.
+    """
+    # 1是输入音频，2是输出音频,rate是2的占比
+    (rms1,) = librosa.feature.rms(
         y=data1, frame_length=sr1 // 2 * 2, hop_length=sr1 // 2
     )  # 每半秒一个点
-    rms2 = librosa.feature.rms(y=data2, frame_length=sr2 // 2 * 2, hop_length=sr2 // 2)
-    rms1 = torch.from_numpy(rms1)
-    rms1 = F.interpolate(
-        rms1.unsqueeze(0), size=data2.shape[0], mode="linear"
-    ).squeeze()
-    rms2 = torch.from_numpy(rms2)
-    rms2 = F.interpolate(
-        rms2.unsqueeze(0), size=data2.shape[0], mode="linear"
-    ).squeeze()
-    rms2 = torch.max(rms2, torch.zeros_like(rms2) + 1e-6)
-    data2 *= (
-        torch.pow(rms1, torch.tensor(1 - rate))
-        * torch.pow(rms2, torch.tensor(rate - 1))
-    ).numpy()
+    (rms2,) = librosa.feature.rms(
+        y=data2, frame_length=sr2 // 2 * 2, hop_length=sr2 // 2
+    )
+    # Frame positions as F.interpolate(mode="linear") spreads them over data2.
+    n = len(data2)
+    for start in range(0, n, block_size):
+        x = np.arange(start, min(start + block_size, n)) + 0.5
+        gain = np.power(
+            np.interp(x * len(rms1) / n - 0.5, np.arange(len(rms1)), rms1), 1 - rate
+        )
+        gain *= np.power(
+            np.maximum(
+                np.interp(x * len(rms2) / n - 0.5, np.arange(len(rms2)), rms2), 1e-6
+            ),
+            rate - 1,
+        )
+        data2[start : start + block_size] *= gain
     return data2
 
 
+def to_int16(audio):
+    """``audio`` scaled to int16, normalised to a peak of 0.99 if it clips."""
+    audio_max = max(audio.max(), -audio.min()) / 0.99
+    max_int16 = 32768
+    if audio_max > 1:
+        max_int16 /= audio_max
+    return np.multiply(
+        audio, max_int16, out=np.empty(audio.shape, np.int16), casting="unsafe"
+    )
+
+
 class Pipeline(object):
-    def __init__(self, tgt_sr, config):
+    def __init__(
+        self, tgt_sr, config, f0_models=None, f0_cache=None, feature_cache=None
+    ):
         self.x_pad, self.x_query, self.x_center, self.x_max, self.is_half = (
             config.x_pad,
             config.x_query,
@@ -80,6 +88,50 @@ class Pipeline(object):
         self.t_center = self.sr * self.x_center  # 查询切点位置
         self.t_max = self.sr * self.x_max  # 免查询时长阈值
         self.device = config.device
+        self.harvest_workers = min(config.harvest_workers, config.n_cpu)
+        self.rmvpe_tile_seconds = config.rmvpe_tile_seconds
+        self.rmvpe_tile_threads = config.rmvpe_tile_threads
+        # F0 extractors by method and their results, shared by the pipelines
+        # of all resident voices.
+        self.f0_models = {} if f0_models is None else f0_models
+        if f0_cache is None:
+            f0_cache = F0Cache(config.f0_cache_mb, config.f0_cache_dir)
+        self.f0_cache = f0_cache
+        if feature_cache is None and (
+            config.feature_cache_mb or config.feature_cache_dir
+        ):
+            feature_cache = FeatureCache(
+                config.feature_cache_mb, config.feature_cache_dir
+            )
+        self.feature_cache = feature_cache
+        self.use_onnx = config.use_onnx
+        self.onnx_threads = config.onnx_threads
+        # int8 layers do not accept bf16 activations, so quantization wins.
+        self.use_bf16 = (
+            config.use_bf16
+            and "cpu" in str(self.device)
+            and not quantize.get_mode(config)
+        )
+        self.noise_seed = config.noise_seed
+        # Seeded before each chunk; a private generator leaves the global
+        # RNG to whatever else draws from it.
+        self.noise_generator = (
+            None if self.noise_seed is None else torch.Generator(self.device)
+        )
+        self.output_float = config.output_float
+        self.index_nprobe = config.index_nprobe
+        self.index_ef_search = config.index_ef_search
+        retrieval.set_threads(config.index_threads)
+        self.hubert = HubertService(
+            self.device,
+            self.is_half,
+            self.use_bf16,
+            config.hubert_batch_size,
+            config.hubert_bucket_seconds,
+        )
+
+    def autocast(self):
+        return torch.autocast("cpu", torch.bfloat16, enabled=self.use_bf16)
 
     def get_f0(
         self,
@@ -90,75 +142,41 @@ class Pipeline(object):
         f0_method,
         filter_radius,
         inp_f0=None,
+        cache=True,
     ):
-        global input_audio_path2wav
-        time_step = self.window / self.sr * 1000
         f0_min = 50
         f0_max = 1100
         f0_mel_min = 1127 * np.log(1 + f0_min / 700)
         f0_mel_max = 1127 * np.log(1 + f0_max / 700)
-        if f0_method == "pm":
-            f0 = (
-                parselmouth.Sound(x, self.sr)
-                .to_pitch_ac(
-                    time_step=time_step / 1000,
-                    voicing_threshold=0.6,
-                    pitch_floor=f0_min,
-                    pitch_ceiling=f0_max,
-                )
-                .selected_array["frequency"]
-            )
-            pad_size = (p_len - len(f0) + 1) // 2
-            if pad_size > 0 or p_len - len(f0) - pad_size > 0:
-                f0 = np.pad(
-                    f0, [[pad_size, p_len - len(f0) - pad_size]], mode="constant"
-                )
-        elif f0_method == "harvest":
-            input_audio_path2wav[input_audio_path] = x.astype(np.double)
-            f0 = cache_harvest_f0(input_audio_path, self.sr, f0_max, f0_min, 10)
-            if filter_radius > 2:
-                f0 = signal.medfilt(f0, 3)
-        elif f0_method == "crepe":
-            model = "full"
-            # Pick a batch size that doesn't cause memory errors on your gpu
-            batch_size = 512
-            # Compute pitch using first gpu
-            audio = torch.tensor(np.copy(x))[None].float()
-            f0, pd = torchcrepe.predict(
-                audio,
-                self.sr,
-                self.window,
-                f0_min,
-                f0_max,
-                model,
-                batch_size=batch_size,
+        if f0_method not in self.f0_models:
+            self.f0_models[f0_method] = get_extractor(
+                f0_method,
+                sr=self.sr,
+                window=self.window,
+                f0_min=f0_min,
+                f0_max=f0_max,
                 device=self.device,
-                return_periodicity=True,
+                is_half=self.is_half,
+                use_onnx=self.use_onnx,
+                onnx_threads=self.onnx_threads,
+                use_bf16=self.use_bf16,
+                workers=self.harvest_workers,
+                tile_seconds=self.rmvpe_tile_seconds,
+                tile_threads=self.rmvpe_tile_threads,
             )
-            pd = torchcrepe.filter.median(pd, 3)
-            f0 = torchcrepe.filter.mean(f0, 3)
-            f0[pd < 0.1] = 0
-            f0 = f0[0].cpu().numpy()
-        elif f0_method == "rmvpe":
-            if not hasattr(self, "model_rmvpe"):
-                from infer.lib.rmvpe import RMVPE
+        extractor = self.f0_models[f0_method]
+        # The cached F0 is before transposition, so it is shared by every
+        # voice, index rate and pitch shift the audio is converted with.
+        # Streaming windows never repeat, so they bypass it (cache=False).
+        key = self.f0_cache.key(x, extractor.params(filter_radius)) if cache else None
+        f0_hz = self.f0_cache.get(key) if cache else None
+        if f0_hz is None:
+            extractor.warmup()
+            f0_hz = extractor.extract(x, p_len, filter_radius)
+            if cache:
+                self.f0_cache.put(key, f0_hz)
 
-                logger.info(
-                    "Loading rmvpe model,%s" % "%s/rmvpe.pt" % os.environ["rmvpe_root"]
-                )
-                self.model_rmvpe = RMVPE(
-                    "%s/rmvpe.pt" % os.environ["rmvpe_root"],
-                    is_half=self.is_half,
-                    device=self.device,
-                )
-            f0 = self.model_rmvpe.infer_from_audio(x, thred=0.03)
-
-            if "privateuseone" in str(self.device):  # clean ortruntime memory
-                del self.model_rmvpe.model
-                del self.model_rmvpe
-                logger.info("Cleaning ortruntime memory")
-
-        f0 *= pow(2, f0_up_key / 12)
+        f0 = f0_hz * pow(2, f0_up_key / 12)
         # with open("test.txt","w")as f:f.write("\n".join([str(i)for i in f0.tolist()]))
         tf0 = self.sr // self.window  # 每秒f0点数
         if inp_f0 is not None:
@@ -183,6 +201,68 @@ class Pipeline(object):
         f0_coarse = np.rint(f0_mel).astype(np.int32)
         return f0_coarse, f0bak  # 1-0
 
+    def load_index(self, file_index, index_rate):
+        if (
+            file_index != ""
+            # and file_big_npy != ""
+            # and os.path.exists(file_big_npy) == True
+            and os.path.exists(file_index)
+            and index_rate != 0
+        ):
+            try:
+                index = faiss.read_index(file_index)
+                # big_npy = np.load(file_big_npy)
+                big_npy = index.reconstruct_n(0, index.ntotal)
+                retrieval.set_search_params(
+                    index, self.index_nprobe, self.index_ef_search
+                )
+            except:
+                traceback.print_exc()
+                index = big_npy = None
+        else:
+            index = big_npy = None
+        return index, big_npy
+
+    def highpass(self, audio):
+        if self.feature_cache is None:
+            return signal.filtfilt(bh, ah, audio)
+        key = self.feature_cache.key(audio, ("highpass",))
+        filtered = self.feature_cache.get(key)
+        if filtered is None:
+            filtered = self.feature_cache.put(key, signal.filtfilt(bh, ah, audio))
+        return filtered.astype(np.float32)
+
+    def extract_features(self, model, chunks, version, cache=True):
+        """HuBERT features of each of ``chunks``, from the feature cache if enabled."""
+        feats = [None] * len(chunks)
+        keys = [None] * len(chunks)
+        # Models not from load_hubert have no cache_variant and are not cached.
+        variant = getattr(model, "cache_variant", None)
+        if cache and self.feature_cache is not None and variant is not None:
+            params = ("hubert", version, self.use_bf16) + variant
+            for i, chunk in enumerate(chunks):
+                keys[i] = self.feature_cache.key(chunk, params)
+                npy = self.feature_cache.get(keys[i])
+                if npy is not None:
+                    feats[i] = torch.from_numpy(npy).to(self.device)
+                    feats[i] = feats[i].half() if self.is_half else feats[i].float()
+        missing = [i for i in range(len(chunks)) if feats[i] is None]
+        extracted = self.hubert.extract(model, [chunks[i] for i in missing], version)
+        for i, out in zip(missing, extracted):
+            if keys[i] is not None:
+                npy = self.feature_cache.put(keys[i], out.cpu().numpy())
+                out = torch.from_numpy(npy).to(self.device).to(out.dtype)
+            feats[i] = out
+        return feats
+
+    def segment_features(self, model, chunks, version):
+        """Features of ``chunks`` in order, extracted a batch at a time."""
+        size = self.hubert.batch_size
+        for start in range(0, len(chunks), size):
+            yield from self.extract_features(
+                model, chunks[start : start + size], version
+            )
+
     def vc(
         self,
         model,
@@ -197,27 +277,18 @@ class Pipeline(object):
         index_rate,
         version,
         protect,
+        skip_head=None,
+        return_length=None,
+        feats=None,
     ):  # ,file_index,file_big_npy
-        feats = torch.from_numpy(audio0)
-        if self.is_half:
-            feats = feats.half()
-        else:
-            feats = feats.float()
-        if feats.dim() == 2:  # double channels
-            feats = feats.mean(-1)
-        assert feats.dim() == 1, feats.dim()
-        feats = feats.view(1, -1)
-        padding_mask = torch.BoolTensor(feats.shape).to(self.device).fill_(False)
-
-        inputs = {
-            "source": feats.to(self.device),
-            "padding_mask": padding_mask,
-            "output_layer": 9 if version == "v1" else 12,
-        }
+        """Convert ``audio0``, or with ``skip_head`` only the ``return_length``
+        frames after the first ``skip_head`` ones, which are context. ``feats``
+        are its HuBERT features, if already extracted."""
         t0 = ttime()
-        with torch.no_grad():
-            logits = model.extract_features(**inputs)
-            feats = model.final_proj(logits[0]) if version == "v1" else logits[0]
+        if feats is None:
+            # Streaming windows are never converted twice, so skip the cache.
+            cache = skip_head is None
+            (feats,) = self.extract_features(model, [audio0], version, cache)
         if protect < 0.5 and pitch is not None and pitchf is not None:
             feats0 = feats.clone()
         if (
@@ -232,15 +303,11 @@ class Pipeline(object):
             # _, I = index.search(npy, 1)
             # npy = big_npy[I.squeeze()]
 
-            score, ix = index.search(npy, k=8)
-            weight = np.square(1 / score)
-            weight /= weight.sum(axis=1, keepdims=True)
-            npy = np.sum(big_npy[ix] * np.expand_dims(weight, axis=2), axis=1)
-
+            retrieved = retrieval.retrieve(index, big_npy, npy, k=8)
             if self.is_half:
-                npy = npy.astype("float16")
+                retrieved = retrieved.half()
             feats = (
-                torch.from_numpy(npy).unsqueeze(0).to(self.device) * index_rate
+                retrieved.unsqueeze(0).to(self.device) * index_rate
                 + (1 - index_rate) * feats
             )
 
@@ -251,6 +318,13 @@ class Pipeline(object):
             )
         t1 = ttime()
         p_len = audio0.shape[0] // self.window
+        if skip_head is not None and feats.shape[1] < p_len:
+            # HuBERT drops the last frames of the window; repeat the last one
+            # so that the requested frames are all returned.
+            pad = feats[:, -1:].expand(-1, p_len - feats.shape[1], -1)
+            feats = torch.cat((feats, pad), 1)
+            if protect < 0.5 and pitch is not None and pitchf is not None:
+                feats0 = torch.cat((feats0, feats0[:, -1:].expand_as(pad)), 1)
         if feats.shape[1] < p_len:
             p_len = feats.shape[1]
             if pitch is not None and pitchf is not None:
@@ -265,12 +339,20 @@ class Pipeline(object):
             feats = feats * pitchff + feats0 * (1 - pitchff)
             feats = feats.to(feats0.dtype)
         p_len = torch.tensor([p_len], device=self.device).long()
-        with torch.no_grad():
+        with torch.no_grad(), self.autocast():
             hasp = pitch is not None and pitchf is not None
             arg = (feats, p_len, pitch, pitchf, sid) if hasp else (feats, p_len, sid)
+            if self.noise_generator is not None and isinstance(net_g, torch.nn.Module):
+                self.noise_generator.manual_seed(self.noise_seed)
+                set_noise_generator(net_g, self.noise_generator)
+            if skip_head is not None:
+                arg += (
+                    torch.tensor([skip_head], device=self.device).long(),
+                    torch.tensor([return_length], device=self.device).long(),
+                )
             audio1 = (net_g.infer(*arg)[0][0, 0]).data.cpu().float().numpy()
             del hasp, arg
-        del feats, p_len, padding_mask
+        del feats, p_len
         if torch.cuda.is_available():
             torch.cuda.empty_cache()
         t2 = ttime()
@@ -299,23 +381,8 @@ class Pipeline(object):
         protect,
         f0_file=None,
     ):
-        if (
-            file_index != ""
-            # and file_big_npy != ""
-            # and os.path.exists(file_big_npy) == True
-            and os.path.exists(file_index)
-            and index_rate != 0
-        ):
-            try:
-                index = faiss.read_index(file_index)
-                # big_npy = np.load(file_big_npy)
-                big_npy = index.reconstruct_n(0, index.ntotal)
-            except:
-                traceback.print_exc()
-                index = big_npy = None
-        else:
-            index = big_npy = None
-        audio = signal.filtfilt(bh, ah, audio)
+        index, big_npy = self.load_index(file_index, index_rate)
+        audio = self.highpass(audio)
         audio_pad = np.pad(audio, (self.window // 2, self.window // 2), mode="reflect")
         opt_ts = []
         if audio_pad.shape[0] > self.t_max:
@@ -368,6 +435,14 @@ class Pipeline(object):
             pitchf = torch.tensor(pitchf, device=self.device).unsqueeze(0).float()
         t2 = ttime()
         times[1] += t2 - t1
+        chunks = []
+        for t in opt_ts:
+            t = t // self.window * self.window
+            chunks.append(audio_pad[s : t + self.t_pad2 + self.window])
+            s = t
+        chunks.append(audio_pad[s:])
+        hubert_feats = self.segment_features(model, chunks, version)
+        s = 0
         for t in opt_ts:
             t = t // self.window * self.window
             if if_f0 == 1:
@@ -385,6 +460,7 @@ class Pipeline(object):
                         index_rate,
                         version,
                         protect,
+                        feats=next(hubert_feats),
                     )[self.t_pad_tgt : -self.t_pad_tgt]
                 )
             else:
@@ -402,6 +478,7 @@ class Pipeline(object):
                         index_rate,
                         version,
                         protect,
+                        feats=next(hubert_feats),
                     )[self.t_pad_tgt : -self.t_pad_tgt]
                 )
             s = t
@@ -420,6 +497,7 @@ class Pipeline(object):
                     index_rate,
                     version,
                     protect,
+                    feats=next(hubert_feats),
                 )[self.t_pad_tgt : -self.t_pad_tgt]
             )
         else:
@@ -437,20 +515,18 @@ class Pipeline(object):
                     index_rate,
                     version,
                     protect,
+                    feats=next(hubert_feats),
                 )[self.t_pad_tgt : -self.t_pad_tgt]
             )
         audio_opt = np.concatenate(audio_opt)
         if rms_mix_rate != 1:
             audio_opt = change_rms(audio, 16000, audio_opt, tgt_sr, rms_mix_rate)
         if tgt_sr != resample_sr >= 16000:
-            audio_opt = librosa.resample(
-                audio_opt, orig_sr=tgt_sr, target_sr=resample_sr
-            )
-        audio_max = np.abs(audio_opt).max() / 0.99
-        max_int16 = 32768
-        if audio_max > 1:
-            max_int16 /= audio_max
-        audio_opt = (audio_opt * max_int16).astype(np.int16)
+            audio_opt = resample.resample(audio_opt, tgt_sr, resample_sr)
+        if self.output_float:
+            audio_opt = audio_opt.astype(np.float32, copy=False)
+        else:
+            audio_opt = to_int16(audio_opt)
         del pitch, pitchf, sid
         if torch.cuda.is_available():
             torch.cuda.empty_cache()
@@ -0,0 +1,75 @@
+"""Resident synthesizers, so that ``VC`` can switch voices without reloading."""
+
+import itertools
+import logging
+from collections import OrderedDict
+
+logger = logging.getLogger(__name__)
+
+
+def model_nbytes(net_g):
+    """Memory held by the weights of a loaded synthesizer."""
+    nbytes = getattr(net_g, "nbytes", None)  # set for onnxruntime sessions
+    if nbytes is not None:
+        return nbytes
+    return sum(
+        t.numel() * t.element_size()
+        for t in itertools.chain(net_g.parameters(), net_g.buffers())
+    )
+
+
+class Voice:
+    """A loaded synthesizer with the state ``VC`` runs it with."""
+
+    def __init__(self, cpt, net_g, tgt_sr, if_f0, version, pipeline):
+        self.cpt = cpt
+        self.net_g = net_g
+        self.tgt_sr = tgt_sr
+        self.if_f0 = if_f0
+        self.version = version
+        self.pipeline = pipeline
+        self.nbytes = model_nbytes(net_g)
+
+
+class VoicePool:
+    """LRU of voices bounded by their count and by the memory of their weights.
+
+    The most recently used voice is never evicted, even when it alone is
+    over budget.
+    """
+
+    def __init__(self, max_voices=4, memory_budget_mb=2048):
+        self.max_voices = max(max_voices, 1)
+        self.memory_budget = memory_budget_mb * 1024 * 1024
+        self.voices = OrderedDict()
+
+    def __contains__(self, person):
+        return person in self.voices
+
+    def __len__(self):
+        return len(self.voices)
+
+    @property
+    def nbytes(self):
+        return sum(voice.nbytes for voice in self.voices.values())
+
+    def get(self, person):
+        voice = self.voices.get(person)
+        if voice is not None:
+            self.voices.move_to_end(person)
+        return voice
+
+    def put(self, person, voice):
+        self.voices[person] = voice
+        self.voices.move_to_end(person)
+        while len(self.voices) > 1 and (
+            len(self.voices) > self.max_voices or self.nbytes > self.memory_budget
+        ):
+            evicted, _ = self.voices.popitem(last=False)
+            logger.info("Evicting voice: %s", evicted)
+        logger.info(
+            "Resident voices: %d, %.0f MB", len(self.voices), self.nbytes / 1024 / 1024
+        )
+
+    def clear(self):
+        self.voices.clear()
@@ -0,0 +1,55 @@
+"""Pre-convert the voice checkpoints in ``weight_root`` for instant loading.
+
+Each ``<model>.pth`` is written once as ``<model>.<hash>.prepared.pth``: the
+n_spk config fixed up and the weights folded by ``prepare_for_inference``,
+stored as flat tensors that ``VC.get_vc`` memory-maps without copying.
+``get_vc`` converts missing files on first use; run this ahead of time so
+the first switch to each voice is fast too:
+
+    python -m infer.modules.vc.prepare_weights --weight-root assets/weights
+"""
+
+import argparse
+import logging
+import os
+
+from infer.modules.vc.utils import (
+    checkpoint_hash,
+    get_prepared_path_from_model,
+    prepare_checkpoint,
+)
+
+logger = logging.getLogger(__name__)
+
+# Files that VC writes next to the checkpoints.
+derived_suffixes = (".prepared.pth", ".int8.pth")
+
+
+def prepare_weights(weight_root, force=False):
+    prepared = []
+    for name in sorted(os.listdir(weight_root)):
+        if not name.endswith(".pth") or name.endswith(derived_suffixes):
+            continue
+        person = os.path.join(weight_root, name)
+        prepared_path = get_prepared_path_from_model(person, checkpoint_hash(person))
+        if force or not os.path.exists(prepared_path):
+            logger.info("Preparing %s -> %s", person, prepared_path)
+            prepare_checkpoint(person, prepared_path)
+        prepared.append(prepared_path)
+    return prepared
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split("\n")[0])
+    parser.add_argument(
+        "--weight-root", default=os.getenv("weight_root", "assets/weights")
+    )
+    parser.add_argument("--force", action="store_true", help="Rewrite existing files")
+    args = parser.parse_args()
+    for prepared_path in prepare_weights(args.weight_root, args.force):
+        print(prepared_path)
+
+
+if __name__ == "__main__":
+    logging.basicConfig(level=logging.INFO)
+    main()
@@ -0,0 +1,179 @@
+"""Block-by-block conversion with bounded latency and memory.
+
+``Pipeline.pipeline`` converts a whole file at once. ``StreamingConverter``
+instead takes 16 kHz audio as it arrives and converts it in fixed blocks.
+Each block is synthesized from a window that adds ``context`` seconds of
+already converted audio before it and a short ``lookahead`` after it; the
+synthesizer skips the context through ``skip_head`` and returns only the
+block plus a ``crossfade`` tail through ``return_length``. Consecutive blocks
+are crossfaded over that tail.
+
+The output of a block is available once ``block + crossfade + lookahead``
+seconds past its start have been fed, and the window never grows, so
+arbitrarily long inputs run in constant memory.
+"""
+
+import numpy as np
+import torch
+from scipy import signal
+
+from infer.modules.vc.pipeline import ah, bh
+
+
+class StreamingConverter:
+    def __init__(
+        self,
+        pipeline,
+        hubert_model,
+        net_g,
+        sid,
+        if_f0,
+        version,
+        tgt_sr,
+        f0_up_key=0,
+        f0_method="rmvpe",
+        index=None,
+        big_npy=None,
+        index_rate=0.75,
+        filter_radius=3,
+        protect=0.33,
+        block=1.0,
+        context=2.5,
+        lookahead=0.1,
+        crossfade=0.05,
+    ):
+        self.pipeline = pipeline
+        self.hubert_model = hubert_model
+        self.net_g = net_g
+        self.sid = torch.tensor([sid], device=pipeline.device).long()
+        self.if_f0 = if_f0
+        self.version = version
+        self.f0_up_key = f0_up_key
+        self.f0_method = f0_method
+        self.index = index
+        self.big_npy = big_npy
+        self.index_rate = index_rate
+        self.filter_radius = filter_radius
+        self.protect = protect
+        self.times = [0, 0, 0]
+
+        # Everything below is counted in 10 ms frames of the 16 kHz input.
+        self.window = pipeline.window
+        self.fps = fps = pipeline.sr // self.window
+        self.block = max(int(block * fps), 1)
+        self.context = int(context * fps)
+        self.lookahead = int(lookahead * fps)
+        self.crossfade = min(int(crossfade * fps), self.block)
+        self.samples_per_frame = tgt_sr // fps
+        fade = np.linspace(0, 1, self.crossfade * self.samples_per_frame)
+        self.fade_in = np.sin(0.5 * np.pi * fade).astype(np.float32) ** 2
+        self.fade_out = 1 - self.fade_in
+        self.reset()
+
+    def reset(self):
+        self.buffer = np.zeros(0, dtype=np.float32)
+        self.buffer_frame = 0  # input frame at the start of the buffer
+        self.position = 0  # next input frame to convert
+        self.tail = None
+
+    @property
+    def latency(self):
+        """Seconds of input needed past a block before it is emitted."""
+        return (self.block + self.crossfade + self.lookahead) / self.fps
+
+    def feed(self, audio):
+        """Add 16 kHz audio, return the converted audio of the completed blocks."""
+        self.buffer = np.concatenate([self.buffer, np.asarray(audio, np.float32)])
+        out = []
+        needed = self.block + self.crossfade + self.lookahead
+        while len(self.buffer) // self.window - self._head() >= needed:
+            out.append(self._convert(self.block, self.crossfade))
+        return self._join(out)
+
+    def flush(self):
+        """Convert what is left of the input and return the last audio."""
+        frames = -(-len(self.buffer) // self.window)
+        remaining = frames - self._head()
+        out = []
+        if remaining > 0:
+            # HuBERT needs a few frames even for the shortest input.
+            frames = max(frames, self._head() + 4)
+            self.buffer = np.pad(
+                self.buffer, (0, frames * self.window - len(self.buffer))
+            )
+            out.append(self._convert(remaining, 0, final=True))
+        elif self.tail is not None:
+            out.append(self.tail)
+        self.reset()
+        return self._join(out)
+
+    def stream(self, blocks):
+        """Convert an iterable of 16 kHz blocks, yielding audio as it is ready."""
+        for audio in blocks:
+            out = self.feed(audio)
+            if len(out):
+                yield out
+        out = self.flush()
+        if len(out):
+            yield out
+
+    def _head(self):
+        return self.position - self.buffer_frame
+
+    @staticmethod
+    def _join(out):
+        return np.concatenate(out) if out else np.zeros(0, dtype=np.float32)
+
+    def _convert(self, length, crossfade, final=False):
+        head = self._head()
+        end = (
+            None
+            if final
+            else (head + length + crossfade + self.lookahead) * self.window
+        )
+        audio = signal.filtfilt(bh, ah, self.buffer[:end]).astype(np.float32)
+        p_len = len(audio) // self.window
+        pitch = pitchf = None
+        if self.if_f0 == 1:
+            pitch, pitchf = self.pipeline.get_f0(
+                None,
+                audio,
+                p_len,
+                self.f0_up_key,
+                self.f0_method,
+                self.filter_radius,
+                cache=False,
+            )
+            device = self.pipeline.device
+            pitch = torch.tensor(pitch[:p_len], device=device).unsqueeze(0).long()
+            pitchf = torch.tensor(
+                pitchf[:p_len].astype(np.float32), device=device
+            ).unsqueeze(0)
+        out = self.pipeline.vc(
+            self.hubert_model,
+            self.net_g,
+            self.sid,
+            audio,
+            pitch,
+            pitchf,
+            self.times,
+            self.index,
+            self.big_npy,
+            self.index_rate,
+            self.version,
+            self.protect,
+            skip_head=head,
+            return_length=length + crossfade,
+        )
+        if self.tail is not None:
+            n = len(self.tail)
+            out[:n] = out[:n] * self.fade_in + self.tail * self.fade_out
+        n = crossfade * self.samples_per_frame
+        self.tail = out[len(out) - n :].copy() if n else None
+        out = out[: len(out) - n]
+
+        self.position += length
+        drop = max(self.position - self.context, 0) - self.buffer_frame
+        self.buffer = self.buffer[drop * self.window :]
+        self.buffer_frame += drop
+        return out
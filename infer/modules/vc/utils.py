@@ -1,10 +1,24 @@
 
+import hashlib
+import json
+import logging
 import os
+from functools import lru_cache
+
 import torch
 import fairseq.data.dictionary
 import torch.serialization
 from fairseq import checkpoint_utils
 
+from infer.lib import quantize
+from infer.lib.audio import load_audio
+from infer.lib.infer_pack.models import (
+    SynthesizerTrnMs256NSFsid,
+    SynthesizerTrnMs256NSFsid_nono,
+    SynthesizerTrnMs768NSFsid,
+    SynthesizerTrnMs768NSFsid_nono,
+)
+
 # Patch torch.load for PyTorch 2.6+ compatibility
 _original_torch_load = torch.load
 def patched_torch_load(*args, **kwargs):
@@ -16,13 +30,28 @@ torch.load = patched_torch_load
 torch.serialization.add_safe_globals([fairseq.data.dictionary.Dictionary])
 
 
+index_manifest_name = "manifest.json"
+
+
 def get_index_path_from_model(sid):
+    """The index of voice ``sid``: its manifest entry, else the first match of
+    a walk over ``index_root`` (see ``infer.modules.vc.build_index``)."""
+    index_root = os.getenv("index_root")
+    entry = read_index_manifest(index_root).get(sid.split(".")[0])
+    if entry is not None:
+        path = os.path.join(index_root, entry["path"])
+        if os.path.exists(path):
+            return path
+    return find_index_path(index_root, sid)
+
+
+def find_index_path(index_root, sid):
     return next(
         (
             f
             for f in [
                 os.path.join(root, name)
-                for root, _, files in os.walk(os.getenv("index_root"), topdown=False)
+                for root, _, files in os.walk(index_root, topdown=False)
                 for name in files
                 if name.endswith(".index") and "trained" not in name
             ]
@@ -32,15 +61,231 @@ def get_index_path_from_model(sid):
     )
 
 
-def load_hubert(config):
-    models, _, _ = checkpoint_utils.load_model_ensemble_and_task(
-        ["assets/hubert/hubert_base.pt"],
+def read_index_manifest(index_root):
+    """Voice name -> index entry of ``index_root``'s manifest, {} without one."""
+    path = os.path.join(index_root or "", index_manifest_name)
+    try:
+        mtime_ns = os.stat(path).st_mtime_ns
+    except OSError:
+        return {}
+    return _read_index_manifest(os.path.abspath(path), mtime_ns)
+
+
+@lru_cache(maxsize=8)
+def _read_index_manifest(path, mtime_ns):
+    with open(path, encoding="utf-8") as f:
+        return json.load(f)
+
+
+def write_index_manifest(index_root, manifest):
+    # Written whole to a temporary file and renamed, so readers never see
+    # half a manifest.
+    path = os.path.join(index_root, index_manifest_name)
+    with open(path + ".tmp", "w", encoding="utf-8") as f:
+        json.dump(manifest, f, indent=2, sort_keys=True)
+    os.replace(path + ".tmp", path)
+
+
+def checkpoint_hash(path, chunk_size=1 << 20):
+    # Hashing reads the whole checkpoint; remember the digest for as long as
+    # the file is unchanged, so switching back to a voice does not re-read it.
+    stat = os.stat(path)
+    return _checkpoint_hash(
+        os.path.abspath(path), stat.st_size, stat.st_mtime_ns, chunk_size
+    )
+
+
+@lru_cache(maxsize=None)
+def _checkpoint_hash(path, size, mtime_ns, chunk_size):
+    sha256 = hashlib.sha256()
+    with open(path, "rb") as f:
+        for chunk in iter(lambda: f.read(chunk_size), b""):
+            sha256.update(chunk)
+    return sha256.hexdigest()
+
+
+def get_jit_path_from_model(person, ckpt_hash, device, is_half):
+    device_name = str(device).replace(":", "_")
+    return "%s.%s.%s%s" % (
+        os.path.splitext(person)[0],
+        ckpt_hash[:16],
+        device_name,
+        ".half.jit" if is_half else ".jit",
+    )
+
+
+def get_onnx_path_from_model(person, ckpt_hash):
+    return "%s.%s.onnx" % (os.path.splitext(person)[0], ckpt_hash[:16])
+
+
+def get_prepared_path_from_model(person, ckpt_hash):
+    return "%s.%s.prepared.pth" % (os.path.splitext(person)[0], ckpt_hash[:16])
+
+
+synthesizer_classes = {
+    ("v1", 1): SynthesizerTrnMs256NSFsid,
+    ("v1", 0): SynthesizerTrnMs256NSFsid_nono,
+    ("v2", 1): SynthesizerTrnMs768NSFsid,
+    ("v2", 0): SynthesizerTrnMs768NSFsid_nono,
+}
+
+
+def get_synthesizer_class(cpt):
+    return synthesizer_classes.get(
+        (cpt.get("version", "v1"), cpt.get("f0", 1)), SynthesizerTrnMs256NSFsid
+    )
+
+
+def prepare_checkpoint(person, prepared_path):
+    """Save ``person`` with its n_spk config fixed and weights folded for inference."""
+    cpt = torch.load(person, map_location="cpu")
+    cpt["config"][-3] = cpt["weight"]["emb_g.weight"].shape[0]  # n_spk
+    net_g = get_synthesizer_class(cpt)(*cpt["config"], is_half=False)
+    del net_g.enc_q
+    net_g.load_state_dict(cpt["weight"], strict=False)
+    cpt["weight"] = net_g.prepare_for_inference().state_dict()
+    torch.save(cpt, prepared_path)
+    return cpt
+
+
+def load_prepared_checkpoint(prepared_path, is_half=False):
+    """Load a prepared checkpoint without copying its weights.
+
+    The file is memory-mapped and the module is built on the meta device,
+    so its parameters are the mapped tensors themselves.
+    """
+    cpt = torch.load(prepared_path, map_location="cpu", mmap=True)
+    with torch.device("meta"):
+        net_g = get_synthesizer_class(cpt)(*cpt["config"], is_half=is_half)
+    del net_g.enc_q
+    net_g.prepare_for_inference()
+    net_g.load_state_dict(cpt["weight"], assign=True)
+    return cpt, net_g.eval()
+
+
+def calibration_hash(paths):
+    """Digest of a calibration set: the content of each file, in order."""
+    sha256 = hashlib.sha256()
+    for path in paths:
+        sha256.update(checkpoint_hash(path).encode())
+    return sha256.hexdigest()
+
+
+def get_quantized_path_from_model(person, ckpt_hash, mode, calibration=()):
+    # Static models also depend on the files they were calibrated on.
+    if mode == "static":
+        mode = "static-%s" % calibration_hash(calibration)[:16]
+    return "%s.%s.%s.int8.pth" % (os.path.splitext(person)[0], ckpt_hash[:16], mode)
+
+
+def calibrate_hubert(hubert_model, paths):
+    for path in paths:
+        feats = torch.from_numpy(load_audio(path, 16000)).float().view(1, -1)
+        padding_mask = torch.zeros(feats.shape, dtype=torch.bool)
+        # Run every layer, and final_proj on the layer 9 output used by v1.
+        hubert_model.extract_features(source=feats, padding_mask=padding_mask)
+        logits = hubert_model.extract_features(
+            source=feats, padding_mask=padding_mask, output_layer=9
+        )
+        hubert_model.final_proj(logits[0])
+
+
+def get_slim_hubert_path(hubert_path, ckpt_hash, n_layers):
+    return "%s.%s.%dlayers.pth" % (
+        os.path.splitext(hubert_path)[0],
+        ckpt_hash[:16],
+        n_layers,
+    )
+
+
+def slim_hubert(hubert_model, n_layers):
+    """Keep the first ``n_layers`` transformer layers and drop the label
+    embeddings of the pretraining head, which feature extraction never uses."""
+    hubert_model.encoder.layers = hubert_model.encoder.layers[:n_layers]
+    hubert_model.label_embs_concat = None
+    return hubert_model
+
+
+def save_slim_hubert(hubert_path, slim_path, n_layers):
+    """Load the fairseq checkpoint, slim it and save what is left."""
+    from omegaconf import OmegaConf
+
+    models, cfg, task = checkpoint_utils.load_model_ensemble_and_task(
+        [hubert_path],
         suffix="",
     )
-    hubert_model = models[0]
-    hubert_model = hubert_model.to(config.device)
-    if config.is_half:
-        hubert_model = hubert_model.half()
+    hubert_model = slim_hubert(models[0], n_layers)
+    model_cfg = OmegaConf.to_container(cfg.model, resolve=True)
+    model_cfg["encoder_layers"] = n_layers
+    torch.save(
+        {
+            "cfg": model_cfg,
+            "task_cfg": OmegaConf.to_container(task.cfg, resolve=True),
+            "n_dictionaries": len(task.dictionaries),
+            "weight": hubert_model.state_dict(),
+        },
+        slim_path,
+    )
+    # No module-level logger: modules.py star-imports this file.
+    logging.getLogger(__name__).info("Saved slim hubert model: %s", slim_path)
+    return hubert_model
+
+
+def load_slim_hubert(slim_path):
+    """Build a model saved by ``save_slim_hubert`` on its memory-mapped weights."""
+    from fairseq.data import Dictionary
+    from fairseq.models.hubert.hubert import HubertModel
+    from omegaconf import OmegaConf
+
+    cpt = torch.load(slim_path, map_location="cpu", mmap=True)
+    with torch.device("meta"):
+        hubert_model = HubertModel(
+            OmegaConf.create(cpt["cfg"]),
+            OmegaConf.create(cpt["task_cfg"]),
+            [Dictionary() for _ in range(cpt["n_dictionaries"])],
+        )
+    slim_hubert(hubert_model, cpt["cfg"]["encoder_layers"])
+    hubert_model.load_state_dict(cpt["weight"], assign=True)
+    return hubert_model
+
+
+def load_hubert(config, n_layers=12):
+    """hubert_base with only the transformer layers up to ``n_layers``.
+
+    v1 voices read layer 9 and v2 voices layer 12. The slimmed weights are
+    cached next to the checkpoint, so later loads skip fairseq's checkpoint
+    loading and map the file instead of reading it.
+    """
+    hubert_path = "assets/hubert/hubert_base.pt"
+    ckpt_hash = checkpoint_hash(hubert_path)
+    slim_path = get_slim_hubert_path(hubert_path, ckpt_hash, n_layers)
+    if os.path.exists(slim_path):
+        hubert_model = load_slim_hubert(slim_path)
+    else:
+        hubert_model = save_slim_hubert(hubert_path, slim_path, n_layers)
+    mode = quantize.get_mode(config)
+    if mode:
+        hubert_model = quantize.quantize_cached(
+            hubert_model.float(),
+            quantize.prepare_hubert,
+            mode,
+            get_quantized_path_from_model(
+                slim_path, ckpt_hash, mode, config.quantize_calibration
+            ),
+            lambda model: calibrate_hubert(model, config.quantize_calibration),
+        )
     else:
-        hubert_model = hubert_model.float()
-    return hubert_model.eval()
+        hubert_model = hubert_model.to(config.device)
+        if config.is_half:
+            hubert_model = hubert_model.half()
+        else:
+            hubert_model = hubert_model.float()
+        hubert_model = hubert_model.eval()
+    # Part of the feature cache key: the features differ by checkpoint,
+    # quantization mode and precision.
+    hubert_model.cache_variant = (
+        ckpt_hash,
+        mode or "none",
+        "fp16" if config.is_half and not mode else "fp32",
+    )
+    return hubert_model
@@ -24,11 +24,16 @@ def join_segments(json_path: Path, max_speedup: float = 1.25):
 
         inputs.append(f'-i "{audio}"')
 
+        # Decode to float once, so atempo, adelay and amix all run in float
+        # and the encoder is the only step that quantizes. Float WAVs from
+        # convert_voice (output_float) pass through unchanged.
+        chain = f'[{i}:a]aformat=sample_fmts=flt'
+
         # Apply atempo only if needed
         if abs(speed - 1.0) > 0.01:
-            filters.append(f'[{i}:a]atempo={speed:.5f},adelay={delay_ms}|{delay_ms}[a{i}]')
+            filters.append(f'{chain},atempo={speed:.5f},adelay={delay_ms}|{delay_ms}[a{i}]')
         else:
-            filters.append(f'[{i}:a]adelay={delay_ms}|{delay_ms}[a{i}]')
+            filters.append(f'{chain},adelay={delay_ms}|{delay_ms}[a{i}]')
 
         mix_inputs.append(f'[a{i}]')
 
@@ -1,8 +1,13 @@
 from __future__ import annotations
 
 import argparse
+import multiprocessing
+import os
+import queue
 import subprocess
 import shutil
+import threading
+from concurrent.futures import Future, ProcessPoolExecutor
 from pathlib import Path
 
 import cv2
@@ -118,6 +123,60 @@ def _fix_inner_mouth_magenta(frame_bgr: np.ndarray, inner_mouth_mask: np.ndarray
     return np.clip(out, 0, 255).astype(np.uint8)
 
 
+def _enhance_frame(frame_bgr: np.ndarray, lip_ring_mask: np.ndarray, inner_mouth_mask: np.ndarray | None,
+                   unsharp_amount: float, unsharp_blur_sigma: float, clahe_clip: float,
+                   magenta_strength: float) -> np.ndarray:
+    """The per-frame image math, run in the worker processes once the masks are smoothed."""
+    out = _enhance_lip_ring(
+        frame_bgr, lip_ring_mask,
+        unsharp_amount=unsharp_amount,
+        unsharp_blur_sigma=unsharp_blur_sigma,
+        clahe_clip=clahe_clip
+    )
+    # Optional: inner mouth color correction (purple/magenta suppression)
+    if inner_mouth_mask is not None:
+        out = _fix_inner_mouth_magenta(out, inner_mouth_mask, strength=magenta_strength)
+    return out
+
+
+def _init_worker() -> None:
+    # One OpenCV thread per process; the pool already uses the cores.
+    cv2.setNumThreads(1)
+
+
+def _read_frames(cap: cv2.VideoCapture, frames: queue.Queue, errors: list,
+                 stop: threading.Event) -> None:
+    """Reader thread: decoded frames in order until the end or stop is set, then None."""
+    try:
+        while not stop.is_set():
+            ok, frame = cap.read()
+            if not ok:
+                break
+            frames.put(frame)
+    except Exception as e:
+        errors.append(e)
+    finally:
+        frames.put(None)
+
+
+def _write_frames(writer: cv2.VideoWriter, results: queue.Queue, pbar, errors: list) -> None:
+    """
+    Writer thread: takes frames or worker futures in frame order until None.
+    After an error it keeps draining so that the producer never blocks.
+    """
+    while True:
+        item = results.get()
+        if item is None:
+            break
+        if errors:
+            continue
+        try:
+            writer.write(item.result() if isinstance(item, Future) else item)
+            pbar.update(1)
+        except Exception as e:
+            errors.append(e)
+
+
 def _get_video_props(cap: cv2.VideoCapture) -> tuple[int, int, float]:
     w = int(cap.get(cv2.CAP_PROP_FRAME_WIDTH))
     h = int(cap.get(cv2.CAP_PROP_FRAME_HEIGHT))
@@ -154,14 +213,23 @@ def enhance_lips_in_video(
     unsharp_amount: float = 1.35,
     unsharp_blur_sigma: float = 1.2,
     clahe_clip: float = 2.0,
+    workers: int | None = None,
+    queue_size: int = 16,
 ) -> Path:
     """
     Main function you asked for.
 
+    Frames flow through a pipeline: a reader thread decodes them, FaceMesh and
+    the mask building run here in frame order (FaceMesh tracks across frames and
+    the masks are EMA-smoothed against the previous frame), a pool of worker
+    processes does the per-frame enhancement, and a writer thread encodes the
+    results in frame order. At most queue_size frames wait between stages.
+
     Args:
       input_video: path to video (e.g., wav2lip output).
       output_video: output path (mp4). If audio_source is provided, output_video is final muxed file.
       audio_source: optional path to audio (wav/m4a/mp4). If provided, ffmpeg will mux audio.
+      workers: enhancement processes (default: one per CPU but one); 0 enhances on this thread.
 
     Returns:
       Path to the final output video.
@@ -194,24 +262,45 @@ def enhance_lips_in_video(
 
     total = int(cap.get(cv2.CAP_PROP_FRAME_COUNT)) or None
 
-    with mp_face_mesh.FaceMesh(
-        static_image_mode=False,      # video tracking mode (better + faster for videos)
-        max_num_faces=1,
-        refine_landmarks=True,
-        min_detection_confidence=0.5,
-        min_tracking_confidence=0.5
-    ) as face_mesh:
-
-        pbar = tqdm(total=total, desc="Enhancing lips", unit="frame")
-        while True:
-            ok, frame = cap.read()
-            if not ok:
-                break
-
-            rgb = cv2.cvtColor(frame, cv2.COLOR_BGR2RGB)
-            res = face_mesh.process(rgb)
+    if workers is None:
+        workers = max(1, (os.cpu_count() or 1) - 1)
+    # Spawned workers: forking this process would copy the reader and writer
+    # threads' locks and the FaceMesh graph's state into the children.
+    pool = ProcessPoolExecutor(
+        workers, mp_context=multiprocessing.get_context("spawn"), initializer=_init_worker
+    ) if workers > 0 else None
+
+    frames: queue.Queue = queue.Queue(maxsize=queue_size)
+    results: queue.Queue = queue.Queue(maxsize=queue_size)
+    errors: list = []
+    stop = threading.Event()
+    pbar = tqdm(total=total, desc="Enhancing lips", unit="frame")
+    reader = threading.Thread(target=_read_frames, args=(cap, frames, errors, stop), daemon=True)
+    writer_thread = threading.Thread(target=_write_frames, args=(writer, results, pbar, errors), daemon=True)
+    reader.start()
+    writer_thread.start()
+
+    try:
+        with mp_face_mesh.FaceMesh(
+            static_image_mode=False,      # video tracking mode (better + faster for videos)
+            max_num_faces=1,
+            refine_landmarks=True,
+            min_detection_confidence=0.5,
+            min_tracking_confidence=0.5
+        ) as face_mesh:
+
+            while True:
+                frame = frames.get()
+                if frame is None or errors:
+                    break
+
+                rgb = cv2.cvtColor(frame, cv2.COLOR_BGR2RGB)
+                res = face_mesh.process(rgb)
+
+                if not res.multi_face_landmarks:
+                    results.put(frame)
+                    continue
 
-            if res.multi_face_landmarks:
                 lms = res.multi_face_landmarks[0].landmark
 
                 outer = _landmarks_to_points(lms, w, h, LIPS_OUTER)
@@ -222,27 +311,34 @@ def enhance_lips_in_video(
                 lip_ring = _ema_smooth(prev_lip_ring_mask, lip_ring, alpha=mask_smooth_alpha)
                 prev_lip_ring_mask = lip_ring
 
-                out = _enhance_lip_ring(
-                    frame, lip_ring,
-                    unsharp_amount=unsharp_amount,
-                    unsharp_blur_sigma=unsharp_blur_sigma,
-                    clahe_clip=clahe_clip
-                )
-
-                # Optional: inner mouth color correction (purple/magenta suppression)
+                inner_only = None
                 if fix_inner_mouth_purple:
                     inner_only = _soft_polygon_mask(h, w, inner, None, feather=max(11, feather - 6))
                     inner_only = _ema_smooth(prev_inner_mask, inner_only, alpha=mask_smooth_alpha)
                     prev_inner_mask = inner_only
-                    out = _fix_inner_mouth_magenta(out, inner_only, strength=magenta_strength)
-
-                frame = out
-
-            writer.write(frame)
-            pbar.update(1)
 
+                args = (frame, lip_ring, inner_only, unsharp_amount, unsharp_blur_sigma,
+                        clahe_clip, magenta_strength)
+                results.put(pool.submit(_enhance_frame, *args) if pool else _enhance_frame(*args))
+    finally:
+        # Stop the reader if we stopped early and unblock it, then let the writer finish.
+        stop.set()
+        while reader.is_alive():
+            try:
+                frames.get(timeout=0.1)
+            except queue.Empty:
+                pass
+        results.put(None)
+        writer_thread.join()
+        if pool:
+            pool.shutdown()
         pbar.close()
 
+    if errors:
+        cap.release()
+        writer.release()
+        raise errors[0]
+
     cap.release()
     writer.release()
 
@@ -262,13 +358,16 @@ def main():
     ap.add_argument("output", help="Output video (mp4)")
     ap.add_argument("--audio", default=None, help="Optional audio source (wav/m4a/mp4) to mux into output")
     ap.add_argument("--no-purple-fix", action="store_true", help="Disable inner-mouth purple suppression")
+    ap.add_argument("--workers", type=int, default=None,
+                    help="Enhancement processes (default: one per CPU but one; 0 = this thread only)")
     args = ap.parse_args()
 
     enhance_lips_in_video(
         args.input,
         args.output,
         audio_source=args.audio,
-        fix_inner_mouth_purple=not args.no_purple_fix
+        fix_inner_mouth_purple=not args.no_purple_fix,
+        workers=args.workers
     )
     print("Done:", args.output)
 
@@ -0,0 +1,45 @@
+import pytest
+import torch
+
+from infer.lib.bench.attention import reference_attention
+from infer.lib.infer_pack.attentions import MultiHeadAttention
+
+# Banded and full-matrix relative attention sum the same terms in another
+# order, so they agree to float32 rounding.
+tolerance = 1e-5
+
+
+def build_attention(window_size=10):
+    torch.manual_seed(0)
+    # Same layer shape as the TextEncoder of every RVC synthesizer.
+    return MultiHeadAttention(192, 192, 2, window_size=window_size).eval()
+
+
+def inputs(length, valid):
+    q, k, v = (torch.randn(1, 192, length) for _ in range(3))
+    x_mask = (torch.arange(length) < valid).float()[None, None]
+    return q, k, v, x_mask.unsqueeze(2) * x_mask.unsqueeze(-1)
+
+
+# Lengths shorter than the window, equal to it, and far longer, with and
+# without padding at the end.
+@pytest.mark.parametrize(
+    "length, valid", [(5, 5), (11, 11), (21, 15), (300, 300), (300, 250)]
+)
+def test_banded_relative_attention_matches_reference(length, valid):
+    attn = build_attention()
+    q, k, v, mask = inputs(length, valid)
+    with torch.no_grad():
+        expected = reference_attention(attn, q, k, v, mask)
+        output, _ = attn.attention(q, k, v, mask=mask)
+    assert (output - expected).abs().max().item() < tolerance
+
+
+def test_scripted_banded_attention_matches_reference():
+    attn = build_attention()
+    scripted = torch.jit.script(attn)
+    q, k, v, mask = inputs(120, 100)
+    with torch.no_grad():
+        expected = reference_attention(attn, q, k, v, mask)
+        output, _ = scripted.attention(q, k, v, mask=mask)
+    assert (output - expected).abs().max().item() < tolerance
@@ -0,0 +1,48 @@
+import pytest
+import torch
+
+from infer.lib.bench import (
+    FRAMES_PER_SECOND,
+    build_synthesizer,
+    snr_db,
+    synthesizer_inputs,
+)
+from infer.lib.rmvpe import E2E
+
+# bf16 keeps 8 mantissa bits. With these seeds autocast measures 30.3 dB of
+# waveform SNR on v1/40k, 50.6 dB on v2/48k and 54.7 dB on the RMVPE
+# salience; the thresholds leave headroom for other CPUs' bf16 kernels.
+waveform_snr_db = 25
+salience_snr_db = 45
+
+
+def autocast_pair(fn):
+    """The output of ``fn`` in fp32 and under bf16 autocast."""
+    outputs = []
+    for enabled in [False, True]:
+        with torch.no_grad(), torch.autocast("cpu", torch.bfloat16, enabled=enabled):
+            outputs.append(fn().float())
+    return outputs
+
+
+@pytest.mark.parametrize("version, sr", [("v1", "40k"), ("v2", "48k")])
+def test_bf16_synthesizer_waveform_snr(version, sr):
+    torch.manual_seed(0)
+    net_g, _ = build_synthesizer(version, sr)
+    args = synthesizer_inputs(version, FRAMES_PER_SECOND)
+
+    def synthesize():
+        # Same noise in both runs, so the SNR only measures bf16 error.
+        torch.manual_seed(0)
+        return net_g.infer(*args)[0]
+
+    fp32, bf16 = autocast_pair(synthesize)
+    assert snr_db(fp32, bf16) >= waveform_snr_db
+
+
+def test_bf16_rmvpe_salience_snr():
+    torch.manual_seed(0)
+    model = E2E(4, 1, (2, 2)).eval()
+    mel = torch.randn(1, 128, 128)
+    fp32, bf16 = autocast_pair(lambda: model(mel))
+    assert snr_db(fp32, bf16) >= salience_snr_db
@@ -0,0 +1,42 @@
+import numpy as np
+import torch
+
+from infer.lib.bench.rmvpe import build_rmvpe, gliding_tone
+
+# Largest difference allowed between the stitched salience and that of one
+# pass, on the frames where consecutive tiles are crossfaded. Salience is a
+# sigmoid output in [0, 1]; the crossfade measures about 5e-4 here.
+overlap_tolerance = 2e-3
+
+
+def whole_hidden(rmvpe, audio):
+    mel = rmvpe.mel_extractor(torch.from_numpy(audio)[None], center=True)
+    return rmvpe.hidden2numpy(rmvpe.mel2hidden(mel))
+
+
+def test_tiled_salience_matches_whole_input_on_overlaps():
+    rmvpe = build_rmvpe()
+    rmvpe.tile_frames = 500
+    audio = gliding_tone(12)
+    expected = whole_hidden(rmvpe, audio)
+    tiled = np.concatenate(list(rmvpe.tiled_hidden(audio)))
+    assert tiled.shape == expected.shape
+
+    step = rmvpe.tile_frames - rmvpe.tile_overlap
+    overlap = np.zeros(len(expected), dtype=bool)
+    for start in range(step, len(expected), step):
+        overlap[start : start + rmvpe.tile_overlap] = True
+    assert overlap.any()
+    diff = np.abs(tiled - expected).max(axis=1)
+    assert diff[overlap].max() < overlap_tolerance
+    assert diff[~overlap].max() < overlap_tolerance
+
+
+def test_tiled_f0_decodes_the_stitched_salience():
+    rmvpe = build_rmvpe()
+    rmvpe.tile_frames = 500
+    audio = gliding_tone(12)
+    hidden = np.concatenate(list(rmvpe.tiled_hidden(audio)))
+    np.testing.assert_array_equal(
+        rmvpe.infer_from_audio_tiled(audio), rmvpe.decode(hidden)
+    )